@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""Benchmark BOR to DIGGS conversion throughput, memory and startup time
+
+Synthetic BOR files of increasing size are generated from a template file of
+the test suite, then each one is converted in a fresh interpreter which reports
+its wall time, time to first byte and peak RSS. Results are written as JSON so
+that runs can be compared with ``--compare``.
+
+Example::
+
+  $ python benchmarks/bench_convert.py --sizes 1000 100000 -o bench.json
+  $ python benchmarks/bench_convert.py --sizes 1000 100000 --compare bench.json
+
+``--jobs 2 4`` adds variants formatting the data in parallel, the last column
+of the report is the speedup over the serial conversion.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_BOR_FILE = ROOT_DIR / "tests" / "data" / "50203170821133038D.bor"
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Columns of the synthetic files, XX is not a DIGGS property and is dropped
+COLUMN_SETS = {
+    "minimal": ["DEPTH", "AS"],
+    "standard": ["DEPTH", "AS", "EVP", "EVR", "TP", "IP", "TQ", "HP"],
+    "full": [
+        "DEPTH",
+        "AS",
+        "RV",
+        "EVR",
+        "TP",
+        "TPAF",
+        "TQ",
+        "TQAT",
+        "HP",
+        "SP",
+        "IP",
+        "IF",
+        "OF",
+        "RSP",
+        "GEAR",
+        "XX",
+    ],
+}
+
+UNITS = {
+    "DEPTH": "m",
+    "AS": "m/h",
+    "RV": "m/s2",
+    "TP": "bar",
+    "TPAF": "kN",
+    "TQ": "bar",
+    "TQAT": "kN.m",
+    "HP": "bar",
+    "SP": "bar",
+    "IP": "bar",
+    "IF": "l/min",
+    "OF": "l/min",
+    "RSP": "rpm",
+    "time": "s",
+}
+
+
+def make_bor_file(path, rows, columns, seed=0):
+    """Write a BOR file with ``rows`` rows of random drilling data."""
+    import borfile
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    time_index = pd.Index(
+        np.arange(rows, dtype=np.float32) * np.float32(0.2), name="time"
+    )
+    data = {}
+    for column in columns:
+        if column == "DEPTH":
+            values = np.cumsum(rng.uniform(0, 0.02, rows))
+        elif column in ("EVP", "EVR"):
+            values = (rng.random(rows) < 0.005).astype(np.int32)
+        elif column == "GEAR":
+            values = rng.integers(1, 4, rows).astype(np.float32)
+        else:
+            values = rng.uniform(0, 500, rows)
+        data[column] = values.astype(np.float32) if values.dtype.kind == "f" else values
+
+    bf = borfile.read(TEMPLATE_BOR_FILE)
+    metadata = bf.metadata
+    metadata.clear()
+    for column in [*columns, "time"]:
+        metadata[column] = {"label": column}
+        if column in UNITS:
+            metadata[column]["unit"] = UNITS[column]
+    bf.data = pd.DataFrame(data, index=time_index)
+    bf.save(path)
+
+
+class TimingSink:
+    """Text sink recording when the first byte is written."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.first_write = None
+        self.size = 0
+
+    def write(self, text):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        self.size += len(text)
+        return self.fp.write(text)
+
+
+def run_child(bor_path, options):
+    """Convert a file in this process and print the measures as JSON."""
+    import resource
+
+    start_import = time.perf_counter()
+    import bor2diggs
+
+    import_time = time.perf_counter() - start_import
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    jobs = options.pop("jobs", None)
+    with ExitStack() as stack, open(os.devnull, "w") as devnull:
+        sink = TimingSink(devnull)
+        start = time.perf_counter()
+        if jobs is not None:
+            # the pool is started as part of the conversion, like by the CLI
+            options["executor"] = stack.enter_context(ProcessPoolExecutor(jobs))
+        bor2diggs.write_diggs(bor_path, sink, **options)
+        elapsed = time.perf_counter() - start
+    # workers are not counted
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    rows = len(bor2diggs.read_record(bor_path, columns=["DEPTH"]))
+    json.dump(
+        {
+            "rows": rows,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed,
+            "time_to_first_byte": sink.first_write - start,
+            "output_bytes": sink.size,
+            "peak_rss": peak_rss,
+            "base_rss": base_rss,
+            "import_time": import_time,
+        },
+        sys.stdout,
+    )
+
+
+def measure_conversion(bor_path, options, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", str(bor_path)]
+            + ["--options", json.dumps(options)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output))
+    # keep the fastest run, memory does not vary between runs
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def measure_import_time(repeat):
+    code = (
+        "import time; start = time.perf_counter(); import bor2diggs; "
+        "print(time.perf_counter() - start)"
+    )
+    times = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code], check=True, capture_output=True, text=True
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def run_benchmarks(args):
+    import bor2diggs
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for column_set in args.columns:
+            for size in args.sizes:
+                bor_path = Path(tmp_dir) / f"{column_set}_{size}.bor"
+                make_bor_file(bor_path, size, COLUMN_SETS[column_set])
+                baseline = None
+                for name, options in args.variants:
+                    result = measure_conversion(bor_path, options, args.repeat)
+                    result.update(columns=column_set, variant=name)
+                    if baseline is None:
+                        baseline = result
+                    result["speedup"] = baseline["seconds"] / result["seconds"]
+                    results.append(result)
+                    print(format_result(result), file=sys.stderr)
+
+    return {
+        "bor2diggs": bor2diggs.__version__,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "import_time": measure_import_time(args.repeat),
+        "results": results,
+    }
+
+
+def format_result(result):
+    return (
+        f"{result['columns']:>8} {result['variant']:>8} {result['rows']:>10} rows"
+        f" {result['seconds']:8.3f} s {result['rows_per_second']:12.0f} rows/s"
+        f" ttfb {result['time_to_first_byte']:7.3f} s"
+        f" peak {result['peak_rss'] / 2**20:8.1f} MiB"
+        f" {result['speedup']:5.2f}x"
+    )
+
+
+def compare(report, previous):
+    def key(result):
+        return result["columns"], result["variant"], result["rows"]
+
+    previous_results = {key(result): result for result in previous["results"]}
+    print("columns  variant       rows    speed  peak rss", file=sys.stderr)
+    for result in report["results"]:
+        old = previous_results.get(key(result))
+        if old is None:
+            continue
+        print(
+            f"{result['columns']:>8} {result['variant']:>8} {result['rows']:>10}"
+            f" {result['rows_per_second'] / old['rows_per_second']:7.2f}x"
+            f" {result['peak_rss'] / old['peak_rss']:8.2f}x",
+            file=sys.stderr,
+        )
+    ratio = report["import_time"]["min"] / previous["import_time"]["min"]
+    print(f"import time {ratio:.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        choices=sorted(COLUMN_SETS),
+        default=["standard"],
+        help="column sets of the synthetic files",
+    )
+    parser.add_argument(
+        "--jobs",
+        nargs="+",
+        type=int,
+        default=[],
+        help="also convert with the data formatted by these numbers of processes",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--child", help="internal: convert a file and report")
+    parser.add_argument("--options", default="{}", help="internal: write_diggs options")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.options))
+        return
+
+    args.variants = [("default", {})]
+    args.variants += [(f"jobs={jobs}", {"jobs": jobs}) for jobs in args.jobs]
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,31 @@
 """Convert BOR files to DIGGS"""
 
-from .cli import main
+import importlib
+
+from .convert import convert_collection_to_diggs
 from .convert import convert_to_diggs
+from .convert import write_diggs
+from .convert import write_diggs_collection
+from .convert import write_diggs_record
+from .reader import iter_diggs_records
+from .reader import read_diggs
+from .record import BoreholeRecord
+from .record import read_record
 
 __version__ = "0.1.2"
+
+# Imported on first use, so that importing bor2diggs loads neither asyncio
+# nor the modules of the command line
+LAZY_ATTRIBUTES = {
+    "aconvert_many": "aio",
+    "aconvert_to_diggs": "aio",
+    "aiter_diggs": "aio",
+    "main": "cli",
+}
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{LAZY_ATTRIBUTES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,180 @@
+import asyncio
+import concurrent.futures
+import functools
+import threading
+
+from .convert import convert_to_diggs
+from .convert import write_diggs
+
+# Size of the chunks yielded by aiter_diggs, in characters
+CHUNK_SIZE = 1 << 16
+
+# Chunks produced ahead of the consumer before the conversion waits
+MAX_PENDING_CHUNKS = 8
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _ChunkSink:
+    """Text sink running in a worker thread and feeding an asyncio queue.
+
+    Writes are buffered into chunks of ``chunk_size``. When the queue is full
+    the worker waits for the consumer, and it stops as soon as ``cancel`` is
+    called.
+    """
+
+    def __init__(self, loop, queue, chunk_size):
+        self.loop = loop
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._size = 0
+        self._cancelled = threading.Event()
+
+    def write(self, text):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            chunk = "".join(self._buffer)
+            self._buffer = []
+            self._size = 0
+            self.put(chunk)
+
+    def put(self, item):
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if self._cancelled.is_set():
+                    future.cancel()
+                    raise _Cancelled() from None
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class _Failure:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+async def aiter_diggs(
+    file_path, sa_name="bor2diggs", executor=None, chunk_size=CHUNK_SIZE, **options
+):
+    """Convert a BOR file in ``executor`` and yield the DIGGS document by chunks.
+
+    With a thread pool (the loop default executor if ``executor`` is None),
+    chunks are yielded as they are produced and the conversion waits when the
+    consumer falls behind; closing the iterator or cancelling the task stops
+    the conversion. With a process pool the document is produced whole in a
+    worker process and then yielded by chunks. ``options`` are passed to
+    ``process_record``.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        document = await loop.run_in_executor(
+            executor,
+            functools.partial(convert_to_diggs, file_path, sa_name, **options),
+        )
+        for start in range(0, len(document), chunk_size):
+            yield document[start : start + chunk_size]
+        return
+
+    queue = asyncio.Queue(MAX_PENDING_CHUNKS)
+    sink = _ChunkSink(loop, queue, chunk_size)
+
+    def convert():
+        try:
+            try:
+                write_diggs(file_path, sink, sa_name=sa_name, **options)
+                sink.flush()
+            except Exception as exc:
+                sink.put(_Failure(exc))
+            else:
+                sink.put(None)
+        except _Cancelled:
+            pass
+
+    future = loop.run_in_executor(executor, convert)
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, _Failure):
+                raise chunk.exception
+            yield chunk
+        await future
+    finally:
+        sink.cancel()
+
+
+async def aconvert_to_diggs(file_path, sa_name="bor2diggs", executor=None, **options):
+    """Return the DIGGS document of a BOR file, converted in ``executor``."""
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(convert_to_diggs, file_path, sa_name, **options),
+        )
+    chunks = []
+    async for chunk in aiter_diggs(file_path, sa_name, executor, **options):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+async def aconvert_many(
+    file_paths,
+    sa_name="bor2diggs",
+    executor=None,
+    limit=4,
+    return_exceptions=False,
+    **options,
+):
+    """Convert many BOR files, yielding ``(file_path, document)`` as each finishes.
+
+    At most ``limit`` files are converted at once and the next ones are only
+    started when a result is consumed. A failed conversion raises its error
+    and cancels the others, unless ``return_exceptions`` is set, then the
+    exception is yielded in place of the document.
+    """
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    file_paths = iter(file_paths)
+    pending = {}
+    try:
+        while True:
+            for file_path in file_paths:
+                task = asyncio.ensure_future(
+                    aconvert_to_diggs(file_path, sa_name, executor, **options)
+                )
+                pending[task] = file_path
+                if len(pending) >= limit:
+                    break
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                file_path = pending.pop(task)
+                try:
+                    document = task.result()
+                except Exception as exc:
+                    if not return_exceptions:
+                        raise
+                    document = exc
+                yield file_path, document
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
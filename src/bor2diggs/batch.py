@@ -0,0 +1,286 @@
+import glob
+import os
+from collections import namedtuple
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+from .cache import hash_file
+from .catalog import get_entry
+from .convert import write_diggs
+from .index import get_index_path
+from .output import atomic_path
+from .output import COMPRESSIONS
+from .output import get_compression
+from .output import open_output
+from .profiling import Profiler
+from .sidecar import SIDECAR_FORMATS
+from .validate import DiggsValidator
+
+DIGGS_SUFFIX = ".diggs.xml"
+
+BatchResult = namedtuple(
+    "BatchResult",
+    ["source", "output", "error", "cached", "profile", "entry"],
+    defaults=[False, None, None],
+)
+
+
+def find_bor_files(inputs, manifest=None):
+    """Expand files, directories and glob patterns into a list of BOR files.
+
+    Directories are searched recursively. ``manifest`` is an optional iterable
+    of lines, each one being handled like an item of ``inputs``; blank lines
+    and lines starting with ``#`` are ignored.
+    """
+    patterns = list(inputs)
+    if manifest is not None:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                patterns.append(line)
+
+    files = {}
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths = sorted(glob.glob(pattern, recursive=True))
+        else:
+            paths = [pattern]
+        for path in map(Path, paths):
+            if path.is_dir():
+                for bor_path in sorted(path.rglob("*")):
+                    if bor_path.suffix.lower() == ".bor" and bor_path.is_file():
+                        files.setdefault(bor_path, None)
+            else:
+                files.setdefault(path, None)
+    return list(files)
+
+
+def get_common_root(bor_paths):
+    """Return the deepest directory containing all ``bor_paths``."""
+    directories = [os.path.abspath(Path(path).parent) for path in bor_paths]
+    return Path(os.path.commonpath(directories)) if directories else None
+
+
+def get_output_path(bor_path, output_dir=None, compression=None, root=None):
+    """Return the DIGGS path of ``bor_path``, next to it by default.
+
+    With ``output_dir``, the directories of ``bor_path`` below ``root`` are
+    recreated in it, so that files of the same name do not share an output.
+    """
+    bor_path = Path(bor_path)
+    output_name = bor_path.with_suffix(DIGGS_SUFFIX).name
+    if compression is not None:
+        output_name += COMPRESSIONS[compression]
+    if output_dir is None:
+        return bor_path.with_name(output_name)
+    return _get_output_dir(bor_path, output_dir, root) / output_name
+
+
+def get_sidecar_path(bor_path, output_dir=None, sidecar_format="npz", root=None):
+    bor_path = Path(bor_path)
+    sidecar_name = bor_path.with_suffix(SIDECAR_FORMATS[sidecar_format]).name
+    if output_dir is None:
+        return bor_path.with_name(sidecar_name)
+    return _get_output_dir(bor_path, output_dir, root) / sidecar_name
+
+
+def _get_output_dir(bor_path, output_dir, root):
+    if root is None:
+        return Path(output_dir)
+    relative = os.path.relpath(os.path.abspath(bor_path.parent), root)
+    return Path(output_dir) / relative
+
+
+def convert_file(
+    source,
+    output,
+    sa_name="bor2diggs",
+    compression_level=None,
+    profiler=None,
+    sidecar=None,
+    validate=False,
+    index=None,
+    **options,
+):
+    # Outputs are renamed into place once complete, and only if valid, the
+    # record written is returned
+    validator = DiggsValidator() if validate else None
+    with ExitStack() as stack:
+        tmp_output = stack.enter_context(atomic_path(output))
+        tmp_sidecar = None
+        if sidecar is not None:
+            tmp_sidecar = stack.enter_context(atomic_path(sidecar))
+        tmp_index = None
+        if index is not None:
+            tmp_index = stack.enter_context(atomic_path(index))
+        with open_output(
+            tmp_output, compression=get_compression(output), level=compression_level
+        ) as f:
+            record = write_diggs(
+                source,
+                f if validator is None else validator.wrap_output(f),
+                sa_name=sa_name,
+                profiler=profiler,
+                sidecar=tmp_sidecar,
+                index=tmp_index,
+                **options,
+            )
+        if validator is not None:
+            validator.check()
+    return record
+
+
+def _convert_task(
+    source,
+    output,
+    sa_name,
+    compression_level,
+    options,
+    profile,
+    sidecar,
+    validate,
+    catalog=False,
+    index=False,
+):
+    # Runs in a worker process, errors are sent back as text so that they can
+    # always be pickled, and so are the profile and the catalog entry, written
+    # by the parent process
+    profiler = Profiler() if profile else None
+    try:
+        record = convert_file(
+            source,
+            output,
+            sa_name=sa_name,
+            compression_level=compression_level,
+            profiler=profiler,
+            sidecar=sidecar,
+            validate=validate,
+            index=get_index_path(output) if index else None,
+            **options,
+        )
+        entry = None
+        if catalog:
+            entry = get_entry(record, source, output, hash_file(source))
+    except Exception as exc:
+        # The outputs of a previous conversion are left as they are
+        return BatchResult(source, output, f"{type(exc).__name__}: {exc}")
+    finally:
+        if profiler is not None:
+            profiler.close()
+    return BatchResult(
+        source,
+        output,
+        None,
+        profile=profiler.report() if profile else None,
+        entry=entry,
+    )
+
+
+def convert_many(
+    sources,
+    output_dir=None,
+    jobs=None,
+    sa_name="bor2diggs",
+    cache=None,
+    compression=None,
+    compression_level=None,
+    options=None,
+    profile=False,
+    sidecar_format=None,
+    validate=False,
+    catalog=False,
+    index=False,
+):
+    """Convert many BOR files, yielding a ``BatchResult`` as each one finishes.
+
+    Conversions are spread over ``jobs`` worker processes (all CPUs by
+    default), ``jobs=1`` converts the files in the current process. Files
+    whose output is current in ``cache`` (a ``ConversionCache``) are not
+    converted again, the cache is updated but not saved. With ``output_dir``,
+    the directories of the sources below their common root are recreated in
+    it, see ``get_output_path``. Outputs are compressed with ``compression``
+    (see ``open_output``) and ``options`` are passed to ``write_diggs``. With
+    ``profile``, each result has the report of a ``Profiler`` of its
+    conversion. With ``sidecar_format``, the channels are also written to a
+    columnar file next to each output. With ``validate``, outputs are checked
+    by a ``DiggsValidator`` as they are written and the invalid ones are
+    reported as errors. With ``catalog``, each converted file has its
+    ``bor2diggs.catalog.get_entry`` in its result, files skipped by the cache
+    have none. With ``index``, the rows of each output are indexed by depth
+    and time, see ``bor2diggs.index``, which requires uncompressed outputs.
+    """
+    if index and compression is not None:
+        raise ValueError("Compressed outputs cannot be indexed")
+    options = options or {}
+    key_options = options
+    if sidecar_format is not None:
+        key_options = dict(key_options, sidecar=sidecar_format)
+    if index:
+        key_options = dict(key_options, index=True)
+    sources = [Path(source) for source in sources]
+    root = get_common_root(sources) if output_dir is not None else None
+
+    tasks = []
+    keys = {}
+    targets = {}
+    for source in sources:
+        output = get_output_path(source, output_dir, compression, root)
+        sidecar = None
+        if sidecar_format is not None:
+            sidecar = get_sidecar_path(source, output_dir, sidecar_format, root)
+        # The same file given twice, under different paths
+        target = os.path.abspath(output)
+        if target in targets:
+            yield BatchResult(
+                source, output, f"Same output as {targets[target]}, skipped"
+            )
+            continue
+        targets[target] = source
+        if output_dir is not None:
+            os.makedirs(output.parent, exist_ok=True)
+        if cache is not None:
+            try:
+                keys[source] = key = cache.get_key(source, sa_name, key_options)
+            except OSError as exc:
+                yield BatchResult(source, output, f"{type(exc).__name__}: {exc}")
+                continue
+            if (
+                cache.is_current(source, output, key)
+                and (sidecar is None or sidecar.exists())
+                and (not index or os.path.exists(get_index_path(output)))
+            ):
+                yield BatchResult(source, output, None, cached=True)
+                continue
+        tasks.append(
+            (
+                source,
+                output,
+                sa_name,
+                compression_level,
+                options,
+                profile,
+                sidecar,
+                validate,
+                catalog,
+                index,
+            )
+        )
+
+    for result in _run_tasks(tasks, jobs):
+        if cache is not None and result.error is None:
+            cache.update(result.source, result.output, keys[result.source])
+        yield result
+
+
+def _run_tasks(tasks, jobs):
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _convert_task(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_convert_task, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Manifest of converted files, used to skip files whose output is current.
+
+    Entries are keyed by the BOR path and record a hash of the BOR content, the
+    application name written in the document, the conversion options, the
+    channels written as properties and the bor2diggs version. The manifest is
+    a JSON file loaded on creation and written by ``save``.
+    """
+
+    def __init__(self, path):
+        from . import __version__
+
+        self.path = Path(path)
+        self.version = __version__
+        self.hits = 0
+        self.misses = 0
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+        else:
+            self.entries = {}
+
+    def get_key(self, source, sa_name, options=None):
+        from .properties import get_properties
+
+        properties = get_properties((options or {}).get("properties"))
+        return {
+            "sha256": hash_file(source),
+            "sa_name": sa_name,
+            "version": self.version,
+            # as read back from the manifest, tuples become lists
+            "options": json.loads(json.dumps(options or {}, sort_keys=True)),
+            "properties": {
+                column: list(definition) for column, definition in properties.items()
+            },
+        }
+
+    def is_current(self, source, output, key):
+        entry = self.entries.get(str(source))
+        current = (
+            entry is not None
+            and entry["key"] == key
+            and entry["output"] == str(output)
+            and os.path.exists(output)
+        )
+        if current:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return current
+
+    def update(self, source, output, key):
+        self.entries[str(source)] = {"key": key, "output": str(output)}
+
+    def prune(self):
+        """Remove entries of deleted files or older versions, return their count."""
+        stale = [
+            source
+            for source, entry in self.entries.items()
+            if entry["key"]["version"] != self.version
+            or not os.path.exists(source)
+            or not os.path.exists(entry["output"])
+        ]
+        for source in stale:
+            del self.entries[source]
+        return len(stale)
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run cannot leave
+        # a truncated manifest behind
+        directory = self.path.parent
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
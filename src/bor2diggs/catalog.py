@@ -0,0 +1,257 @@
+import math
+import sqlite3
+from pathlib import Path
+
+from .units import to_meter
+
+# Mean radius of the Earth in metres
+EARTH_RADIUS = 6_371_008.8
+
+# Metres per degree of latitude, to size the bounding boxes of the R-tree
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+# Fields of a catalog entry, in the order of the columns of the table
+FIELDS = [
+    "source",
+    "sha256",
+    "output",
+    "filename",
+    "creation",
+    "project_ref",
+    "borehole_ref",
+    "operator",
+    "device_serial",
+    "latitude",
+    "longitude",
+    "altitude",
+    "first_depth",
+    "last_depth",
+    "depth_unit",
+    "drilling_method",
+    "machine_ref",
+    "tool",
+    "rows",
+    "channels",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS boreholes (
+    id INTEGER PRIMARY KEY,
+    {", ".join(FIELDS)},
+    UNIQUE (source)
+);
+CREATE INDEX IF NOT EXISTS boreholes_project ON boreholes (project_ref);
+CREATE INDEX IF NOT EXISTS boreholes_borehole ON boreholes (borehole_ref);
+CREATE INDEX IF NOT EXISTS boreholes_depth ON boreholes (last_depth);
+CREATE VIRTUAL TABLE IF NOT EXISTS boreholes_position USING rtree (
+    id, min_latitude, max_latitude, min_longitude, max_longitude
+);
+"""
+
+
+def get_entry(record, source, output=None, sha256=None):
+    """Return the catalog entry of a ``BoreholeRecord``, as a dict of ``FIELDS``.
+
+    Depths are converted to metres. A position of 0, 0 is the one of files
+    without GPS and is stored as missing.
+    """
+    latitude, longitude = float(record.latitude), float(record.longitude)
+    has_position = latitude != 0 or longitude != 0
+    depth = record.channels.get("DEPTH")
+    if depth is None or not len(depth):
+        first_depth = last_depth = None
+    else:
+        first_depth = to_meter(depth[0], record.depth_unit)
+        last_depth = to_meter(depth[-1], record.depth_unit)
+    return {
+        "source": str(Path(source).resolve()),
+        "sha256": sha256,
+        "output": None if output is None else str(Path(output).resolve()),
+        "filename": record.filename,
+        "creation": record.creation,
+        "project_ref": record.project_ref,
+        "borehole_ref": record.borehole_ref,
+        "operator": record.operator,
+        "device_serial": record.device_serial,
+        "latitude": latitude if has_position else None,
+        "longitude": longitude if has_position else None,
+        "altitude": float(record.altitude) if has_position else None,
+        "first_depth": first_depth,
+        "last_depth": last_depth,
+        "depth_unit": record.units.get("DEPTH"),
+        "drilling_method": record.drilling_method,
+        "machine_ref": record.machine_ref,
+        "tool": record.tool,
+        "rows": len(record),
+        "channels": " ".join(record.columns),
+    }
+
+
+def get_distance(latitude1, longitude1, latitude2, longitude2):
+    """Return the great-circle distance in metres between two positions."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def get_bounding_boxes(latitude, longitude, radius):
+    """Return the boxes containing the points within ``radius`` metres.
+
+    Boxes are ``(south, north, west, east)`` tuples, in degrees. A box
+    crossing the antimeridian is split in two, on each side of it.
+    """
+    dlat = radius / METERS_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+    south, north = latitude - dlat, latitude + dlat
+    west, east = longitude - dlon, longitude + dlon
+    if east - west >= 360:
+        return [(south, north, -180.0, 180.0)]
+    if west < -180:
+        return [(south, north, -180.0, east), (south, north, west + 360, 180.0)]
+    if east > 180:
+        return [(south, north, west, 180.0), (south, north, -180.0, east - 360)]
+    return [(south, north, west, east)]
+
+
+class Catalog:
+    """SQLite catalog of the converted boreholes.
+
+    Each BOR file has one row of ``FIELDS`` in the ``boreholes`` table, keyed
+    by its resolved path, and its position in the ``boreholes_position``
+    R-tree so that neighbours are found without scanning the table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Used by one thread at a time, but not always the one opening it
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function("distance", 4, _distance, deterministic=True)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def upsert(self, entry):
+        """Add or replace the entry of a file, see ``get_entry``."""
+        values = [entry[field] for field in FIELDS]
+        updates = ", ".join(f"{field} = excluded.{field}" for field in FIELDS[1:])
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO boreholes ({', '.join(FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(FIELDS))}) "
+                f"ON CONFLICT (source) DO UPDATE SET {updates}",
+                values,
+            )
+            row_id = self._get_id(entry["source"])
+            self.connection.execute(
+                "DELETE FROM boreholes_position WHERE id = ?", (row_id,)
+            )
+            if entry["latitude"] is not None:
+                self.connection.execute(
+                    "INSERT INTO boreholes_position VALUES (?, ?, ?, ?, ?)",
+                    (
+                        row_id,
+                        entry["latitude"],
+                        entry["latitude"],
+                        entry["longitude"],
+                        entry["longitude"],
+                    ),
+                )
+
+    def remove(self, source):
+        """Remove the entry of a file, return whether there was one."""
+        with self.connection:
+            row_id = self._get_id(str(Path(source).resolve()))
+            if row_id is None:
+                return False
+            for table in ("boreholes", "boreholes_position"):
+                self.connection.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        return True
+
+    def _get_id(self, source):
+        row = self.connection.execute(
+            "SELECT id FROM boreholes WHERE source = ?", (source,)
+        ).fetchone()
+        return None if row is None else row["id"]
+
+    def query(
+        self,
+        project_ref=None,
+        borehole_ref=None,
+        near=None,
+        radius=None,
+        min_depth=None,
+        max_depth=None,
+    ):
+        """Return the entries matching all the criteria given, as dicts.
+
+        ``near`` is a ``(latitude, longitude)`` position and ``radius`` a
+        distance in metres from it, entries are then sorted by distance and
+        have a ``distance`` field. ``min_depth`` and ``max_depth`` bound the
+        last depth in metres.
+        """
+        tables = "boreholes"
+        conditions = []
+        parameters = []
+        order = "project_ref, borehole_ref, filename"
+        columns = ", ".join(FIELDS)
+        if near is not None:
+            latitude, longitude = near
+            distance = "distance(latitude, longitude, ?, ?)"
+            columns += f", {distance} AS distance"
+            order = "distance"
+            if radius is not None:
+                # The R-tree selects bounding boxes, then the exact distance
+                boxes = get_bounding_boxes(latitude, longitude, radius)
+                box = (
+                    "SELECT id FROM boreholes_position "
+                    "WHERE min_latitude <= ? AND max_latitude >= ? "
+                    "AND min_longitude <= ? AND max_longitude >= ?"
+                )
+                conditions.append(f"id IN ({' UNION ALL '.join([box] * len(boxes))})")
+                for south, north, west, east in boxes:
+                    parameters += [north, south, east, west]
+                conditions.append(f"{distance} <= ?")
+                parameters += [latitude, longitude, radius]
+            else:
+                conditions.append("latitude IS NOT NULL")
+        for field, value in (
+            ("project_ref", project_ref),
+            ("borehole_ref", borehole_ref),
+        ):
+            if value is not None:
+                conditions.append(f"{field} = ?")
+                parameters.append(value)
+        if min_depth is not None:
+            conditions.append("last_depth >= ?")
+            parameters.append(min_depth)
+        if max_depth is not None:
+            conditions.append("last_depth <= ?")
+            parameters.append(max_depth)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        distance_parameters = list(near) if near is not None else []
+        rows = self.connection.execute(
+            f"SELECT {columns} FROM {tables}{where} ORDER BY {order}",
+            distance_parameters + parameters,
+        )
+        return [dict(row) for row in rows]
+
+
+def _distance(latitude1, longitude1, latitude2, longitude2):
+    if latitude1 is None or longitude1 is None:
+        return None
+    return get_distance(latitude1, longitude1, latitude2, longitude2)
@@ -1,20 +1,802 @@
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 import click
 
-from .convert import convert_to_diggs
+from .batch import convert_many
+from .batch import find_bor_files
+from .cache import ConversionCache
+from .cache import hash_file
+from .catalog import Catalog
+from .catalog import get_entry
+from .convert import write_diggs
+from .convert import write_diggs_collection
+from .index import get_index_path
+from .index import INDEX_SUFFIX
+from .output import COMPRESSIONS
+from .output import get_compression
+from .output import open_output
+from .process import rod_summary
+from .profiling import Profiler
+from .properties import PROPERTIES_ENV
+from .sidecar import SIDECAR_FORMATS
+from .validate import DiggsValidator
+from .validate import validate_diggs
+from .watch import STATE_FILENAME
+from .watch import Watcher
+
+
+class DefaultGroup(click.Group):
+    """Group that runs ``default_command`` when no subcommand is given.
+
+    This keeps ``bor2diggs FILE.bor -o FILE.diggs`` working next to the other
+    subcommands.
+    """
+
+    def __init__(self, *args, default_command=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not args or (
+            args[0] not in self.commands and args[0] not in ctx.help_option_names
+        ):
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+OUTPUT_HELP = "Output file, compressed if it ends with .gz, .xz or .zst (zstandard)."
+
+compression_level_option = click.option(
+    "--compression-level", type=int, help="Compression level of the output."
+)
+
+
+profile_option = click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    help="Write the time, rows and peak memory of each stage of the conversion "
+    "as JSON to this file (- for stderr).",
+)
+
+
+validate_option = click.option(
+    "--validate",
+    is_flag=True,
+    help="Check the output against the DIGGS schema and the consistency of "
+    "its data as it is written.",
+)
+
+
+catalog_option = click.option(
+    "--catalog",
+    "catalog_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Add the converted files to this SQLite catalog, see the query command.",
+)
+
+
+index_option = click.option(
+    "--index",
+    is_flag=True,
+    help=f"Write an index of the rows by depth and time next to the output "
+    f"(OUTPUT{INDEX_SUFFIX}), to read parts of it. Not for compressed outputs.",
+)
+
+
+properties_option = click.option(
+    "--properties",
+    "properties_path",
+    type=click.Path(exists=True, dir_okay=False),
+    envvar=PROPERTIES_ENV,
+    show_envvar=True,
+    help="JSON file of more channels to write, by BOR name: "
+    '{"CH": {"property_class": ..., "name": ..., "type_data": ...}}.',
+)
+
+
+encode_jobs_option = click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes formatting the data of large files.",
+)
+
+
+@contextmanager
+def encoding_executor(jobs):
+    if jobs == 1:
+        yield None
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            yield executor
+
+
+def make_validator(validate):
+    return DiggsValidator() if validate else None
+
+
+def wrap_output(fp, validator):
+    return fp if validator is None else validator.wrap_output(fp)
+
+
+def report_errors(name, errors):
+    for error in errors:
+        click.echo(f"INVALID {name}: {error}", err=True)
+
+
+def check_output(name, validator):
+    if validator is not None:
+        errors = validator.close()
+        report_errors(name, errors)
+        if errors:
+            sys.exit(1)
+
+
+def dump_profile(profiler, path):
+    if path == "-":
+        profiler.dump(click.get_text_stream("stderr"))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            profiler.dump(f)
 
 
-@click.command()
+def processing_options(command):
+    """Add the options of ``process_record`` to a command.
+
+    They are passed to the command as a single ``options`` dict, with the
+    ``properties`` of ``write_diggs``.
+    """
+
+    @functools.wraps(command)
+    def wrapper(
+        *args,
+        min_depth,
+        max_depth,
+        start_time,
+        end_time,
+        every,
+        depth_step,
+        per_rod,
+        units,
+        derived,
+        properties_path,
+        **kwargs,
+    ):
+        options = {}
+        if min_depth is not None or max_depth is not None:
+            options["depth_range"] = (min_depth, max_depth)
+        if start_time is not None or end_time is not None:
+            options["time_range"] = (start_time, end_time)
+        if every:
+            options["every"] = every
+        if depth_step:
+            options["depth_step"] = depth_step
+        if per_rod:
+            options["per_rod"] = per_rod
+        if units != "native":
+            options["units"] = units
+        if derived:
+            options["derived"] = derived
+        if properties_path:
+            # Loaded by each conversion, in the worker processes too
+            options["properties"] = os.path.abspath(properties_path)
+        return command(*args, options=options, **kwargs)
+
+    for option in reversed(
+        [
+            click.option("--min-depth", type=float, help="Drop the rows above."),
+            click.option("--max-depth", type=float, help="Drop the rows below."),
+            click.option(
+                "--start-time", type=float, help="Drop the rows before (seconds)."
+            ),
+            click.option(
+                "--end-time", type=float, help="Drop the rows after (seconds)."
+            ),
+            click.option(
+                "--every",
+                type=click.IntRange(min=1),
+                help="Keep one row out of EVERY.",
+            ),
+            click.option(
+                "--depth-step",
+                type=click.FloatRange(min=0, min_open=True),
+                help="Average the rows by depth intervals of DEPTH_STEP.",
+            ),
+            click.option(
+                "--per-rod", is_flag=True, help="Average the rows drilled by each rod."
+            ),
+            click.option(
+                "--units",
+                type=click.Choice(["native", "si"]),
+                default="native",
+                show_default=True,
+                help="Units of the channels, si converts them after the other "
+                "options, whose values are in the units of the file.",
+            ),
+            click.option(
+                "--derived",
+                is_flag=True,
+                help="Add the specific energy, penetration per revolution and "
+                "rod number channels.",
+            ),
+            properties_option,
+        ]
+    ):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+@click.group(cls=DefaultGroup, default_command="convert")
+def main():
+    """Convert BOR files to DIGGS."""
+
+
+@main.command()
 @click.argument("bor_input", type=click.File("rb"))
-@click.option("-o", "--output", type=click.Path(writable=True, dir_okay=False), required=False)
-def main(bor_input, output):
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(writable=True, dir_okay=False),
+    required=False,
+    help=OUTPUT_HELP,
+)
+@click.option(
+    "--sidecar",
+    type=click.Path(writable=True, dir_okay=False),
+    help="Also write the channels to this columnar file (.parquet or .npz).",
+)
+@compression_level_option
+@encode_jobs_option
+@profile_option
+@click.option(
+    "--rod-summary",
+    "rod_summary_path",
+    type=click.Path(writable=True, dir_okay=False, allow_dash=True),
+    help="Write statistics of the rows drilled with each rod to this CSV file "
+    "(- for stderr).",
+)
+@validate_option
+@catalog_option
+@index_option
+@processing_options
+def convert(
+    bor_input,
+    output,
+    sidecar,
+    compression_level,
+    jobs,
+    profile_path,
+    rod_summary_path,
+    validate,
+    catalog_path,
+    index,
+    options,
+):
     """Convert BOR file to a DIGGS."""
-    diggs_content = convert_to_diggs(bor_input)
-    if not output:
-        # sys.stdout.buffer
-        print(diggs_content)
+    if catalog_path and bor_input.name == "-":
+        raise click.UsageError("The standard input cannot be cataloged.")
+    if index and (not output or output == "-" or get_compression(output)):
+        raise click.UsageError("--index requires an uncompressed output file.")
+    profiler = Profiler() if profile_path else None
+    validator = make_validator(validate)
+    with encoding_executor(jobs) as executor:
+        if not output or output == "-":
+            record = write_diggs(
+                bor_input,
+                wrap_output(click.get_text_stream("stdout"), validator),
+                profiler=profiler,
+                sidecar=sidecar,
+                executor=executor,
+                **options,
+            )
+        else:
+            with open_output(output, level=compression_level) as f:
+                record = write_diggs(
+                    bor_input,
+                    wrap_output(f, validator),
+                    profiler=profiler,
+                    sidecar=sidecar,
+                    executor=executor,
+                    index=get_index_path(output) if index else None,
+                    **options,
+                )
+    if profiler is not None:
+        profiler.close()
+        dump_profile(profiler, profile_path)
+    check_output(output or "-", validator)
+    if rod_summary_path:
+        summary = rod_summary(record)
+        if rod_summary_path == "-":
+            summary.to_csv(click.get_text_stream("stderr"))
+        else:
+            summary.to_csv(rod_summary_path)
+    if catalog_path:
+        entry = get_entry(
+            record,
+            bor_input.name,
+            None if not output or output == "-" else output,
+            hash_file(bor_input.name),
+        )
+        with Catalog(catalog_path) as catalog:
+            catalog.upsert(entry)
+
+
+@main.command()
+@click.argument("inputs", nargs=-1)
+@click.option(
+    "-m",
+    "--manifest",
+    type=click.File("r"),
+    help="File listing the inputs, one per line.",
+)
+@click.option(
+    "-d",
+    "--output-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Write the DIGGS files in this directory instead of next to the inputs.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of worker processes [default: number of CPUs].",
+)
+@click.option(
+    "-c",
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Cache manifest used to skip the files already converted.",
+)
+@click.option(
+    "--prune",
+    is_flag=True,
+    help="Remove the entries of deleted files and older versions from the cache.",
+)
+@click.option(
+    "--compress",
+    "compression",
+    type=click.Choice(list(COMPRESSIONS)),
+    help="Compress the DIGGS files.",
+)
+@click.option(
+    "--sidecar",
+    "sidecar_format",
+    type=click.Choice(list(SIDECAR_FORMATS)),
+    help="Also write the channels of each file to a columnar file.",
+)
+@compression_level_option
+@profile_option
+@validate_option
+@catalog_option
+@index_option
+@processing_options
+def batch(
+    inputs,
+    manifest,
+    output_dir,
+    jobs,
+    cache_path,
+    prune,
+    compression,
+    sidecar_format,
+    compression_level,
+    profile_path,
+    validate,
+    catalog_path,
+    index,
+    options,
+):
+    """Convert many BOR files to DIGGS.
+
+    INPUTS can be BOR files, directories (searched recursively) or glob
+    patterns. The profile adds up the stages of all the converted files.
+    Invalid outputs are reported as failures and not kept, the outputs of a
+    previous conversion of a file that fails are left in place. Files skipped by
+    the cache are not added to the catalog again.
+    """
+    if index and compression is not None:
+        raise click.UsageError("Compressed outputs cannot be indexed.")
+    sources = find_bor_files(inputs, manifest)
+    if not sources:
+        raise click.UsageError("No BOR file found.")
+    cache = ConversionCache(cache_path) if cache_path else None
+    profiler = Profiler() if profile_path else None
+    catalog = Catalog(catalog_path) if catalog_path else None
+
+    failures = 0
+    for result in convert_many(
+        sources,
+        output_dir=output_dir,
+        jobs=jobs,
+        cache=cache,
+        compression=compression,
+        compression_level=compression_level,
+        options=options,
+        profile=profiler is not None,
+        sidecar_format=sidecar_format,
+        validate=validate,
+        catalog=catalog is not None,
+        index=index,
+    ):
+        if result.profile is not None:
+            profiler.merge(result.profile)
+        if result.entry is not None:
+            catalog.upsert(result.entry)
+        if result.cached:
+            click.echo(f"SKIPPED {result.source} -> {result.output}")
+        elif result.error is None:
+            click.echo(f"OK {result.source} -> {result.output}")
+        else:
+            failures += 1
+            click.echo(f"FAILED {result.source}: {result.error}", err=True)
+
+    if cache is not None:
+        if prune:
+            click.echo(f"{cache.prune()} stale cache entries removed", err=True)
+        cache.save()
+        click.echo(f"cache: {cache.hits} hits, {cache.misses} misses", err=True)
+    if catalog is not None:
+        catalog.close()
+
+    if profiler is not None:
+        dump_profile(profiler, profile_path)
+    click.echo(f"{len(sources) - failures} converted, {failures} failed", err=True)
+    if failures:
+        sys.exit(1)
+
+
+@main.command()
+@click.argument("inputs", nargs=-1)
+@click.option(
+    "-m",
+    "--manifest",
+    type=click.File("r"),
+    help="File listing the inputs, one per line.",
+)
+@click.option(
+    "-o", "--output", type=click.Path(writable=True, dir_okay=False), help=OUTPUT_HELP
+)
+@click.option(
+    "--sidecar-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Also write the channels of each file to a columnar file in this directory.",
+)
+@compression_level_option
+@encode_jobs_option
+@profile_option
+@validate_option
+@processing_options
+def merge(
+    inputs,
+    manifest,
+    output,
+    sidecar_dir,
+    compression_level,
+    jobs,
+    profile_path,
+    validate,
+    options,
+):
+    """Convert many BOR files to a single DIGGS.
+
+    INPUTS can be BOR files, directories (searched recursively) or glob
+    patterns.
+    """
+    sources = find_bor_files(inputs, manifest)
+    if not sources:
+        raise click.UsageError("No BOR file found.")
+    profiler = Profiler() if profile_path else None
+    validator = make_validator(validate)
+    if sidecar_dir is not None:
+        os.makedirs(sidecar_dir, exist_ok=True)
+    with encoding_executor(jobs) as executor:
+        if not output or output == "-":
+            write_diggs_collection(
+                sources,
+                wrap_output(click.get_text_stream("stdout"), validator),
+                profiler=profiler,
+                sidecar_dir=sidecar_dir,
+                executor=executor,
+                **options,
+            )
+        else:
+            with open_output(output, level=compression_level) as f:
+                write_diggs_collection(
+                    sources,
+                    wrap_output(f, validator),
+                    profiler=profiler,
+                    sidecar_dir=sidecar_dir,
+                    executor=executor,
+                    **options,
+                )
+    if profiler is not None:
+        profiler.close()
+        dump_profile(profiler, profile_path)
+    check_output(output or "-", validator)
+
+
+@main.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-d",
+    "--output-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Write the DIGGS files in this directory instead of next to the inputs.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes.",
+)
+@click.option(
+    "--state",
+    "state_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help=f"State file of the converted files [default: DIRECTORY/{STATE_FILENAME}].",
+)
+@click.option(
+    "--settle",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    show_default=True,
+    help="Seconds a file must be left unchanged before it is converted.",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.1),
+    default=5.0,
+    show_default=True,
+    help="Seconds between scans of the directory.",
+)
+@click.option(
+    "--compress",
+    "compression",
+    type=click.Choice(list(COMPRESSIONS)),
+    help="Compress the DIGGS files.",
+)
+@click.option(
+    "--sidecar",
+    "sidecar_format",
+    type=click.Choice(list(SIDECAR_FORMATS)),
+    help="Also write the channels of each file to a columnar file.",
+)
+@compression_level_option
+@validate_option
+@catalog_option
+@processing_options
+def watch(
+    directory,
+    output_dir,
+    jobs,
+    state_path,
+    settle,
+    interval,
+    compression,
+    sidecar_format,
+    compression_level,
+    validate,
+    catalog_path,
+    options,
+):
+    """Convert the BOR files written to DIRECTORY, until interrupted.
+
+    Files are converted once they are left unchanged for a while. Converted
+    files are recorded in a state file and not converted again after a
+    restart, unless they are modified.
+    """
+    catalog = Catalog(catalog_path) if catalog_path else None
+    watcher = Watcher(
+        directory,
+        output_dir=output_dir,
+        jobs=jobs,
+        state_path=state_path,
+        settle=settle,
+        interval=interval,
+        compression=compression,
+        compression_level=compression_level,
+        sidecar_format=sidecar_format,
+        options=options,
+        validate=validate,
+        catalog=catalog,
+    )
+    click.echo(f"Watching {directory}", err=True)
+    try:
+        for result in watcher.run():
+            if result.cached:
+                continue
+            if result.error is None:
+                click.echo(f"OK {result.source} -> {result.output}")
+            else:
+                click.echo(f"FAILED {result.source}: {result.error}", err=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if catalog is not None:
+            catalog.close()
+
+
+@main.command()
+@click.argument("diggs_input", type=click.File("rb"))
+@click.option(
+    "-d",
+    "--output-dir",
+    type=click.Path(file_okay=False, writable=True),
+    default=".",
+    help="Directory of the BOR files [default: current directory].",
+)
+@properties_option
+def extract(diggs_input, output_dir, properties_path):
+    """Extract the MWD measurements of a DIGGS file to BOR files."""
+    from .reader import iter_diggs_records
+
+    os.makedirs(output_dir, exist_ok=True)
+    for record in iter_diggs_records(diggs_input, properties=properties_path):
+        output = os.path.join(output_dir, f"{record.filename}.bor")
+        record.to_borfile().save(output)
+        click.echo(f"{record.filename}: {len(record)} rows -> {output}")
+
+
+@main.command()
+@click.argument("diggs_inputs", nargs=-1, required=True, type=click.File("rb"))
+def validate(diggs_inputs):
+    """Check DIGGS files as written by bor2diggs.
+
+    The files are checked against the subset of the DIGGS schema used by
+    bor2diggs and for the consistency of their data, reading them by blocks.
+    """
+    invalid = 0
+    for diggs_input in diggs_inputs:
+        errors = validate_diggs(diggs_input)
+        if errors:
+            invalid += 1
+            report_errors(diggs_input.name, errors)
+        else:
+            click.echo(f"OK {diggs_input.name}")
+    if invalid:
+        sys.exit(1)
+
+
+def parse_position(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        latitude, longitude = map(float, value.split(","))
+    except ValueError:
+        raise click.BadParameter("expected LATITUDE,LONGITUDE") from None
+    return latitude, longitude
+
+
+@main.command()
+@click.argument("catalog_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--project", help="Project reference.")
+@click.option("--borehole", help="Borehole reference.")
+@click.option(
+    "--near",
+    metavar="LAT,LON",
+    callback=parse_position,
+    help="Sort the boreholes by distance to this position, in degrees.",
+)
+@click.option(
+    "--radius",
+    type=click.FloatRange(min=0),
+    help="Only the boreholes within this distance of --near, in metres.",
+)
+@click.option(
+    "--deeper-than",
+    type=float,
+    help="Only the boreholes drilled to at least this depth, in metres.",
+)
+@click.option(
+    "--shallower-than",
+    type=float,
+    help="Only the boreholes drilled to at most this depth, in metres.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "json", "paths"]),
+    default="table",
+    show_default=True,
+    help="Output format, paths lists the DIGGS files.",
+)
+def query(
+    catalog_path,
+    project,
+    borehole,
+    near,
+    radius,
+    deeper_than,
+    shallower_than,
+    output_format,
+):
+    """Search the boreholes of a catalog written with --catalog."""
+    if radius is not None and near is None:
+        raise click.UsageError("--radius requires --near.")
+    with Catalog(catalog_path) as catalog:
+        entries = catalog.query(
+            project_ref=project,
+            borehole_ref=borehole,
+            near=near,
+            radius=radius,
+            min_depth=deeper_than,
+            max_depth=shallower_than,
+        )
+
+    if output_format == "json":
+        click.echo(json.dumps(entries, indent=2))
+    elif output_format == "paths":
+        for entry in entries:
+            click.echo(entry["output"] or entry["source"])
     else:
-        with click.open_file(output, "w") as f:
-            f.write(diggs_content)
+        for entry in entries:
+            depth = entry["last_depth"]
+            fields = [
+                entry["project_ref"],
+                entry["borehole_ref"],
+                entry["filename"],
+                "-" if depth is None else f"{depth:.2f} m",
+            ]
+            if near is not None:
+                fields.append(f"{entry['distance']:.0f} m away")
+            click.echo("\t".join(fields))
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address.")
+@click.option("--port", type=int, default=8000, show_default=True, help="Port.")
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    help="Listen on this Unix socket instead of a TCP port.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of worker processes [default: number of CPUs].",
+)
+@click.option(
+    "--max-queue",
+    type=click.IntRange(min=0),
+    default=16,
+    show_default=True,
+    help="Requests waiting for a worker before new ones are rejected.",
+)
+@compression_level_option
+def serve(host, port, socket_path, jobs, max_queue, compression_level):
+    """Run a conversion service.
+
+    BOR files posted to /convert are returned as DIGGS, compressed with
+    ?compression=gzip, xz or zstd. GET /stats returns the request counters.
+    """
+    from .server import ConversionService
+    from .server import make_server
+
+    service = ConversionService(jobs, max_queue, compression_level)
+    service.warm_up()
+    server = make_server(service, host, port, socket_path)
+    address = socket_path or f"http://{host}:{server.server_port}"
+    click.echo(f"Serving on {address} with {service.jobs} workers", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
 
 
 if __name__ == "__main__":
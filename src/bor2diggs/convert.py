@@ -1,10 +1,25 @@
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import io
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
 
 import borfile
-import pint
-
-ureg = pint.UnitRegistry()
+import numpy as np
+
+from .encode import get_formatter
+from .encode import iter_data_values
+from .encode import iter_time_intervals
+from .process import process_record
+from .profiling import NULL_PROFILER
+from .properties import get_properties
+from .record import read_description
+from .record import read_record
+from .units import get_unit_registry
+from .units import to_meter
+from .writer import Template
+from .writer import XMLWriter
 
 # Register necessary namespaces
 namespaces = {
@@ -20,28 +35,267 @@ namespaces = {
     "diggs": "http://diggsml.org/schemas/2.6",
 }
 
+# Characters not allowed in a gml:id, an NCName
+INVALID_ID_CHARACTERS = re.compile(r"[^\w.-]")
+
+# Separator between lines of the timeIntervalList and dataValues payloads
+DATA_SEPARATOR = "\n                "
+
+ColumnPlan = namedtuple("ColumnPlan", ["columns", "properties", "formatters"])
+
+
+def __getattr__(name):
+    # The unit registry used to be built at import time as ``ureg``
+    if name == "ureg":
+        return get_unit_registry()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# BOR units whose DIGGS unit of measure is spelled differently
+UOM_CODES = {"inch": "in", "gallon/min": "gal[US]/min"}
+
 
 def get_uom(unit):
-    codes = {"inch": "in", "gallon/min": "gal[US]/min"}
-    return codes.get(unit, unit)
-
-
-def convert_to_diggs(file_path, sa_name="bor2diggs"):
-    bf = borfile.read(file_path)
-    borehole_ref = bf.description["borehole_ref"]
-    project_ref = bf.description["project_ref"].replace(" ", "_")
-    borehole_ref_id = borehole_ref.replace(" ", "_")
-    project_ref_id = project_ref.replace(" ", "_")
-    depth_in_meter = (
-        ureg(f"{bf.data.DEPTH.iat[-1]} {bf.metadata['DEPTH']['unit']}")
-        .to("meter")
-        .magnitude
+    return UOM_CODES.get(unit, unit)
+
+
+def convert_to_diggs(file_path, sa_name="bor2diggs", **options):
+    output = io.StringIO()
+    write_diggs(file_path, output, sa_name=sa_name, **options)
+    return output.getvalue()
+
+
+def write_diggs(
+    file_path,
+    fp,
+    sa_name="bor2diggs",
+    profiler=None,
+    sidecar=None,
+    sidecar_format=None,
+    executor=None,
+    index=None,
+    properties=None,
+    **options,
+):
+    """Convert a BOR file and write the DIGGS document to the text sink ``fp``.
+
+    The document is produced incrementally, nothing but the BOR data itself is
+    kept in memory. ``options`` are passed to ``process_record`` to crop or
+    decimate the data. The stages of the conversion are measured by
+    ``profiler``, a ``bor2diggs.profiling.Profiler``, if given. The channels
+    are also written to the columnar file ``sidecar`` if given, see
+    ``bor2diggs.sidecar.write_sidecar``. The data of large files is formatted
+    in parallel by the workers of ``executor``, a process pool, if given.
+    The byte offsets of the rows are written to the JSON file ``index`` if
+    given, see ``bor2diggs.index``, ``fp`` must then be an uncompressed file.
+    The channels written are the ones of ``properties``, see
+    ``bor2diggs.properties.get_properties``. Return the ``BoreholeRecord``
+    written.
+    """
+    if profiler is None:
+        profiler = NULL_PROFILER
+    properties = get_properties(properties)
+    record = _read_record(file_path, profiler, options, properties)
+    indexer = None
+    if index is not None:
+        from .index import DepthIndexer
+
+        indexer = DepthIndexer()
+    write_diggs_record(
+        record,
+        fp,
+        sa_name=sa_name,
+        profiler=profiler,
+        executor=executor,
+        indexer=indexer,
+        properties=properties,
     )
+    if indexer is not None:
+        indexer.write(index)
+    if sidecar is not None:
+        _write_sidecar(record, sidecar, sidecar_format, "", profiler, properties)
+    return record
+
+
+def write_diggs_record(
+    record,
+    fp,
+    sa_name="bor2diggs",
+    profiler=None,
+    executor=None,
+    indexer=None,
+    properties=None,
+):
+    """Write the DIGGS document of a ``BoreholeRecord`` to the text sink ``fp``.
+
+    ``indexer`` is a ``bor2diggs.index.DepthIndexer`` recording the offsets of
+    the rows, if given. ``properties`` is used as in ``write_diggs``.
+    """
+    if profiler is None:
+        profiler = NULL_PROFILER
+    properties = get_properties(properties)
+    project_ref, project_ref_id = _get_project_ref(record.project_ref)
+
+    if indexer is not None:
+        fp = indexer.wrap_output(fp)
+    writer = XMLWriter(profiler.wrap_output(fp))
+    with profiler.stage("structure"):
+        _write_root_start(writer, sa_name)
+        _write_document_information(
+            writer,
+            f"di_{record.filename}.xml",
+            f"Data exported from {record.filename}.bor",
+            record.creation,
+            sa_name,
+        )
+        _write_project(writer, project_ref, project_ref_id)
+        _write_borehole(writer, record, set())
+        _write_measurement(
+            writer,
+            record,
+            profiler=profiler,
+            executor=executor,
+            indexer=indexer,
+            properties=properties,
+        )
+        writer.end()
+
+
+def convert_collection_to_diggs(file_paths, sa_name="bor2diggs", **options):
+    output = io.StringIO()
+    write_diggs_collection(file_paths, output, sa_name=sa_name, **options)
+    return output.getvalue()
+
+
+def write_diggs_collection(
+    file_paths,
+    fp,
+    sa_name="bor2diggs",
+    profiler=None,
+    sidecar_dir=None,
+    sidecar_format=None,
+    executor=None,
+    properties=None,
+    **options,
+):
+    """Convert many BOR files into a single DIGGS document written to ``fp``.
+
+    Projects, boreholes, business associates and drill rigs shared by several
+    files are written once and referenced by their ``gml:id`` afterwards.
+    Files are read one at a time: a first pass collects the projects from the
+    descriptions alone, then each borehole is written and its measurement spooled to
+    a temporary file, as DIGGS expects all measurements after the sampling
+    features. The channels of each file are written to a sidecar file named
+    after it in ``sidecar_dir`` if given. ``executor`` and ``properties`` are
+    used as in ``write_diggs``.
+    """
+    if profiler is None:
+        profiler = NULL_PROFILER
+    properties = get_properties(properties)
+    file_paths = list(file_paths)
+    projects = {}
+    creation_dates = []
+    for file_path in file_paths:
+        with profiler.stage("scan"):
+            description = read_description(file_path)
+        project_ref, project_ref_id = _get_project_ref(description["project_ref"])
+        projects.setdefault(project_ref_id, project_ref)
+        creation_dates.append(description["creation"])
+
+    writer = XMLWriter(profiler.wrap_output(fp))
+    with profiler.stage("structure"):
+        _write_root_start(writer, sa_name)
+        _write_document_information(
+            writer,
+            f"di_{make_id(sa_name)}.xml",
+            f"Data exported from {len(file_paths)} BOR files",
+            max(creation_dates, default=None),
+            sa_name,
+        )
+        for project_ref_id, project_ref in projects.items():
+            _write_project(writer, project_ref, project_ref_id)
+
+    written_ids = set()
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        spool_writer = XMLWriter(profiler.wrap_output(spool), level=1)
+        for file_path in file_paths:
+            record = _read_record(file_path, profiler, options, properties)
+            with profiler.stage("structure"):
+                _write_borehole(writer, record, written_ids)
+                _write_measurement(
+                    spool_writer,
+                    record,
+                    id_suffix=f"_{record.filename}",
+                    profiler=profiler,
+                    executor=executor,
+                    properties=properties,
+                )
+            if sidecar_dir is not None:
+                _write_sidecar(
+                    record,
+                    sidecar_dir,
+                    sidecar_format,
+                    f"_{record.filename}",
+                    profiler,
+                    properties,
+                )
+        with profiler.stage("write"):
+            spool.seek(0)
+            shutil.copyfileobj(spool, fp)
+    with profiler.stage("structure"):
+        writer.end()
+
+
+def _read_record(file_path, profiler, options, properties):
+    with profiler.stage("read") as stage:
+        # Channels not written are never copied out of the file
+        record = read_record(file_path, columns=properties)
+        stage.rows = len(record)
+    with profiler.stage("process") as stage:
+        record = process_record(record, **options)
+        stage.rows = len(record)
+    return record
+
+
+def _write_sidecar(record, target, sidecar_format, id_suffix, profiler, properties):
+    from .sidecar import get_sidecar_format
+    from .sidecar import SIDECAR_FORMATS
+    from .sidecar import write_sidecar
+
+    if id_suffix:
+        # target is the directory of the sidecar files of a collection
+        if sidecar_format is None:
+            sidecar_format = get_sidecar_format()
+        target = os.path.join(
+            target, f"{record.filename}{SIDECAR_FORMATS[sidecar_format]}"
+        )
+    with profiler.stage("sidecar", rows=len(record)):
+        write_sidecar(record, target, sidecar_format, id_suffix, properties)
 
-    for prefix, uri in namespaces.items():
-        ET.register_namespace(prefix, uri)
 
-    root = ET.Element(
+def _get_project_ref(project_ref):
+    project_ref = project_ref.replace(" ", "_")
+    return project_ref, make_id(project_ref)
+
+
+def make_id(text):
+    """Replace the characters not allowed in a ``gml:id`` by ``_``."""
+    return INVALID_ID_CHARACTERS.sub("_", text)
+
+
+# Static parts of the document, compiled once and filled for each file
+
+SRS_NAME = (
+    "https://www.opengis.net/def/crs-compound?"
+    "1=http://www.opengis.net/def/crs/EPSG/0/4326&"
+    "2=http://www.opengis.net/def/crs/EPSG/0/5714"
+)
+
+
+@Template
+def _root_start_template(writer, values):
+    writer.declaration()
+    writer.start(
         "Diggs",
         {
             "xmlns": "http://diggsml.org/schemas/2.6",
@@ -55,325 +309,414 @@ def convert_to_diggs(file_path, sa_name="bor2diggs"):
             "xmlns:xlink": "http://www.w3.org/1999/xlink",
             "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
             "xsi:schemaLocation": "http://diggsml.org/schemas/2.6 https://diggsml.org/schema-dev/Diggs.xsd",
-            "gml:id": f"{sa_name}",
+            "gml:id": values["sa_id"],
         },
     )
 
-    # Add document information
-    doc_info_element = ET.SubElement(
-        ET.SubElement(root, "documentInformation"),
-        "DocumentInformation",
-        {"gml:id": f"di_{bf.description['filename']}.xml"},
-    )
-    ET.SubElement(
-        doc_info_element,
-        "gml:description",
-    ).text = f"Data exported from {bf.description['filename']}.bor"
-    ET.SubElement(doc_info_element, "creationDate").text = bf.description["creation"]
-
-    # Add source software information
-    sa_name = f"{sa_name}"
-    sa_version = "beta"
-    software_application_element = ET.SubElement(
-        ET.SubElement(doc_info_element, "sourceSoftware"),
-        "SoftwareApplication",
-        {"gml:id": f"sa_{sa_name}-{sa_version}"},
-    )
-    ET.SubElement(software_application_element, "gml:name").text = sa_name
-    ET.SubElement(software_application_element, "version").text = sa_version
 
+@Template
+def _document_information_template(writer, values):
+    # Add document information
+    with writer.container("documentInformation"):
+        with writer.container("DocumentInformation", {"gml:id": values["di_id"]}):
+            writer.element("gml:description", text=values["description"])
+            writer.element("creationDate", text=values["creation_date"])
+
+            # Add source software information
+            with writer.container("sourceSoftware"):
+                with writer.container(
+                    "SoftwareApplication",
+                    {"gml:id": f"sa_{values['sa_id']}-{values['sa_version']}"},
+                ):
+                    writer.element("gml:name", text=values["sa_name"])
+                    writer.element("version", text=values["sa_version"])
+
+
+@Template
+def _project_template(writer, values):
     # Add project information
-    project_element = ET.SubElement(
-        ET.SubElement(root, "project"),
-        "Project",
-        {"gml:id": f"pr_{project_ref_id}"},
-    )
-    ET.SubElement(project_element, "gml:name").text = project_ref
+    with writer.container("project"):
+        with writer.container("Project", {"gml:id": f"pr_{values['project_ref_id']}"}):
+            writer.element("gml:name", text=values["project_ref"])
 
-    # # Add sampling feature (borehole)
-    borehole = ET.SubElement(
-        ET.SubElement(root, "samplingFeature"),
-        "Borehole",
-        {"gml:id": f"bh_{borehole_ref_id}"},
-    )
-    ET.SubElement(borehole, "gml:name").text = borehole_ref
 
-    # add role
-    if "operator" in bf.description:
-        role = ET.SubElement(ET.SubElement(borehole, "role"), "Role")
-        ET.SubElement(
-            role,
-            "rolePerformed",
-            {"codeSpace": "https://diggsml.org/def/codes/DIGGS/0.1/roles.xml"},
-        ).text = "operator"
-
-        ET.SubElement(
-            ET.SubElement(
-                ET.SubElement(role, "businessAssociate"),
-                "BusinessAssociate",
-                {"gml:id": f"ba_{bf.description['device']['serial']}"},
-            ),
-            "gml:name",
-        ).text = bf.description["operator"]
-
-    ET.SubElement(borehole, "investigationTarget").text = "Natural Ground"
-    ET.SubElement(borehole, "projectRef", {"xlink:href": f"#pr_{project_ref_id}"})
-
-    bf_position = bf.description.get(
-        "position",
-        {
-            "longitude": {"@unit": "degree", "value": "0"},
-            "latitude": {"@unit": "degree", "value": "0"},
-            "altitude": {"@unit": "m", "value": "0"},
-        },
-    )
+@Template
+def _borehole_start_template(writer, values):
+    # # Add sampling feature (borehole)
+    writer.start("samplingFeature")
+    writer.start("Borehole", {"gml:id": f"bh_{values['borehole_ref_id']}"})
+    writer.element("gml:name", text=values["borehole_ref"])
 
-    latitude = bf_position["latitude"]["value"]
-    longitude = bf_position["longitude"]["value"]
-    altitude = bf_position["altitude"]["value"]
 
-    # Format coordinates to 6 decimal places
-    coord_string = f"{latitude} {longitude} {altitude}"
-    pos_altitude_float = float(bf_position["altitude"]["value"]) - depth_in_meter
-    pos_altitude = f"{pos_altitude_float:.6f}"
-    pos_string = f"{coord_string} {latitude} {longitude} {pos_altitude}"
+@Template
+def _borehole_location_template(writer, values):
+    borehole_ref_id = values["borehole_ref_id"]
+    writer.element("investigationTarget", text="Natural Ground")
+    writer.element("projectRef", {"xlink:href": f"#pr_{values['project_ref_id']}"})
 
     # add reference point
-    ET.SubElement(
-        ET.SubElement(
-            ET.SubElement(borehole, "referencePoint"),
+    with writer.container("referencePoint"):
+        with writer.container(
             "PointLocation",
             {
                 "gml:id": f"pl_bh_{borehole_ref_id}",
-                "srsName": "https://www.opengis.net/def/crs-compound?1=http://www.opengis.net/def/crs/EPSG/0/4326&2=http://www.opengis.net/def/crs/EPSG/0/5714",
+                "srsName": SRS_NAME,
                 "srsDimension": "3",
                 "uomLabels": "deg deg m",
                 "axisLabels": "latitude longitude height",
             },
-        ),
-        "gml:pos",
-    ).text = coord_string
+        ):
+            writer.element("gml:pos", text=values["coord_string"])
 
     # add center line
-    ET.SubElement(
-        ET.SubElement(
-            ET.SubElement(borehole, "centerLine"),
+    with writer.container("centerLine"):
+        with writer.container(
             "LinearExtent",
             {
                 "gml:id": f"cl_bh_{borehole_ref_id}",
                 "srsDimension": "3",
                 "uomLabels": "deg deg m",
-                "srsName": "https://www.opengis.net/def/crs-compound?1=http://www.opengis.net/def/crs/EPSG/0/4326&2=http://www.opengis.net/def/crs/EPSG/0/5714",
+                "srsName": SRS_NAME,
                 "axisLabels": "latitude longitude height",
             },
-        ),
-        "gml:posList",
-    ).text = pos_string
+        ):
+            writer.element("gml:posList", text=values["pos_string"])
 
     # add linear referencing
-    lsrs = ET.SubElement(
-        ET.SubElement(borehole, "linearReferencing"),
-        "LinearSpatialReferenceSystem",
-        {"gml:id": f"lr_bh_{borehole_ref_id}"},
-    )
-
-    ET.SubElement(
-        lsrs, "gml:identifier", {"codeSpace": "urn:x-def:authority:DIGGS"}
-    ).text = f"urn:x-diggs:def:fi:DIGGSINC:lr_bh_{borehole_ref_id}"
-
-    ET.SubElement(
-        lsrs,
-        "glr:linearElement",
-        {"xlink:href": f"#cl_bh_{borehole_ref_id}"},
-    )
-
-    lrm_method = ET.SubElement(
-        ET.SubElement(lsrs, "glr:lrm"),
-        "glr:LinearReferencingMethod",
-        {"gml:id": f"lrm_bh_{borehole_ref_id}"},
-    )
-    ET.SubElement(lrm_method, "glr:name").text = "chainage"
-    ET.SubElement(lrm_method, "glr:type").text = "absolute"
-    ET.SubElement(lrm_method, "glr:units").text = bf.metadata["DEPTH"]["unit"]
+    with writer.container("linearReferencing"):
+        with writer.container(
+            "LinearSpatialReferenceSystem",
+            {"gml:id": f"lr_bh_{borehole_ref_id}"},
+        ):
+            writer.element(
+                "gml:identifier",
+                {"codeSpace": "urn:x-def:authority:DIGGS"},
+                f"urn:x-diggs:def:fi:DIGGSINC:lr_bh_{borehole_ref_id}",
+            )
+            writer.element(
+                "glr:linearElement",
+                {"xlink:href": f"#cl_bh_{borehole_ref_id}"},
+            )
+            with writer.container("glr:lrm"):
+                with writer.container(
+                    "glr:LinearReferencingMethod",
+                    {"gml:id": f"lrm_bh_{borehole_ref_id}"},
+                ):
+                    writer.element("glr:name", text="chainage")
+                    writer.element("glr:type", text="absolute")
+                    writer.element("glr:units", text=values["depth_unit"])
 
     # add totalMeasuredDepth
-    ET.SubElement(
-        borehole,
+    writer.element(
         "totalMeasuredDepth",
-        {"uom": "ft"},
-    ).text = f"{bf.data.DEPTH.iat[-1]:g}"
+        {"uom": values["depth_uom"]},
+        values["total_depth"],
+    )
 
     # add construction method
-    construction_method = ET.SubElement(borehole, "constructionMethod")
-    method_element = ET.SubElement(
-        construction_method,
+    writer.start("constructionMethod")
+    writer.start(
         "BoreholeConstructionMethod",
         {"gml:id": f"cm_bh_{borehole_ref_id}"},
     )
-    ET.SubElement(method_element, "gml:name").text = borfile.codes.DRILLING_METHOD[
-        bf.description["drilling"]["method"]
-    ]
+    writer.element("gml:name", text=values["drilling_method"])
 
     # Add location element
-    location = ET.SubElement(method_element, "location")
-    linear_extent = ET.SubElement(
-        location,
-        "LinearExtent",
-        {"gml:id": f"le_cm_bh_{borehole_ref_id}"},
-    )
+    with writer.container("location"):
+        with writer.container(
+            "LinearExtent",
+            {"gml:id": f"le_cm_bh_{borehole_ref_id}"},
+        ):
+            writer.element(
+                "gml:posList",
+                {"srsName": f"#lr_bh_{borehole_ref_id}", "srsDimension": "1"},
+                values["depth_range"],
+            )
 
-    ET.SubElement(
-        linear_extent,
-        "gml:posList",
-        {"srsName": f"#lr_bh_{borehole_ref_id}", "srsDimension": "1"},
-    ).text = f"{bf.data.DEPTH.iat[0]:g} {bf.data.DEPTH.iat[-1]:g}"
 
-    # Add DrillRig
-    if bf.description["drilling"].get("machine_ref"):
-        ET.SubElement(
-            ET.SubElement(
-                ET.SubElement(method_element, "constructionEquipment"),
-                "DrillRig",
-                {"gml:id": f"dr_{bf.description['drilling']['machine_ref']}"},
-            ),
-            "gml:name",
-        ).text = bf.description["drilling"]["machine_ref"]
-
-    # Add CuttingTool
-    if bf.description["drilling"].get("tool"):
-        cuttingtool_el = ET.SubElement(
-            ET.SubElement(method_element, "cuttingToolInfo"), "CuttingTool"
-        )
-        ET.SubElement(
-            cuttingtool_el,
-            "gml:name",
-        ).text = borfile.codes.DRILLING_TOOL[bf.description["drilling"]["tool"]]
-        if bf.description["drilling"].get("tool_diameter"):
-            ET.SubElement(
-                cuttingtool_el,
-                "toolOuterDiameter",
-                {"uom": get_uom(bf.description["drilling"]["tool_diameter"]["@unit"])},
-            ).text = bf.description["drilling"]["tool_diameter"]["value"]
+@Template
+def _measurement_start_template(writer, values):
+    filename = values["filename"]
 
     # add measurement
-    measurement = ET.SubElement(root, "measurement")
-    mwd = ET.SubElement(
-        measurement,
+    writer.start("measurement")
+    writer.start(
         "MeasurementWhileDrilling",
-        {"gml:id": f"mwd_{bf.description['filename']}"},
+        {"gml:id": f"mwd_{filename}"},
     )
-    ET.SubElement(mwd, "gml:name").text = f"MWD_{bf.description['filename']}"
-    ET.SubElement(mwd, "investigationTarget").text = "Natural Ground"
-    ET.SubElement(mwd, "projectRef", {"xlink:href": f"#pr_{project_ref_id}"})
-    ET.SubElement(
-        mwd,
+    writer.element("gml:name", text=f"MWD_{filename}")
+    writer.element("investigationTarget", text="Natural Ground")
+    writer.element("projectRef", {"xlink:href": f"#pr_{values['project_ref_id']}"})
+    writer.element(
         "samplingFeatureRef",
-        {"xlink:href": f"#bh_{borehole_ref_id}"},
+        {"xlink:href": f"#bh_{values['borehole_ref_id']}"},
     )
 
     # add mwd result
-    outcome = ET.SubElement(mwd, "outcome")
-    result = ET.SubElement(
-        outcome, "MWDResult", {"gml:id": f"mwdr_{bf.description['filename']}"}
-    )
+    writer.start("outcome")
+    writer.start("MWDResult", {"gml:id": f"mwdr_{filename}"})
 
     # add time domain
-    time_domain = ET.SubElement(result, "timeDomain")
-    time_position_list = ET.SubElement(
-        time_domain,
+    writer.start("timeDomain")
+    writer.start(
         "TimeIntervalList",
-        {"gml:id": f"tpl_{bf.description['filename']}", "unit": "second"},
+        {"gml:id": f"tpl_{filename}", "unit": "second"},
     )
-    positions = ET.SubElement(time_position_list, "timeIntervalList")
-    # Join all timestamps with a space and wrap every 5 timestamps
-    timestamps = list(f"{t:g}" for t in bf.data.index.array)
-    wrapped_timestamps = [
-        " ".join(timestamps[i : i + 12]) for i in range(0, len(timestamps), 12)
-    ] + [""]
-    positions.text = "\n                ".join(wrapped_timestamps)
 
+
+@Template
+def _parameters_start_template(writer, values):
     # add result set
-    results = ET.SubElement(result, "results")
-    result_set = ET.SubElement(results, "ResultSet")
+    writer.start("results")
+    writer.start("ResultSet")
+    writer.start("parameters")
+    writer.start("PropertyParameters", {"gml:id": f"params1{values['id_suffix']}"})
+    writer.start("properties")
+
+
+@Template
+def _property_start_template(writer, values):
+    index = values["index"]
+    writer.start(
+        "Property",
+        {"gml:id": f"prop{index}{values['id_suffix']}", "index": index},
+    )
+    writer.element("propertyName", text=values["property_name"])
+    writer.element("typeData", text=values["type_data"])
+    writer.element(
+        "propertyClass",
+        {"codeSpace": values["code_space"]},
+        values["property_class"],
+    )
+
+
+def get_column_plan(record, properties=None):
+    """Return the ``ColumnPlan`` of the channels of ``record`` written to DIGGS.
 
-    parameters = ET.SubElement(result_set, "parameters")
-    property_params = ET.SubElement(
-        parameters, "PropertyParameters", {"gml:id": "params1"}
+    The plan has the channels of ``properties`` (see ``write_diggs``) written,
+    in order, a ``Template`` of their ``Property`` elements and the formatters
+    of their values. It is compiled once for each signature of channels, units
+    and types and cached in the registry, so the files of a rig share it.
+    """
+    properties = get_properties(properties)
+    signature = tuple(
+        (column, record.units[column], record.channels[column].dtype.str)
+        for column in record.columns
+        if column in properties
+    )
+    plan = properties.plans.get(signature)
+    if plan is None:
+        plan = properties.plans[signature] = _compile_column_plan(signature, properties)
+    return plan
+
+
+def _compile_column_plan(signature, properties):
+    definitions = [
+        (str(index), properties[column], unit)
+        for index, (column, unit, _) in enumerate(signature, 1)
+    ]
+
+    def build(writer, values):
+        for index, definition, unit in definitions:
+            _property_start_template.build(
+                writer,
+                {
+                    "index": index,
+                    "id_suffix": values["id_suffix"],
+                    "property_name": definition.name,
+                    "type_data": definition.type_data,
+                    "property_class": definition.property_class,
+                    "code_space": definition.code_space,
+                },
+            )
+            if unit not in (None, "-"):
+                writer.element("uom", text=get_uom(unit))
+            writer.end()  # Property
+
+    return ColumnPlan(
+        [column for column, _, _ in signature],
+        Template(build),
+        [get_formatter(np.dtype(dtype)) for _, _, dtype in signature],
+    )
+
+
+def _write_root_start(writer, sa_name):
+    _root_start_template.write(writer, sa_id=make_id(sa_name))
+
+
+def _write_document_information(writer, di_id, description, creation_date, sa_name):
+    _document_information_template.write(
+        writer,
+        di_id=di_id,
+        description=description,
+        creation_date=creation_date,
+        sa_name=f"{sa_name}",
+        sa_id=make_id(sa_name),
+        sa_version="beta",
+    )
+
+
+def _write_project(writer, project_ref, project_ref_id):
+    _project_template.write(
+        writer, project_ref=project_ref, project_ref_id=project_ref_id
     )
-    properties = ET.SubElement(property_params, "properties")
-
-    diggs_properties = {
-        "DEPTH": ("measured_depth", "Measured depth", "double"),
-        "AS": ("penetration_rate", "Penetration rate", "double"),
-        "RV": ("vibration_acceleration", "Vibration acceleration", "double"),
-        "EVR": ("event_new_rod", "New rod event", "boolean"),
-        "TP": (
-            "hydraulic_crowd_pressure",
-            "Hydraulic crowd operating pressure",
-            "double",
-        ),
-        "TPAF": ("crowd_downward_thrust", "Crowd or downward thrust", "double"),
-        "TQ": (
-            "hydraulic_torque_pressure",
-            "Hydraulic torque operating pressure",
-            "double",
-        ),
-        "TQAT": ("torque", "Torque", "double"),
-        "HP": ("holdback_pressure", "Holdback pressure", "double"),
-        "SP": ("hammering_pressure", "Hammering pressure", "double"),
-        "IP": ("fluid_injection_pressure", "Fluid injection pressure", "double"),
-        "IF": (
-            "fluid_injection_volume_rate",
-            "Fluid injection volumetric flow rate, pumped inflow",
-            "double",
-        ),
-        "OF": (
-            "fluid_return_volume_rate",
-            "Fluid return volumetric flow rate, returned outflow",
-            "double",
-        ),
-        "RSP": ("rotation_shaft", "Shaft rotational speed", "double"),
-        "GEAR": ("gear_number", "Gear Number", "double"),
-    }
-
-    unsupported_properties = set(bf.data.columns) - set(diggs_properties)
-    df = bf.data.drop(columns=unsupported_properties)
-
-    for index, column in enumerate(df.columns, 1):
-        property_element = ET.SubElement(
-            properties, "Property", {"gml:id": f"prop{index}", "index": str(index)}
-        )
-        ET.SubElement(property_element, "propertyName").text = diggs_properties[column][
-            1
-        ]
-        ET.SubElement(property_element, "typeData").text = diggs_properties[column][2]
 
-        ET.SubElement(
-            property_element,
-            "propertyClass",
-            {"codeSpace": "http://diggsml.org/def/codes/DIGGS/0.1/mwd_properties.xml"},
-        ).text = diggs_properties[column][0]
 
-        unit = bf.metadata[column].get("unit", "-")
-        if unit != "-":
-            ET.SubElement(property_element, "uom").text = get_uom(unit)
+def _write_borehole(writer, record, written_ids):
+    # Elements whose gml:id is in written_ids are referenced instead of being
+    # written again
+    borehole_ref = record.borehole_ref
+    borehole_ref_id = make_id(borehole_ref)
+    _, project_ref_id = _get_project_ref(record.project_ref)
+    if f"bh_{borehole_ref_id}" in written_ids:
+        return
+    written_ids.add(f"bh_{borehole_ref_id}")
+
+    depth_in_meter = to_meter(record.depth[-1], record.depth_unit)
+
+    _borehole_start_template.write(
+        writer, borehole_ref=borehole_ref, borehole_ref_id=borehole_ref_id
+    )
+
+    # add role
+    if record.operator is not None:
+        with writer.container("role"), writer.container("Role"):
+            writer.element(
+                "rolePerformed",
+                {"codeSpace": "https://diggsml.org/def/codes/DIGGS/0.1/roles.xml"},
+                "operator",
+            )
+            business_associate_id = f"ba_{make_id(record.device_serial)}"
+            if business_associate_id in written_ids:
+                writer.element(
+                    "businessAssociate", {"xlink:href": f"#{business_associate_id}"}
+                )
+            else:
+                written_ids.add(business_associate_id)
+                with writer.container("businessAssociate"):
+                    with writer.container(
+                        "BusinessAssociate", {"gml:id": business_associate_id}
+                    ):
+                        writer.element("gml:name", text=record.operator)
+
+    latitude = record.latitude
+    longitude = record.longitude
+    altitude = record.altitude
+
+    # Format coordinates to 6 decimal places
+    coord_string = f"{latitude} {longitude} {altitude}"
+    pos_altitude_float = float(altitude) - depth_in_meter
+    pos_altitude = f"{pos_altitude_float:.6f}"
+    pos_string = f"{coord_string} {latitude} {longitude} {pos_altitude}"
+
+    _borehole_location_template.write(
+        writer,
+        borehole_ref_id=borehole_ref_id,
+        project_ref_id=project_ref_id,
+        coord_string=coord_string,
+        pos_string=pos_string,
+        depth_unit=record.depth_unit,
+        depth_uom=get_uom(record.depth_unit),
+        total_depth=f"{record.depth[-1]:g}",
+        drilling_method=borfile.codes.DRILLING_METHOD[record.drilling_method],
+        depth_range=f"{record.depth[0]:g} {record.depth[-1]:g}",
+    )
+
+    # Add DrillRig
+    if record.machine_ref:
+        drill_rig_id = f"dr_{make_id(record.machine_ref)}"
+        if drill_rig_id in written_ids:
+            writer.element("constructionEquipment", {"xlink:href": f"#{drill_rig_id}"})
+        else:
+            written_ids.add(drill_rig_id)
+            with writer.container("constructionEquipment"):
+                with writer.container("DrillRig", {"gml:id": drill_rig_id}):
+                    writer.element("gml:name", text=record.machine_ref)
+
+    # Add CuttingTool
+    if record.tool:
+        with writer.container("cuttingToolInfo"), writer.container("CuttingTool"):
+            writer.element(
+                "gml:name",
+                text=borfile.codes.DRILLING_TOOL[record.tool],
+            )
+            if record.tool_diameter_unit is not None:
+                writer.element(
+                    "toolOuterDiameter",
+                    {"uom": get_uom(record.tool_diameter_unit)},
+                    record.tool_diameter,
+                )
+
+    writer.end()  # BoreholeConstructionMethod
+    writer.end()  # constructionMethod
+    writer.end()  # Borehole
+    writer.end()  # samplingFeature
+
+
+def _write_measurement(
+    writer,
+    record,
+    id_suffix="",
+    profiler=NULL_PROFILER,
+    executor=None,
+    indexer=None,
+    properties=None,
+):
+    # id_suffix makes the ids of the result set unique within a collection
+    properties = get_properties(properties)
+    plan = get_column_plan(record, properties)
+    columns = plan.columns
+    if indexer is not None:
+        indexer.start(record, columns, properties)
+    _, project_ref_id = _get_project_ref(record.project_ref)
+    _measurement_start_template.write(
+        writer,
+        filename=record.filename,
+        project_ref_id=project_ref_id,
+        borehole_ref_id=make_id(record.borehole_ref),
+    )
+
+    # Join all timestamps with a space and wrap every 12 timestamps
+    chunks = iter_time_intervals(record.time, DATA_SEPARATOR, executor=executor)
+    if indexer is not None:
+        chunks = indexer.iter_time(chunks)
+    writer.element_from_chunks(
+        "timeIntervalList",
+        None,
+        profiler.iterate("encode_time", chunks, rows=len(record)),
+    )
+    writer.end()  # TimeIntervalList
+    writer.end()  # timeDomain
+
+    _parameters_start_template.write(writer, id_suffix=id_suffix)
+    plan.properties.write(writer, id_suffix=id_suffix)
+    writer.end()  # properties
+    writer.end()  # PropertyParameters
+    writer.end()  # parameters
 
     # add data values
-    values = (
-        df.to_csv(header=False, index=False).strip().replace("\n", "\n                ")
+    chunks = iter_data_values(
+        [record.channels[column] for column in columns],
+        DATA_SEPARATOR,
+        executor=executor,
+        formatters=plan.formatters,
     )
-    data_values = ET.SubElement(
-        result_set, "dataValues", {"cs": ",", "ts": " ", "decimal": "."}
+    if indexer is not None:
+        chunks = indexer.iter_data(chunks, DATA_SEPARATOR)
+    writer.element_from_chunks(
+        "dataValues",
+        {"cs": ",", "ts": " ", "decimal": "."},
+        profiler.iterate("encode_data", chunks, rows=len(record)),
     )
-    data_values.text = values
+
+    writer.end()  # ResultSet
+    writer.end()  # results
+    writer.end()  # MWDResult
+    writer.end()  # outcome
 
     # add mwd procedure
-    ET.SubElement(ET.SubElement(mwd, "procedure"), "MWDProcedure", {"gml:id": "mwd1"})
+    with writer.container("procedure"):
+        writer.element("MWDProcedure", {"gml:id": f"mwd1{id_suffix}"})
 
-    # Convert the XML to a pretty-printed string
-    xml_diggs = (
-        minidom.parseString(ET.tostring(root))
-        .toprettyxml(indent="    ", encoding="UTF-8")
-        .decode()
-    )
-    return xml_diggs
+    writer.end()  # MeasurementWhileDrilling
+    writer.end()  # measurement
@@ -0,0 +1,127 @@
+from collections import deque
+
+import numpy as np
+
+# Number of rows formatted at once, memory use is bounded by the size of a chunk
+CHUNK_SIZE = 8192
+
+# Number of rows formatted by a worker process at once, and number of blocks
+# formatted ahead of the output
+BLOCK_SIZE = 1 << 15
+PENDING_BLOCKS = 16
+
+TIMESTAMPS_PER_LINE = 12
+
+
+def format_column(values):
+    """Format a column the same way ``DataFrame.to_csv`` does.
+
+    Floating point values use their shortest round-trip representation and
+    missing values are written as empty strings.
+    """
+    text = values.astype(str)
+    if values.dtype.kind == "f":
+        missing = np.isnan(values)
+        if missing.any():
+            text = text.astype(object)
+            text[missing] = ""
+    return text.tolist()
+
+
+def format_integers(values):
+    """Format a column of integers, which are never missing."""
+    return values.astype(str).tolist()
+
+
+def get_formatter(dtype):
+    """Return the function formatting a column of ``dtype``."""
+    return format_integers if dtype.kind in "iub" else format_column
+
+
+def iter_time_intervals(times, separator, chunk_size=CHUNK_SIZE, executor=None):
+    """Yield the ``timeIntervalList`` text by chunks.
+
+    Timestamps are formatted with ``%g``, ``TIMESTAMPS_PER_LINE`` per line, and
+    every line is followed by ``separator``. With a process pool ``executor``,
+    blocks of rows are formatted by its workers.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if executor is not None and len(times) > BLOCK_SIZE:
+        # blocks are aligned on lines too
+        block_size = BLOCK_SIZE // TIMESTAMPS_PER_LINE * TIMESTAMPS_PER_LINE
+        blocks = (
+            (times[start : start + block_size], separator)
+            for start in range(0, len(times), block_size)
+        )
+        yield from _map_blocks(executor, _format_time_block, blocks)
+        return
+    # keep chunks aligned on lines
+    chunk_size = max(chunk_size // TIMESTAMPS_PER_LINE, 1) * TIMESTAMPS_PER_LINE
+    line_format = " ".join(["%g"] * TIMESTAMPS_PER_LINE) + separator
+    for start in range(0, len(times), chunk_size):
+        chunk = times[start : start + chunk_size].tolist()
+        full_lines, remainder = divmod(len(chunk), TIMESTAMPS_PER_LINE)
+        chunk_format = line_format * full_lines
+        if remainder:
+            chunk_format += " ".join(["%g"] * remainder) + separator
+        yield chunk_format % tuple(chunk)
+
+
+def iter_data_values(
+    columns, separator, chunk_size=CHUNK_SIZE, executor=None, formatters=None
+):
+    """Yield the ``dataValues`` text by chunks.
+
+    ``columns`` is a sequence of same-length arrays, one value per row is
+    written with ``,`` between cells and ``separator`` between rows. Each
+    column is formatted by its function in ``formatters``, ``format_column``
+    by default. With a process pool ``executor``, blocks of rows are formatted
+    by its workers.
+    """
+    if not columns:
+        return
+    if formatters is None:
+        formatters = [format_column] * len(columns)
+    if executor is not None and len(columns[0]) > BLOCK_SIZE:
+        blocks = (
+            (
+                [column[start : start + BLOCK_SIZE] for column in columns],
+                separator,
+                formatters,
+            )
+            for start in range(0, len(columns[0]), BLOCK_SIZE)
+        )
+        for index, text in enumerate(_map_blocks(executor, _format_data_block, blocks)):
+            yield text if index == 0 else separator + text
+        return
+    for start in range(0, len(columns[0]), chunk_size):
+        cells = [
+            formatter(column[start : start + chunk_size])
+            for formatter, column in zip(formatters, columns)
+        ]
+        text = separator.join(map(",".join, zip(*cells)))
+        yield text if start == 0 else separator + text
+
+
+def _format_time_block(times, separator):
+    return "".join(iter_time_intervals(times, separator))
+
+
+def _format_data_block(columns, separator, formatters):
+    return "".join(iter_data_values(columns, separator, formatters=formatters))
+
+
+def _map_blocks(executor, function, blocks):
+    # Like executor.map, yielding in order with at most PENDING_BLOCKS blocks
+    # submitted ahead so that memory stays bounded
+    pending = deque()
+    try:
+        for args in blocks:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= PENDING_BLOCKS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
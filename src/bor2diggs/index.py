@@ -0,0 +1,250 @@
+import json
+import os
+
+import numpy as np
+
+from .process import find_new_rods
+from .properties import get_properties
+from .reader import INTEGER_TYPES
+from .reader import ValuesDecoder
+
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 2
+
+# Rows between two entries of the index, a new rod also starts an entry
+INDEX_EVERY = 1000
+
+
+def get_index_path(diggs_path):
+    return f"{os.fspath(diggs_path)}{INDEX_SUFFIX}"
+
+
+class DepthIndexer:
+    """Build the index of the rows of a DIGGS document as it is written.
+
+    The index splits the rows into blocks, starting every ``every`` rows and
+    at each new rod (``EVR`` event). For each block it records its first row,
+    the depth and time of that row, the depth and time range of the block and
+    the byte offsets of the row in ``timeIntervalList`` and ``dataValues``,
+    so that ``read_rows`` decodes only the blocks of a depth or time range.
+
+    ``wrap_output`` must wrap the sink of the document, offsets count the
+    bytes written to it as UTF-8 since the start of the document, so they are
+    only meaningful for an uncompressed file.
+    """
+
+    def __init__(self, every=INDEX_EVERY):
+        if every < 1:
+            raise ValueError("every must be a positive integer")
+        self.every = every
+        self.index = None
+        self._output = None
+        self._rows = None
+
+    def wrap_output(self, fp):
+        self._output = _CountingOutput(fp)
+        return self._output
+
+    def start(self, record, columns, properties=None):
+        """Compute the blocks of ``record``, whose ``columns`` are written.
+
+        ``properties`` is the registry of the conversion, see ``write_diggs``,
+        the types of the columns are kept in the index.
+        """
+        properties = get_properties(properties)
+        rows = np.arange(0, len(record), self.every)
+        if "EVR" in record.channels:
+            new_rods = np.flatnonzero(find_new_rods(record.channels["EVR"]))
+            rows = np.union1d(rows, new_rods)
+        self._rows = rows
+        blocks = {"row": rows.tolist()}
+        for name, values, as_written in (
+            ("time", record.time, _as_time_written),
+            ("depth", record.channels.get("DEPTH"), np.asarray),
+        ):
+            if values is None or not len(rows):
+                blocks[name] = blocks[f"min_{name}"] = blocks[f"max_{name}"] = []
+                continue
+            values = np.asarray(values, dtype=np.float64)
+            # Rounding is monotonic, only the values kept are rounded
+            for key, selected in (
+                (name, values[rows]),
+                (f"min_{name}", np.fmin.reduceat(values, rows)),
+                (f"max_{name}", np.fmax.reduceat(values, rows)),
+            ):
+                blocks[key] = as_written(selected).tolist()
+        self.index = {
+            "version": INDEX_VERSION,
+            "rows": len(record),
+            "every": self.every,
+            "columns": list(columns),
+            "units": {column: record.units[column] for column in columns},
+            "types": {column: properties[column].type_data for column in columns},
+            "blocks": blocks,
+        }
+
+    def iter_time(self, chunks):
+        """Pass the ``timeIntervalList`` chunks through, indexing the rows."""
+        yield from self._iter_chunks(chunks, "time", _find_tokens)
+
+    def iter_data(self, chunks, separator):
+        """Pass the ``dataValues`` chunks through, indexing the rows."""
+
+        def find_rows(text, first):
+            # Rows start after each separator, and the first one at once
+            starts = _find_bytes(text, 10) + len(separator)
+            return np.concatenate([[0], starts]) if first else starts
+
+        yield from self._iter_chunks(chunks, "data", find_rows)
+
+    def _iter_chunks(self, chunks, name, find_rows):
+        offsets = []
+        row = 0
+        for chunk in chunks:
+            yield chunk
+            # The chunk has been written when the next one is asked for
+            start = self._output.position - len(chunk)
+            starts = find_rows(chunk, row == 0)
+            indexed = self._rows[(self._rows >= row) & (self._rows < row + len(starts))]
+            offsets.append(starts[indexed - row] + start)
+            row += len(starts)
+        if row != self.index["rows"]:
+            raise ValueError(f"Found {row} rows in {name}, not {self.index['rows']}")
+        self.index["blocks"][f"{name}_offset"] = (
+            np.concatenate(offsets).tolist() if offsets else []
+        )
+        self.index[f"{name}_end"] = self._output.position
+
+    def write(self, path):
+        """Write the index to the JSON file ``path``, once the document is."""
+        self.index["size"] = self._output.position
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, separators=(",", ":"))
+
+
+class _CountingOutput:
+    # Text sink counting the bytes written to the wrapped one
+    def __init__(self, fp):
+        self.fp = fp
+        self.position = 0
+
+    def write(self, text):
+        self.position += len(text) if text.isascii() else len(text.encode())
+        return self.fp.write(text)
+
+
+def _as_time_written(times):
+    # Timestamps are written with %g
+    return np.array([float(f"{time:g}") for time in np.asarray(times).tolist()])
+
+
+def _find_bytes(text, byte):
+    return np.flatnonzero(np.frombuffer(text.encode("ascii"), np.uint8) == byte)
+
+
+def _find_tokens(text, first):
+    # Chunks of timestamps start and end on a whitespace boundary
+    blank = np.frombuffer(text.encode("ascii"), np.uint8) <= 32
+    after_blank = np.concatenate([[True], blank[:-1]])
+    return np.flatnonzero(~blank & after_blank)
+
+
+def read_index(path):
+    with open(path, encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported index version in {path}")
+    return index
+
+
+def read_rows(
+    source,
+    index=None,
+    min_depth=None,
+    max_depth=None,
+    min_time=None,
+    max_time=None,
+    float_dtype=np.float32,
+):
+    """Read the rows of a DIGGS document within a depth and a time window.
+
+    ``source`` is the path of a document written with an index, ``index`` the
+    path of the index, next to the document by default. Only the blocks of
+    rows overlapping the window are read and decoded. Bounds are included,
+    the rows are returned as a ``DataFrame`` indexed by time, with the BOR
+    columns.
+    """
+    import pandas as pd
+
+    if index is None:
+        index = get_index_path(source)
+    index = read_index(index)
+    if os.path.getsize(source) != index["size"]:
+        raise ValueError(f"The index of {source} is out of date")
+
+    blocks = index["blocks"]
+    columns = index["columns"]
+    selected = np.ones(len(blocks["row"]), dtype=bool)
+    for name, low, high in (
+        ("depth", min_depth, max_depth),
+        ("time", min_time, max_time),
+    ):
+        # Blocks without a value (NaN) are never selected by a bound
+        if low is not None:
+            selected &= np.array(blocks[f"max_{name}"], dtype=np.float64) >= low
+        if high is not None:
+            selected &= np.array(blocks[f"min_{name}"], dtype=np.float64) <= high
+
+    times = []
+    values = []
+    with open(source, "rb") as f:
+        for first, last in _find_runs(selected):
+            text = _read_range(f, blocks, index, "time", first, last)
+            times.append(np.array(text.split(), dtype=np.float64))
+            decoder = ValuesDecoder(len(columns), dtype=float_dtype)
+            decoder.feed(_read_range(f, blocks, index, "data", first, last))
+            values.append(decoder.close())
+            if len(values[-1]) != len(times[-1]):
+                raise ValueError(f"Rows of {source} do not match its index")
+
+    if values:
+        time = np.concatenate(times)
+        values = np.concatenate(values)
+    else:
+        time = np.empty(0)
+        values = np.empty((0, len(columns)), dtype=float_dtype)
+
+    mask = np.ones(len(time), dtype=bool)
+    depth = values[:, columns.index("DEPTH")] if "DEPTH" in columns else None
+    for selected_values, low, high in (
+        (depth, min_depth, max_depth),
+        (time, min_time, max_time),
+    ):
+        if selected_values is None:
+            continue
+        if low is not None:
+            mask &= selected_values >= low
+        if high is not None:
+            mask &= selected_values <= high
+
+    data = {}
+    for position, column in enumerate(columns):
+        channel = values[mask, position]
+        if index["types"][column] in INTEGER_TYPES:
+            channel = channel.astype(np.int32)
+        data[column] = channel
+    return pd.DataFrame(data, index=pd.Index(time[mask], name="time"))
+
+
+def _find_runs(selected):
+    # (first, last) blocks of each run of selected blocks
+    edges = np.diff(np.concatenate([[0], selected.astype(np.int8), [0]]))
+    return zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1)
+
+
+def _read_range(f, blocks, index, name, first, last):
+    offsets = blocks[f"{name}_offset"]
+    start = offsets[first]
+    end = offsets[last + 1] if last + 1 < len(offsets) else index[f"{name}_end"]
+    f.seek(start)
+    return f.read(end - start).decode("ascii")
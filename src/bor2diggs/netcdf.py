@@ -0,0 +1,145 @@
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# Tags and types of the NetCDF classic format
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+NC_TYPES = {1: "i1", 2: "S1", 3: ">i2", 4: ">i4", 5: ">f4", 6: ">f8"}
+
+# numrecs of a file written as a stream, computed from the file size
+STREAMING = 0xFFFFFFFF
+
+NetCDFVariable = namedtuple(
+    "NetCDFVariable", ["name", "dimensions", "attributes", "dtype", "shape", "begin"]
+)
+
+
+class NetCDFHeader:
+    """Header of a NetCDF classic or 64-bit offset file held in a buffer.
+
+    ``variables`` maps names to ``NetCDFVariable``, the first dimension of a
+    record variable is ``None`` in its ``shape``. Nothing but the header is
+    read, ``get`` returns the data as arrays viewing the buffer.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        # Released at once, a buffer exported as a view cannot be closed
+        self._view = memoryview(buffer)
+        try:
+            numrecs = self._read_header()
+        finally:
+            self._view.release()
+
+        self._record_variables = [
+            variable
+            for variable in self.variables.values()
+            if variable.shape and variable.shape[0] is None
+        ]
+        sizes = [_get_size(variable) for variable in self._record_variables]
+        if len(sizes) == 1:
+            # A single record variable is not padded
+            self.record_size = sizes[0]
+        else:
+            self.record_size = sum(size + -size % 4 for size in sizes)
+        if numrecs == STREAMING:
+            begin = min(v.begin for v in self._record_variables)
+            numrecs = (len(buffer) - begin) // self.record_size
+        self.numrecs = numrecs
+
+    def _read_header(self):
+        magic = bytes(self._view[:4])
+        if magic not in (b"CDF\x01", b"CDF\x02"):
+            raise ValueError("Not a NetCDF classic file")
+        self._offset_format = ">q" if magic[3] == 2 else ">i"
+        self._pos = 4
+        numrecs = self._unpack(">I")
+
+        dimensions = []
+        for _ in self._iter_list(NC_DIMENSION):
+            dimensions.append((self._read_name(), self._unpack(">i")))
+        self.attributes = self._read_attributes()
+        self.variables = {}
+        for _ in self._iter_list(NC_VARIABLE):
+            name = self._read_name()
+            dimids = [self._unpack(">i") for _ in range(self._unpack(">i"))]
+            attributes = self._read_attributes()
+            nc_type = self._unpack(">i")
+            self._unpack(">i")  # vsize, wrong for large variables
+            begin = self._unpack(self._offset_format)
+            shape = tuple(dimensions[dimid][1] or None for dimid in dimids)
+            self.variables[name] = NetCDFVariable(
+                name,
+                tuple(dimensions[dimid][0] for dimid in dimids),
+                attributes,
+                np.dtype(NC_TYPES[nc_type]),
+                shape,
+                begin,
+            )
+        return numrecs
+
+    def get(self, name):
+        """Return the data of a variable, a view of the buffer in file order."""
+        variable = self.variables[name]
+        shape = variable.shape
+        itemsize = variable.dtype.itemsize
+        if shape and shape[0] is None:
+            shape = (self.numrecs, *shape[1:])
+            row_strides = _get_strides(shape[1:], itemsize)
+            strides = (self.record_size, *row_strides)
+        else:
+            strides = _get_strides(shape, itemsize)
+        try:
+            return np.ndarray(
+                shape, variable.dtype, self.buffer, variable.begin, strides
+            )
+        except TypeError as exc:
+            raise ValueError(f"Truncated NetCDF variable {name}") from exc
+
+    def _iter_list(self, tag):
+        list_tag, count = self._unpack(">i"), self._unpack(">i")
+        if list_tag not in (0, tag):
+            raise ValueError("Corrupted NetCDF header")
+        return range(count)
+
+    def _unpack(self, fmt):
+        (value,) = struct.unpack_from(fmt, self._view, self._pos)
+        self._pos += struct.calcsize(fmt)
+        return value
+
+    def _read_bytes(self, size):
+        value = bytes(self._view[self._pos : self._pos + size])
+        self._pos += size + -size % 4
+        return value
+
+    def _read_name(self):
+        return self._read_bytes(self._unpack(">i")).decode()
+
+    def _read_attributes(self):
+        attributes = {}
+        for _ in self._iter_list(NC_ATTRIBUTE):
+            name = self._read_name()
+            dtype = np.dtype(NC_TYPES[self._unpack(">i")])
+            count = self._unpack(">i")
+            value = self._read_bytes(count * dtype.itemsize)
+            if dtype.kind == "S":
+                attributes[name] = value.decode()
+            else:
+                value = np.frombuffer(value, dtype).astype(dtype.newbyteorder("="))
+                attributes[name] = value[0] if count == 1 else value
+        return attributes
+
+
+def _get_size(variable):
+    return int(np.prod(variable.shape[1:], dtype=np.int64)) * variable.dtype.itemsize
+
+
+def _get_strides(shape, itemsize):
+    strides = []
+    for length in reversed(shape):
+        strides.insert(0, itemsize)
+        itemsize *= length
+    return tuple(strides)
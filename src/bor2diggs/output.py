@@ -0,0 +1,108 @@
+import gzip
+import io
+import lzma
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Supported compressions and their file suffix
+COMPRESSIONS = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+
+# Default levels of the gzip, xz and zstd tools, favouring the size
+DEFAULT_LEVELS = {"gzip": 6, "xz": 6, "zstd": 3}
+
+
+def get_compression(path):
+    """Return the compression matching the suffix of ``path``, if any."""
+    _, suffix = os.path.splitext(os.fspath(path))
+    for compression, compression_suffix in COMPRESSIONS.items():
+        if suffix.lower() == compression_suffix:
+            return compression
+    return None
+
+
+def _open_compressed(binary, compression, level):
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=binary, mode="wb", compresslevel=level)
+    if compression == "xz":
+        return lzma.LZMAFile(binary, mode="wb", preset=level)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as exc:
+            raise RuntimeError(
+                "zstd compression requires zstandard, install bor2diggs[zstd]"
+            ) from exc
+        return zstandard.ZstdCompressor(level=level).stream_writer(
+            binary, closefd=False
+        )
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+@contextmanager
+def open_output(target, compression=None, level=None):
+    """Open ``target`` to write text, compressed on the fly.
+
+    ``target`` is a path or a binary file object, which is left open. The
+    compression (``gzip``, ``xz`` or ``zstd``) defaults to the one matching
+    the suffix of the path and ``level`` to the default level of each tool,
+    see ``DEFAULT_LEVELS``: 6 for gzip and xz, 3 for zstd.
+    """
+    own_binary = isinstance(target, (str, os.PathLike))
+    if own_binary:
+        if compression is None:
+            compression = get_compression(target)
+        binary = open(target, "wb")
+    else:
+        binary = target
+
+    try:
+        if compression is None:
+            stream = binary
+        else:
+            stream = _open_compressed(binary, compression, level)
+        text = io.TextIOWrapper(stream, encoding="utf-8")
+        try:
+            yield text
+            text.flush()
+        finally:
+            # Only close what was opened here
+            text.detach()
+            if stream is not binary:
+                stream.close()
+    finally:
+        if own_binary:
+            binary.close()
+
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path to write instead of ``path``, then rename it.
+
+    The temporary file is in the same directory and ends with the same suffix,
+    readers of ``path`` never see a partly written file. It is removed if an
+    error is raised.
+    """
+    directory, name = os.path.split(os.fspath(path))
+    _, suffix = os.path.splitext(name)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory or ".", prefix=f".{name}.", suffix=f".tmp{suffix}"
+    )
+    os.close(fd)
+    try:
+        # mkstemp creates files only readable by their owner
+        os.chmod(tmp_path, 0o666 & ~_get_umask())
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,269 @@
+import numpy as np
+
+from .units import get_si_unit
+
+# Channels holding events, they are aggregated with max instead of mean
+EVENT_CHANNELS = {"EVP", "EVR"}
+
+# Channels computed by add_derived and their unit
+DERIVED_CHANNELS = {"SE": "Pa", "PPR": "m", "ROD": None}
+
+# SI units of the channels the derived ones are computed from
+DERIVED_INPUT_UNITS = {"AS": "m/s", "RSP": "rad/s", "TPAF": "N", "TQAT": "N.m"}
+
+
+def process_record(
+    record,
+    depth_range=None,
+    time_range=None,
+    every=None,
+    depth_step=None,
+    per_rod=False,
+    units="native",
+    derived=False,
+):
+    """Return ``record`` cropped and decimated according to the options.
+
+    ``depth_range`` and ``time_range`` are ``(min, max)`` tuples, either bound
+    can be ``None``. The record is then decimated by keeping one row out of
+    ``every``, by averaging the rows in bins of ``depth_step`` or by averaging
+    the rows drilled with each rod when ``per_rod`` is set, after adding the
+    channels of ``add_derived`` if ``derived`` is set. Ranges and steps are in
+    the units of the file, the channels are converted to SI units afterwards
+    when ``units`` is ``"si"``.
+    """
+    if units not in ("native", "si"):
+        raise ValueError(f"Unknown units {units!r}, expected 'native' or 'si'")
+    if sum([bool(every), bool(depth_step), bool(per_rod)]) > 1:
+        raise ValueError("Only one decimation method can be used at a time")
+    if depth_range is not None or time_range is not None:
+        record = crop(record, depth_range, time_range)
+    if derived:
+        record = add_derived(record)
+    if every:
+        record = take_every(record, every)
+    elif depth_step:
+        record = bin_depth(record, depth_step)
+    elif per_rod:
+        record = bin_rods(record)
+    if units == "si":
+        record = to_si(record)
+    return record
+
+
+def crop(record, depth_range=None, time_range=None):
+    """Keep the rows within a depth and a time window, bounds included."""
+    mask = np.ones(len(record), dtype=bool)
+    for values, value_range in ((record.depth, depth_range), (record.time, time_range)):
+        if value_range is None:
+            continue
+        low, high = value_range
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    if not mask.any():
+        raise ValueError(f"No data left in {record.filename} after cropping")
+    return _take(record, mask)
+
+
+def take_every(record, every):
+    """Keep one row out of ``every``, the last row is always kept."""
+    if every < 1:
+        raise ValueError("every must be a positive integer")
+    indices = np.arange(0, len(record), every)
+    if indices[-1] != len(record) - 1:
+        indices = np.append(indices, len(record) - 1)
+    return _take(record, indices)
+
+
+def bin_depth(record, step):
+    """Average the rows in depth bins of ``step`` (in the depth unit)."""
+    if step <= 0:
+        raise ValueError("depth step must be positive")
+    return _aggregate(record, np.floor(record.depth / step).astype(np.int64))
+
+
+def bin_rods(record):
+    """Average the rows drilled with each rod, delimited by ``EVR`` events."""
+    if "EVR" not in record.channels:
+        raise ValueError(f"{record.filename} has no new rod event (EVR) channel")
+    return _aggregate(record, np.cumsum(find_new_rods(record.channels["EVR"])))
+
+
+def add_derived(record):
+    """Add the drilling indicators computed from the other channels.
+
+    - ``SE``, the specific energy (Teale) in Pa, from the thrust ``TPAF``, the
+      torque ``TQAT``, the rotation speed ``RSP``, the penetration rate ``AS``
+      and the tool diameter;
+    - ``PPR``, the penetration per revolution in metres, from ``AS`` and
+      ``RSP``;
+    - ``ROD``, the number of the rod, from the new rod events ``EVR``.
+
+    Each one is added only if the channels it needs are there, with units
+    that convert to the ones of ``DERIVED_INPUT_UNITS``. Values are computed
+    in SI units, rows not drilling (no penetration or rotation) get NaN.
+    """
+    channels = dict(record.channels)
+    columns = list(record.columns)
+    units = dict(record.units)
+
+    def get(name):
+        # Channel in SI units, as double, None if missing or not convertible
+        if name not in channels:
+            return None
+        si_unit, factor = get_si_unit(record.units[name])
+        if si_unit != DERIVED_INPUT_UNITS[name]:
+            return None
+        return channels[name].astype(np.float64) * factor
+
+    def add(name, values):
+        if name not in columns:
+            columns.append(name)
+        units[name] = DERIVED_CHANNELS[name]
+        channels[name] = values
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate, rotation = get("AS"), get("RSP")
+        if rate is not None and rotation is not None:
+            # rad/s to revolutions per second
+            rotation = rotation / (2 * np.pi)
+            drilling = (rate > 0) & (rotation > 0)
+            add("PPR", np.where(drilling, rate / rotation, np.nan).astype(np.float32))
+            thrust, torque = get("TPAF"), get("TQAT")
+            area = _get_tool_area(record)
+            if thrust is not None and torque is not None and area:
+                energy = thrust / area + 2 * np.pi * rotation * torque / (area * rate)
+                add("SE", np.where(drilling, energy, np.nan).astype(np.float32))
+    if "EVR" in channels:
+        add("ROD", np.cumsum(find_new_rods(channels["EVR"]), dtype=np.int32))
+    return record.copy(columns=columns, units=units, channels=channels)
+
+
+def rod_summary(record):
+    """Return a ``DataFrame`` of statistics of the rows drilled with each rod.
+
+    Rods are numbered from the new rod events ``EVR``, rows before the first
+    one are rod 0. The depth and time range, duration, length drilled, number
+    of rows and mean of the other channels are given per rod, in the units of
+    the record.
+    """
+    import pandas as pd
+
+    if "ROD" in record.channels:
+        rods = record.channels["ROD"]
+    elif "EVR" in record.channels:
+        rods = np.cumsum(find_new_rods(record.channels["EVR"]))
+    else:
+        raise ValueError(f"{record.filename} has no new rod event (EVR) channel")
+
+    data = record.to_dataframe().reset_index()
+    groups = data.groupby(pd.Index(rods, name="rod"))
+    summary = pd.DataFrame(
+        {
+            "start_time": groups["time"].min(),
+            "end_time": groups["time"].max(),
+            "start_depth": groups["DEPTH"].min(),
+            "end_depth": groups["DEPTH"].max(),
+            "rows": groups.size(),
+        }
+    )
+    summary.insert(2, "duration", summary["end_time"] - summary["start_time"])
+    summary.insert(5, "length", summary["end_depth"] - summary["start_depth"])
+    means = [
+        column
+        for column in record.columns
+        if column not in EVENT_CHANNELS and column not in ("DEPTH", "ROD")
+    ]
+    if means:
+        summary = summary.join(groups[means].mean().add_prefix("mean_"))
+    return summary
+
+
+def _get_tool_diameter(record):
+    # Diameter of the tool as a number, None if unknown or not a number
+    if record.tool_diameter is None or record.tool_diameter_unit is None:
+        return None
+    try:
+        return float(record.tool_diameter)
+    except ValueError:
+        return None
+
+
+def _get_tool_area(record):
+    # Cross-section of the tool in square metres, None if unknown
+    diameter = _get_tool_diameter(record)
+    if diameter is None:
+        return None
+    si_unit, factor = get_si_unit(record.tool_diameter_unit)
+    if si_unit != "m" or diameter <= 0:
+        return None
+    return np.pi * (diameter * factor) ** 2 / 4
+
+
+def to_si(record):
+    """Convert the channels and the tool diameter to SI units.
+
+    Each channel is multiplied once by the factor of its unit, see
+    ``get_si_unit``, floating point channels keep their precision. A tool
+    diameter that is not a number is kept as it is written.
+    """
+    units = dict(record.units)
+    channels = dict(record.channels)
+    for name, unit in record.units.items():
+        si_unit, factor = get_si_unit(unit)
+        units[name] = si_unit
+        if factor != 1:
+            values = channels[name]
+            if values.dtype.kind != "f":
+                values = values.astype(np.float64)
+            channels[name] = values * values.dtype.type(factor)
+    fields = {}
+    diameter = _get_tool_diameter(record)
+    if diameter is not None:
+        si_unit, factor = get_si_unit(record.tool_diameter_unit)
+        fields["tool_diameter_unit"] = si_unit
+        fields["tool_diameter"] = f"{diameter * factor:g}"
+    return record.copy(units=units, channels=channels, **fields)
+
+
+def find_new_rods(events):
+    """Return a mask of the rows where a new rod starts, from ``EVR`` values."""
+    events = (events > 0).astype(np.int8)
+    return np.diff(events, prepend=0) > 0
+
+
+def _take(record, indices):
+    return record.copy(
+        time=record.time[indices],
+        channels={name: values[indices] for name, values in record.channels.items()},
+    )
+
+
+def _aggregate(record, groups):
+    # Groups need not be contiguous, the result is sorted by group key
+    keys, inverse = np.unique(groups, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(len(keys)))
+
+    def mean(values):
+        valid = ~np.isnan(values) if values.dtype.kind == "f" else slice(None)
+        sums = np.bincount(inverse[valid], values[valid], minlength=len(keys))
+        counts = np.bincount(inverse[valid], minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = sums / counts
+        if values.dtype.kind in "iub":
+            result = np.rint(result)
+        return result.astype(values.dtype)
+
+    def maximum(values):
+        return np.maximum.reduceat(values[order], starts)
+
+    return record.copy(
+        time=mean(record.time),
+        channels={
+            name: maximum(values) if name in EVENT_CHANNELS else mean(values)
+            for name, values in record.channels.items()
+        },
+    )
@@ -0,0 +1,186 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextlib import nullcontext
+
+
+class StageStats:
+    """Measures of one stage: ``calls``, wall time, rows and peak memory.
+
+    ``seconds`` excludes the time of the stages nested in this one and
+    ``peak_bytes`` is the peak of memory allocated during the stage, on top of
+    what was allocated when it started.
+    """
+
+    __slots__ = ("calls", "seconds", "rows", "peak_bytes")
+
+    def __init__(self, calls=0, seconds=0.0, rows=0, peak_bytes=0):
+        self.calls = calls
+        self.seconds = seconds
+        self.rows = rows
+        self.peak_bytes = peak_bytes
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.rows += other.rows
+        self.peak_bytes = max(self.peak_bytes, other.peak_bytes)
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "rows_per_second": self.rows / self.seconds if self.rows else None,
+            "peak_bytes": self.peak_bytes,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(
+            values["calls"], values["seconds"], values["rows"], values["peak_bytes"]
+        )
+
+
+class _Frame:
+    __slots__ = ("name", "rows", "start", "nested", "base", "peak")
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.start = time.perf_counter()
+        self.nested = 0.0
+        self.base = 0
+        self.peak = 0
+
+
+class Profiler:
+    """Collect the time, rows and memory of each stage of the conversions.
+
+    Stages are timed with ``stage``, the statistics of all the conversions
+    profiled with the same profiler are added up in ``stages``. ``callback``
+    is called with the name and the ``StageStats`` of each stage as it ends.
+    Memory is measured with ``tracemalloc`` when ``trace_memory`` is set,
+    which slows the conversion down.
+    """
+
+    def __init__(self, callback=None, trace_memory=True):
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """Time the enclosed block as stage ``name``, yield its frame.
+
+        The number of rows can be set later on the frame with ``frame.rows``.
+        """
+        frame = self._push(name, rows)
+        try:
+            yield frame
+        finally:
+            self._pop(frame)
+
+    def iterate(self, name, iterable, rows=0):
+        """Time the production of each item of ``iterable`` as stage ``name``."""
+        iterator = iter(iterable)
+        first = True
+        while True:
+            frame = self._push(name, rows if first else 0)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._pop(frame, count=first)
+            first = False
+            yield item
+
+    def wrap_output(self, fp):
+        """Return a text sink timing the writes to ``fp`` as stage ``write``."""
+        return _ProfiledOutput(fp, self)
+
+    def _push(self, name, rows):
+        frame = _Frame(name, rows)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak = max(parent.peak, peak - parent.base)
+            frame.base = current
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        return frame
+
+    def _pop(self, frame, count=True):
+        elapsed = time.perf_counter() - frame.start
+        self._stack.pop()
+        peak = 0
+        if self.trace_memory:
+            peak = max(frame.peak, tracemalloc.get_traced_memory()[1] - frame.base)
+        if self._stack:
+            parent = self._stack[-1]
+            parent.nested += elapsed
+            parent.peak = max(parent.peak, peak + frame.base - parent.base)
+
+        stats = StageStats(int(count), elapsed - frame.nested, frame.rows, peak)
+        self.stages.setdefault(frame.name, StageStats()).merge(stats)
+        if self.callback is not None:
+            self.callback(frame.name, stats)
+
+    def merge(self, report):
+        """Add up the statistics of a report of another profiler."""
+        for name, values in report["stages"].items():
+            self.stages.setdefault(name, StageStats()).merge(
+                StageStats.from_dict(values)
+            )
+
+    def report(self):
+        """Return the statistics as a dict that can be serialized to JSON."""
+        read = self.stages.get("read")
+        return {
+            "files": read.calls if read is not None else 0,
+            "seconds": sum(stats.seconds for stats in self.stages.values()),
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+        }
+
+    def dump(self, fp):
+        json.dump(self.report(), fp, indent=2)
+        fp.write("\n")
+
+    def close(self):
+        """Stop tracing memory allocations if this profiler started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+class _ProfiledOutput:
+    def __init__(self, fp, profiler):
+        self.fp = fp
+        self.profiler = profiler
+
+    def write(self, text):
+        with self.profiler.stage("write"):
+            return self.fp.write(text)
+
+
+class _NullProfiler:
+    # Stands for a profiler when profiling is disabled
+    def stage(self, name, rows=0):
+        return nullcontext(_Frame(name, rows))
+
+    def iterate(self, name, iterable, rows=0):
+        return iterable
+
+    def wrap_output(self, fp):
+        return fp
+
+
+NULL_PROFILER = _NullProfiler()
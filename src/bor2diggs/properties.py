@@ -0,0 +1,205 @@
+import json
+import os
+from collections import namedtuple
+from collections.abc import Mapping
+
+# Entry points providing properties, and variable naming a properties file
+# for the command line
+ENTRY_POINT_GROUP = "bor2diggs.properties"
+PROPERTIES_ENV = "BOR2DIGGS_PROPERTIES"
+
+# Code lists of the property classes: the DIGGS MWD properties, and the ones of
+# the channels computed by bor2diggs, which are not in it
+MWD_CODESPACE = "http://diggsml.org/def/codes/DIGGS/0.1/mwd_properties.xml"
+BOR2DIGGS_CODESPACE = (
+    "https://github.com/LIMSAS/bor2diggs/blob/master/docs/bor2diggs_properties.json"
+)
+
+# BOR channels written to DIGGS: property class, name, type and code list of
+# the class if not MWD_CODESPACE
+DEFAULT_PROPERTIES = {
+    "DEPTH": ("measured_depth", "Measured depth", "double"),
+    "AS": ("penetration_rate", "Penetration rate", "double"),
+    "RV": ("vibration_acceleration", "Vibration acceleration", "double"),
+    "EVR": ("event_new_rod", "New rod event", "boolean"),
+    "TP": (
+        "hydraulic_crowd_pressure",
+        "Hydraulic crowd operating pressure",
+        "double",
+    ),
+    "TPAF": ("crowd_downward_thrust", "Crowd or downward thrust", "double"),
+    "TQ": (
+        "hydraulic_torque_pressure",
+        "Hydraulic torque operating pressure",
+        "double",
+    ),
+    "TQAT": ("torque", "Torque", "double"),
+    "HP": ("holdback_pressure", "Holdback pressure", "double"),
+    "SP": ("hammering_pressure", "Hammering pressure", "double"),
+    "IP": ("fluid_injection_pressure", "Fluid injection pressure", "double"),
+    "IF": (
+        "fluid_injection_volume_rate",
+        "Fluid injection volumetric flow rate, pumped inflow",
+        "double",
+    ),
+    "OF": (
+        "fluid_return_volume_rate",
+        "Fluid return volumetric flow rate, returned outflow",
+        "double",
+    ),
+    "RSP": ("rotation_shaft", "Shaft rotational speed", "double"),
+    "GEAR": ("gear_number", "Gear Number", "double"),
+    # Computed by bor2diggs.process.add_derived
+    "SE": ("specific_energy", "Specific energy", "double"),
+    "PPR": (
+        "penetration_per_revolution",
+        "Penetration per revolution",
+        "double",
+        BOR2DIGGS_CODESPACE,
+    ),
+    "ROD": ("rod_number", "Rod number", "integer", BOR2DIGGS_CODESPACE),
+}
+
+PropertyDefinition = namedtuple(
+    "PropertyDefinition",
+    ["property_class", "name", "type_data", "code_space"],
+    defaults=[MWD_CODESPACE],
+)
+
+
+class PropertyRegistry(Mapping):
+    """Mapping of the BOR channels written to DIGGS to their ``PropertyDefinition``.
+
+    Channels are added with ``register``, from a JSON file with ``load_config``
+    or by the packages declaring ``bor2diggs.properties`` entry points, loaded
+    by ``load_plugins``. ``plans`` caches what is derived from the registry, it
+    is cleared when a channel is added.
+    """
+
+    def __init__(self, properties=None):
+        self._properties = {}
+        self._columns = {}
+        self._plugins_loaded = False
+        self.plans = {}
+        self.update(properties or {})
+
+    def __getitem__(self, column):
+        return self._properties[column]
+
+    def __iter__(self):
+        return iter(self._properties)
+
+    def __len__(self):
+        return len(self._properties)
+
+    def register(
+        self,
+        column,
+        property_class,
+        name,
+        type_data="double",
+        code_space=MWD_CODESPACE,
+    ):
+        """Write the BOR channel ``column`` as a DIGGS property.
+
+        ``code_space`` is the code list of ``property_class``.
+        """
+        definition = PropertyDefinition(property_class, name, type_data, code_space)
+        self._properties[column] = definition
+        self._columns.setdefault(property_class, column)
+        self.plans.clear()
+
+    def unregister(self, column):
+        """Stop writing the BOR channel ``column``."""
+        definition = self._properties.pop(column)
+        if self._columns.get(definition.property_class) == column:
+            del self._columns[definition.property_class]
+            for other, other_definition in self._properties.items():
+                if other_definition.property_class == definition.property_class:
+                    self._columns[definition.property_class] = other
+                    break
+        self.plans.clear()
+
+    def update(self, properties):
+        """Register the channels of a mapping to ``PropertyDefinition`` fields.
+
+        Fields are given as a sequence or as a mapping of their names.
+        """
+        for column, fields in properties.items():
+            if isinstance(fields, Mapping):
+                self.register(column, **fields)
+            else:
+                self.register(column, *fields)
+
+    def load_config(self, path):
+        """Register the channels of a JSON file, see ``update``."""
+        with open(path, encoding="utf-8") as f:
+            self.update(json.load(f))
+
+    def load_entry_points(self, group=ENTRY_POINT_GROUP):
+        """Register the channels of the installed entry points.
+
+        An entry point is a mapping of channels, or a callable returning one.
+        """
+        for entry_point in _get_entry_points(group):
+            properties = entry_point.load()
+            if callable(properties):
+                properties = properties()
+            self.update(properties)
+
+    def load_plugins(self):
+        """Load the entry points, once."""
+        if not self._plugins_loaded:
+            self._plugins_loaded = True
+            self.load_entry_points()
+
+    def copy(self):
+        """Return a registry of the same channels, with its own plans."""
+        registry = self.__class__(self._properties)
+        registry._plugins_loaded = self._plugins_loaded
+        return registry
+
+    def get_column(self, property_class):
+        """Return the BOR channel of a property class, ``None`` if unknown."""
+        return self._columns.get(property_class)
+
+
+def _get_entry_points(group):
+    from importlib import metadata
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        return entry_points.select(group=group)
+    # Python < 3.10
+    return entry_points.get(group, [])
+
+
+# Registry of the channels written by default, more can be registered
+diggs_properties = PropertyRegistry(DEFAULT_PROPERTIES)
+
+# Registries of the configuration files loaded, by path
+_config_registries = {}
+
+
+def get_properties(properties=None):
+    """Return the registry of the channels written by a conversion.
+
+    ``properties`` is a ``PropertyRegistry``, returned as is, or the path of
+    a JSON file of more channels (see ``PropertyRegistry.update``), added to
+    a copy of ``diggs_properties``. Such registries are kept so that their
+    plans are reused, and loaded again when their file changes. Without it,
+    ``diggs_properties`` is returned. The entry points are loaded first.
+    """
+    if isinstance(properties, PropertyRegistry):
+        return properties
+    diggs_properties.load_plugins()
+    if properties is None:
+        return diggs_properties
+    path = os.path.abspath(properties)
+    mtime = os.stat(path).st_mtime_ns
+    loaded = _config_registries.get(path)
+    if loaded is None or loaded[0] != mtime:
+        registry = diggs_properties.copy()
+        registry.load_config(path)
+        loaded = _config_registries[path] = (mtime, registry)
+    return loaded[1]
@@ -0,0 +1,352 @@
+import io
+import os
+from xml.parsers import expat
+
+import borfile
+import numpy as np
+
+from .convert import UOM_CODES
+from .properties import get_properties
+from .record import BoreholeRecord
+
+# Size of the blocks read from the DIGGS file
+BLOCK_SIZE = 1 << 20
+
+# Number of characters of values decoded at once
+DECODE_SIZE = 1 << 20
+
+# BOR units from their DIGGS names
+UNITS = {uom: unit for unit, uom in UOM_CODES.items()}
+DRILLING_METHODS = {}
+for code, name in borfile.codes.DRILLING_METHOD.items():
+    DRILLING_METHODS.setdefault(name, code)
+DRILLING_TOOLS = {}
+for code, name in borfile.codes.DRILLING_TOOL.items():
+    DRILLING_TOOLS.setdefault(name, code)
+
+# DIGGS types stored as integers, the others are read as floats
+INTEGER_TYPES = {"boolean", "integer", "int", "long", "short"}
+
+
+class ValuesDecoder:
+    """Decode delimited numbers into a 2D array of ``dtype``, as the text comes.
+
+    Text is fed by pieces, complete tuples are decoded in bulk with NumPy
+    every ``DECODE_SIZE`` characters. Tuples are separated by ``ts``, any
+    whitespace if it is a blank, and their ``columns`` values by ``cs``.
+    Empty values are read as NaN.
+    """
+
+    def __init__(self, columns=1, cs=",", ts=" ", decimal=".", dtype=np.float64):
+        self.columns = columns
+        self.dtype = dtype
+        self.cs = cs
+        self.ts = ts if ts.strip() else None
+        self.decimal = decimal
+        self._pieces = []
+        self._size = 0
+        self._arrays = []
+
+    def feed(self, text):
+        self._pieces.append(text)
+        self._size += len(text)
+        if self._size >= DECODE_SIZE:
+            self._decode(final=False)
+
+    def close(self):
+        self._decode(final=True)
+        if not self._arrays:
+            return np.empty((0, self.columns), dtype=self.dtype)
+        return np.concatenate(self._arrays)
+
+    def _decode(self, final):
+        text = "".join(self._pieces)
+        carry = ""
+        if not final:
+            # Keep the last tuple, it may continue in the next piece
+            if self.ts is None:
+                cut = len(text)
+                while cut and not text[cut - 1].isspace():
+                    cut -= 1
+            else:
+                cut = text.rfind(self.ts) + len(self.ts)
+            text, carry = text[:cut], text[cut:]
+        self._pieces = [carry] if carry else []
+        self._size = len(carry)
+
+        if self.ts is None:
+            tuples = text.split()
+        else:
+            tuples = [item.strip() for item in text.split(self.ts)]
+            tuples = [item for item in tuples if item]
+        if not tuples:
+            return
+        try:
+            values = self._parse(tuples)
+        except ValueError:
+            values = self._parse_strings(tuples)
+        if values.shape[1] != self.columns:
+            raise ValueError(
+                f"dataValues has {values.shape[1]} values per tuple, "
+                f"expected {self.columns}"
+            )
+        self._arrays.append(values.astype(self.dtype))
+
+    def _parse(self, tuples):
+        import pandas as pd
+
+        return pd.read_csv(
+            io.StringIO("\n".join(tuples)),
+            sep=self.cs,
+            decimal=self.decimal,
+            header=None,
+            dtype=np.float64,
+            float_precision="round_trip",
+        ).to_numpy()
+
+    def _parse_strings(self, tuples):
+        # Slower, handles booleans written as words
+        values = np.array(self.cs.join(tuples).split(self.cs))
+        if self.decimal != ".":
+            values = np.char.replace(values, self.decimal, ".")
+        values[values == ""] = "nan"
+        values[values == "true"] = "1"
+        values[values == "false"] = "0"
+        if len(values) % len(tuples):
+            raise ValueError("dataValues tuples do not have the same length")
+        return values.astype(np.float64).reshape(len(tuples), -1)
+
+
+class _DiggsHandler:
+    """Expat handlers collecting the MWD measurements of a DIGGS document."""
+
+    def __init__(self, float_dtype, properties):
+        self.float_dtype = float_dtype
+        self.properties = properties
+        self.records = []
+        self.creation = None
+        self.projects = {}
+        self.boreholes = {}
+        self.business_associates = {}
+        self.drill_rigs = {}
+        self._stack = []
+        self._ids = []
+        self._text = None
+        self._decoder = None
+        self._borehole = None
+        self._measurement = None
+
+    def start(self, name, attrs):
+        tag = name.rpartition(" ")[2]
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(tag)
+        self._ids.append(_get_attr(attrs, "id"))
+        href = _get_attr(attrs, "href")
+
+        if tag == "Borehole":
+            self._borehole = {"id": self._ids[-1], "operator": None}
+        elif tag == "MeasurementWhileDrilling":
+            filename = self._ids[-1] or ""
+            if filename.startswith("mwd_"):
+                filename = filename[len("mwd_") :]
+            self._measurement = {
+                "id": self._ids[-1],
+                "filename": filename,
+                "properties": [],
+            }
+        elif tag == "Property" and self._measurement is not None:
+            self._measurement["properties"].append({})
+        elif tag == "timeIntervalList" and self._measurement is not None:
+            self._decoder = ValuesDecoder(1, ts=" ")
+        elif tag == "dataValues" and self._measurement is not None:
+            self._decoder = ValuesDecoder(
+                len(self._measurement["properties"]),
+                cs=attrs.get("cs", ","),
+                ts=attrs.get("ts", " "),
+                decimal=attrs.get("decimal", "."),
+                dtype=self.float_dtype,
+            )
+        elif tag == "toolOuterDiameter" and self._borehole is not None:
+            self._borehole["tool_diameter_unit"] = attrs.get("uom")
+            self._text = []
+        elif href is not None:
+            self._reference(tag, parent, href.lstrip("#"))
+        elif tag in ("name", "pos", "units", "creationDate") or parent == "Property":
+            self._text = []
+
+    def _reference(self, tag, parent, ref):
+        borehole = self._borehole
+        if tag == "businessAssociate" and borehole is not None:
+            borehole["device_serial"] = ref[len("ba_") :]
+            borehole["operator"] = self.business_associates.get(ref, "")
+        elif tag == "constructionEquipment" and borehole is not None:
+            borehole["machine_ref"] = self.drill_rigs.get(ref)
+        elif tag == "projectRef" and borehole is not None:
+            borehole["project_ref"] = self.projects.get(ref)
+        elif tag == "samplingFeatureRef" and self._measurement is not None:
+            self._measurement["borehole"] = ref
+
+    def data(self, text):
+        if self._decoder is not None:
+            self._decoder.feed(text)
+        elif self._text is not None:
+            self._text.append(text)
+
+    def end(self, name):
+        tag = self._stack.pop()
+        element_id = self._ids.pop()
+        parent = self._stack[-1] if self._stack else None
+
+        if self._decoder is not None:
+            values = self._decoder.close()
+            self._decoder = None
+            if tag == "timeIntervalList":
+                self._measurement["time"] = values[:, 0]
+            else:
+                self._measurement["values"] = values
+            return
+        if tag == "Borehole":
+            self.boreholes[element_id] = self._borehole
+            self._borehole = None
+            return
+        if tag == "MeasurementWhileDrilling":
+            self.records.append(self._make_record(self._measurement))
+            self._measurement = None
+            return
+        if self._text is None:
+            return
+
+        text = "".join(self._text)
+        self._text = None
+        borehole = self._borehole
+        if tag == "creationDate" and parent == "DocumentInformation":
+            self.creation = text
+        elif tag == "name" and parent == "Project":
+            self.projects[self._ids[-1]] = text
+        elif parent == "Property":
+            self._measurement["properties"][-1][tag] = text
+        elif borehole is None:
+            return
+        elif tag == "name" and parent == "Borehole":
+            borehole["borehole_ref"] = text
+        elif tag == "name" and parent == "BusinessAssociate":
+            borehole["device_serial"] = self._ids[-1][len("ba_") :]
+            borehole["operator"] = self.business_associates[self._ids[-1]] = text
+        elif tag == "pos" and parent == "PointLocation":
+            borehole["position"] = text.split()
+        elif tag == "units" and parent == "LinearReferencingMethod":
+            borehole["depth_unit"] = text
+        elif tag == "name" and parent == "BoreholeConstructionMethod":
+            borehole["drilling_method"] = DRILLING_METHODS.get(text, text)
+        elif tag == "name" and parent == "DrillRig":
+            borehole["machine_ref"] = self.drill_rigs[self._ids[-1]] = text
+        elif tag == "name" and parent == "CuttingTool":
+            borehole["tool"] = DRILLING_TOOLS.get(text, text)
+        elif tag == "toolOuterDiameter":
+            borehole["tool_diameter"] = text
+
+    def _make_record(self, measurement):
+        borehole = self.boreholes.get(measurement.get("borehole"), {})
+        latitude, longitude, altitude = borehole.get("position", ["0", "0", "0"])
+
+        if measurement["properties"]:
+            for tag, key in (("timeIntervalList", "time"), ("dataValues", "values")):
+                if key not in measurement:
+                    raise ValueError(
+                        f"MeasurementWhileDrilling {measurement['id']} has "
+                        f"properties but no {tag}"
+                    )
+        time = measurement.get("time", np.empty(0))
+        values = measurement.get("values", np.empty((0, 0)))
+        if len(values) != len(time):
+            raise ValueError(
+                f"{measurement['filename']} has {len(time)} time intervals "
+                f"and {len(values)} data values"
+            )
+        columns = []
+        units = {}
+        channels = {}
+        for index, prop in enumerate(measurement["properties"]):
+            property_class = prop.get("propertyClass", f"property{index + 1}")
+            column = self.properties.get_column(property_class) or property_class
+            columns.append(column)
+            uom = prop.get("uom")
+            if uom is None and column == "DEPTH":
+                uom = borehole.get("depth_unit")
+            units[column] = UNITS.get(uom, uom)
+            channel = values[:, index]
+            if prop.get("typeData") in INTEGER_TYPES:
+                channel = channel.astype(np.int32)
+            channels[column] = channel
+
+        return BoreholeRecord(
+            filename=measurement["filename"],
+            creation=self.creation,
+            project_ref=borehole.get("project_ref"),
+            borehole_ref=borehole.get("borehole_ref"),
+            operator=borehole["operator"] if borehole else None,
+            device_serial=borehole.get("device_serial"),
+            latitude=latitude,
+            longitude=longitude,
+            altitude=altitude,
+            drilling_method=borehole.get("drilling_method"),
+            machine_ref=borehole.get("machine_ref"),
+            tool=borehole.get("tool"),
+            tool_diameter=borehole.get("tool_diameter"),
+            tool_diameter_unit=UNITS.get(
+                borehole.get("tool_diameter_unit"), borehole.get("tool_diameter_unit")
+            ),
+            time=time,
+            columns=columns,
+            units=units,
+            channels=channels,
+        )
+
+
+def _get_attr(attrs, name):
+    # Attribute names are qualified by their namespace URI
+    for key, value in attrs.items():
+        if key.rpartition(" ")[2] == name:
+            return value
+    return None
+
+
+def iter_diggs_records(
+    source, float_dtype=np.float32, block_size=BLOCK_SIZE, properties=None
+):
+    """Read the MWD measurements of a DIGGS document as ``BoreholeRecord``.
+
+    ``source`` is a path or a binary file object. The document is parsed by
+    blocks and each record is yielded as soon as its measurement ends, only
+    the decoded arrays of the current measurement are kept in memory.
+    Channels are mapped back to BOR columns with ``properties``, see
+    ``bor2diggs.properties.get_properties``, values are read as
+    ``float_dtype`` (single precision like in BOR files) and as integers for
+    boolean and integer properties.
+    """
+    handler = _DiggsHandler(float_dtype, get_properties(properties))
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.buffer_text = True
+    parser.buffer_size = block_size
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.data
+
+    own_file = isinstance(source, (str, os.PathLike))
+    fp = open(source, "rb") if own_file else source
+    try:
+        while True:
+            block = fp.read(block_size)
+            parser.Parse(block, not block)
+            yield from handler.records
+            handler.records.clear()
+            if not block:
+                break
+    finally:
+        if own_file:
+            fp.close()
+
+
+def read_diggs(source, float_dtype=np.float32, properties=None):
+    """Return the list of ``BoreholeRecord`` of a DIGGS document."""
+    return list(iter_diggs_records(source, float_dtype, properties=properties))
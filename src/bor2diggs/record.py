@@ -0,0 +1,332 @@
+import io
+import mmap
+import struct
+import zipfile
+import zlib
+from contextlib import contextmanager
+from contextlib import ExitStack
+
+import borfile
+import numpy as np
+from borfile.utils import xml_to_dict
+
+from .netcdf import NetCDFHeader
+
+# Namespaces of the description.xml of a BOR file
+DESCRIPTION_NAMESPACES = {
+    "@xmlns": "http://www.lim.eu/description",
+    "@xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "@xsi:schemaLocation": "http://www.lim.eu/description description.xsd",
+}
+
+# Position used when the BOR file has no GPS position
+DEFAULT_POSITION = {
+    "longitude": {"@unit": "degree", "value": "0"},
+    "latitude": {"@unit": "degree", "value": "0"},
+    "altitude": {"@unit": "m", "value": "0"},
+}
+
+
+# Attributes of NetCDF variables decoded by xarray, files using them are read
+# by borfile
+ENCODING_ATTRIBUTES = {
+    "_FillValue",
+    "missing_value",
+    "scale_factor",
+    "add_offset",
+    "_Unsigned",
+}
+
+
+class BoreholeRecord:
+    """Data read from a BOR file, independent of any output format.
+
+    Header fields are kept as they are written in the BOR description, the
+    data is stored as NumPy arrays: ``time`` and one array per channel in
+    ``channels``, in the order given by ``columns``, with their unit in
+    ``units`` (``None`` for dimensionless channels).
+    """
+
+    __slots__ = (
+        "filename",
+        "creation",
+        "project_ref",
+        "borehole_ref",
+        "operator",
+        "device_serial",
+        "latitude",
+        "longitude",
+        "altitude",
+        "drilling_method",
+        "machine_ref",
+        "tool",
+        "tool_diameter",
+        "tool_diameter_unit",
+        "time",
+        "columns",
+        "units",
+        "channels",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"Unexpected fields: {', '.join(fields)}")
+
+    @classmethod
+    def from_borfile(cls, bf, columns=None):
+        """Build a record from a ``borfile.BorFile``.
+
+        ``columns`` restricts the channels kept in the record, missing ones
+        are ignored and ``DEPTH`` is always kept.
+        """
+        data = bf.data
+        if columns is None:
+            columns = list(data.columns)
+        else:
+            columns = _select_columns(data.columns, columns)
+
+        return cls(
+            **_get_header_fields(bf.description),
+            time=data.index.to_numpy(),
+            columns=columns,
+            units={column: bf.metadata[column].get("unit") for column in columns},
+            channels={column: data[column].to_numpy() for column in columns},
+        )
+
+    def to_borfile(self):
+        """Return a ``borfile.BorFile`` holding the record, to ``save`` it.
+
+        Only the fields of the record are written in the description,
+        floating point channels are stored as single precision.
+        """
+        description = dict(DESCRIPTION_NAMESPACES)
+        description.update(
+            filename=self.filename,
+            creation=self.creation,
+            project_ref=self.project_ref,
+            borehole_ref=self.borehole_ref,
+            position={
+                "longitude": {"@unit": "degree", "value": self.longitude},
+                "latitude": {"@unit": "degree", "value": self.latitude},
+                "altitude": {"@unit": "m", "value": self.altitude},
+            },
+        )
+        if self.operator is not None:
+            description["operator"] = self.operator
+        description["device"] = {"serial": self.device_serial}
+        drilling = {"method": self.drilling_method}
+        if self.machine_ref:
+            drilling["machine_ref"] = self.machine_ref
+        if self.tool:
+            drilling["tool"] = self.tool
+        if self.tool_diameter is not None:
+            drilling["tool_diameter"] = {
+                "@unit": self.tool_diameter_unit,
+                "value": self.tool_diameter,
+            }
+        description["drilling"] = drilling
+
+        metadata = {}
+        for column in [*self.columns, "time"]:
+            unit = "s" if column == "time" else self.units[column]
+            metadata[column] = {"label": column}
+            if unit is not None:
+                metadata[column]["unit"] = unit
+
+        data = self.to_dataframe()
+        data.index = data.index.astype(np.float32)
+        for column in data.columns:
+            if data[column].dtype.kind == "f":
+                data[column] = data[column].astype(np.float32)
+
+        bf = borfile.BorFile(io.BytesIO())
+        # Nothing to load from a new file, set what would have been read
+        bf._description = description
+        bf._metadata = metadata
+        bf.data = data
+        return bf
+
+    def to_dataframe(self):
+        """Return the channels as a ``DataFrame`` indexed by time."""
+        import pandas as pd
+
+        return pd.DataFrame(
+            {column: self.channels[column] for column in self.columns},
+            index=pd.Index(self.time, name="time"),
+        )
+
+    def copy(self, **fields):
+        """Return a shallow copy of the record with some fields replaced."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(fields)
+        return self.__class__(**values)
+
+    @property
+    def depth(self):
+        return self.channels["DEPTH"]
+
+    @property
+    def depth_unit(self):
+        return self.units["DEPTH"]
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        cls_name = ".".join([self.__module__, self.__class__.__name__])
+        return f"<{cls_name} {self.filename}>"
+
+
+def read_record(file_path, columns=None):
+    """Read a BOR file into a ``BoreholeRecord``.
+
+    Paths and files are memory-mapped and only the ``columns`` kept are
+    copied out of ``data.nc``, no ``DataFrame`` of the whole file is built.
+    Files using NetCDF encodings not found in BOR files, or that cannot be
+    read here, are read by ``borfile``. A damaged archive raises
+    ``zipfile.BadZipFile``.
+    """
+    with _map_file(file_path) as (fp, buffer):
+        with zipfile.ZipFile(fp) as archive:
+            description = archive.read("description.xml").decode()
+            info = archive.getinfo("data.nc")
+        try:
+            time, units, channels = _read_data_nc(buffer, info, columns)
+        except (ValueError, zlib.error, zipfile.BadZipFile):
+            return _read_borfile(buffer, columns)
+
+    return BoreholeRecord(
+        **_get_header_fields(xml_to_dict(description)["description"]),
+        time=time,
+        columns=list(channels),
+        units=units,
+        channels=channels,
+    )
+
+
+def _read_borfile(buffer, columns):
+    try:
+        bf = borfile.BorFile(io.BytesIO(buffer))
+        return BoreholeRecord.from_borfile(bf, columns=columns)
+    except zlib.error as exc:
+        # Raised by zipfile while decompressing a damaged member
+        message = f"Bad compressed data for file 'data.nc': {exc}"
+        raise zipfile.BadZipFile(message) from exc
+
+
+def read_description(file_path):
+    """Return the description of a BOR file as a dict.
+
+    Only ``description.xml`` is read, a file object is left at the position
+    it was.
+    """
+    if hasattr(file_path, "read"):
+        position = file_path.tell()
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                description = archive.read("description.xml")
+        finally:
+            file_path.seek(position)
+    else:
+        with zipfile.ZipFile(file_path) as archive:
+            description = archive.read("description.xml")
+    return xml_to_dict(description.decode())["description"]
+
+
+def _get_header_fields(description):
+    drilling = description["drilling"]
+    position = description.get("position", DEFAULT_POSITION)
+    tool_diameter = drilling.get("tool_diameter") or {}
+    return {
+        "filename": description["filename"],
+        "creation": description["creation"],
+        "project_ref": description["project_ref"],
+        "borehole_ref": description["borehole_ref"],
+        # an empty operator is still written as a role
+        "operator": description["operator"] or ""
+        if "operator" in description
+        else None,
+        "device_serial": description["device"]["serial"],
+        "latitude": position["latitude"]["value"],
+        "longitude": position["longitude"]["value"],
+        "altitude": position["altitude"]["value"],
+        "drilling_method": drilling["method"],
+        "machine_ref": drilling.get("machine_ref"),
+        "tool": drilling.get("tool"),
+        "tool_diameter": tool_diameter.get("value"),
+        "tool_diameter_unit": tool_diameter.get("@unit"),
+    }
+
+
+def _select_columns(names, columns):
+    return [name for name in names if name in columns or name == "DEPTH"]
+
+
+@contextmanager
+def _map_file(source):
+    # Yield a file object and the content of a path or file, memory-mapped
+    # when possible
+    with ExitStack() as stack:
+        if hasattr(source, "read"):
+            fp = source
+        else:
+            fp = stack.enter_context(open(source, "rb"))
+        try:
+            if fp.tell() != 0:
+                raise io.UnsupportedOperation
+            buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # not a real file, or an empty one
+            buffer = fp.read()
+            yield io.BytesIO(buffer), buffer
+            return
+        with buffer:
+            yield fp, buffer
+
+
+def _get_member(buffer, info):
+    # Return the content of an archive member, a view of the buffer if stored
+    with memoryview(buffer) as view:
+        name_size, extra_size = struct.unpack_from("<HH", view, info.header_offset + 26)
+        start = info.header_offset + 30 + name_size + extra_size
+        data = view[start : start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15, info.file_size)
+        elif info.compress_type != zipfile.ZIP_STORED:
+            data.release()
+            with zipfile.ZipFile(io.BytesIO(buffer)) as archive:
+                return archive.read(info)
+        if zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+        return data
+
+
+def _read_data_nc(buffer, info, columns):
+    # Copy the time and the channels kept to native arrays, the views of the
+    # buffer are all released on return
+    header = NetCDFHeader(_get_member(buffer, info))
+    variables = [
+        variable for variable in header.variables.values() if variable.name != "time"
+    ]
+    names = [variable.name for variable in variables]
+    if columns is not None:
+        names = _select_columns(names, columns)
+    for name in ["time", *names]:
+        variable = header.variables.get(name)
+        if (
+            variable is None
+            or variable.dimensions != ("time",)
+            or variable.dtype.kind == "S"
+            or not ENCODING_ATTRIBUTES.isdisjoint(variable.attributes)
+        ):
+            raise ValueError(f"Unsupported variable {name}")
+
+    def read(name):
+        values = header.get(name)
+        return values.astype(values.dtype.newbyteorder("="))
+
+    units = {name: header.variables[name].attributes.get("unit") for name in names}
+    channels = {name: read(name) for name in names}
+    return read("time"), units, channels
@@ -0,0 +1,344 @@
+import json
+import os
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from .convert import write_diggs
+from .output import COMPRESSIONS
+from .output import open_output
+
+CONTENT_TYPES = {
+    None: "application/xml",
+    "gzip": "application/gzip",
+    "xz": "application/x-xz",
+    "zstd": "application/zstd",
+}
+
+# Query parameters accepted by /convert and the options they set
+FLOAT_PARAMETERS = ["min_depth", "max_depth", "start_time", "end_time", "depth_step"]
+
+COPY_BUFFER_SIZE = 1 << 16
+
+# Seconds between two reads of an output being written
+POLL_INTERVAL = 0.02
+
+
+def _noop():
+    return os.getpid()
+
+
+def _convert_task(bor_path, output_path, compression, level, options):
+    with open_output(output_path, compression=compression, level=level) as f:
+        write_diggs(bor_path, f, **options)
+
+
+def parse_options(query):
+    """Return the ``process_record`` options set in a parsed query string."""
+    values = {key: items[-1] for key, items in query.items()}
+    floats = {key: float(values[key]) for key in FLOAT_PARAMETERS if key in values}
+    options = {}
+    if "min_depth" in floats or "max_depth" in floats:
+        options["depth_range"] = (floats.get("min_depth"), floats.get("max_depth"))
+    if "start_time" in floats or "end_time" in floats:
+        options["time_range"] = (floats.get("start_time"), floats.get("end_time"))
+    if "every" in values:
+        options["every"] = int(values["every"])
+    if "depth_step" in floats:
+        options["depth_step"] = floats["depth_step"]
+    if values.get("per_rod", "").lower() in ("1", "true", "yes"):
+        options["per_rod"] = True
+    if values.get("derived", "").lower() in ("1", "true", "yes"):
+        options["derived"] = True
+    if values.get("units", "native") != "native":
+        options["units"] = values["units"]
+    return options
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ConversionService:
+    """Pool of warm worker processes converting BOR files.
+
+    At most ``jobs`` conversions run at once and ``max_queue`` more can wait
+    for a worker, further requests are rejected with ``ServiceBusy``.
+    """
+
+    def __init__(self, jobs=None, max_queue=16, compression_level=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.compression_level = compression_level
+        # Workers import what a conversion needs when they unpickle the task
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        self._slots = threading.BoundedSemaphore(self.jobs + max_queue)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {
+            "requests": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+        }
+
+    def warm_up(self):
+        """Start all the workers now instead of on the first requests."""
+        futures = [self.executor.submit(_noop) for _ in range(self.jobs)]
+        for future in futures:
+            future.result()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+
+    @contextmanager
+    def slot(self):
+        """Hold a place for a conversion, raise ``ServiceBusy`` if there is none."""
+        self._count(requests=1)
+        if not self._slots.acquire(blocking=False):
+            self._count(rejected=1)
+            raise ServiceBusy()
+        self._count(in_flight=1)
+        try:
+            yield
+        finally:
+            self._count(in_flight=-1)
+            self._slots.release()
+
+    def submit(self, bor_path, output_path, compression=None, options=None):
+        """Start a conversion in a worker, within a ``slot``, return its future.
+
+        The output is written to ``output_path`` as the conversion goes. The
+        conversion is counted in the stats when its future is passed to
+        ``record``.
+        """
+        return self.executor.submit(
+            _convert_task,
+            bor_path,
+            output_path,
+            compression,
+            self.compression_level,
+            options or {},
+        )
+
+    def record(self, future, latency):
+        """Count a finished conversion in the stats."""
+        if future.cancelled() or future.exception() is not None:
+            self._count(failed=1)
+            return
+        self._count(completed=1)
+        with self._lock:
+            self._latencies.append(latency)
+
+    def convert(self, bor_path, output_path, compression=None, options=None):
+        """Convert a file, waiting for the end of the conversion."""
+        with self.slot():
+            start = time.perf_counter()
+            future = self.submit(bor_path, output_path, compression, options)
+            wait([future])
+            self.record(future, time.perf_counter() - start)
+        future.result()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            latencies = sorted(self._latencies)
+        stats["workers"] = self.jobs
+        stats["queue_depth"] = max(stats["in_flight"] - self.jobs, 0)
+        if latencies:
+            stats["latency"] = {
+                "mean": statistics.fmean(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[int(len(latencies) * 0.95)],
+                "max": latencies[-1],
+            }
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """``POST /convert`` a BOR file, ``GET /stats`` for the counters.
+
+    The DIGGS document is sent as the worker writes it, with chunked transfer
+    encoding, once it is larger than ``COPY_BUFFER_SIZE``. Smaller documents
+    are sent with their length when the conversion ends, so that the errors
+    found early are still answered with an error status.
+
+    The conversion is counted in ``/stats``, and its slot released, before
+    the end of the response is sent: the stats requested once a response is
+    read include it.
+    """
+
+    server_version = "bor2diggs"
+    # for chunked responses
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else "-"
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/stats":
+            self.send_json(200, self.server.service.get_stats())
+        elif path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self.send_json(404, {"error": "Not found"})
+            return
+        query = parse_qs(url.query)
+        compression = query.get("compression", [None])[-1]
+        if compression is not None and compression not in COMPRESSIONS:
+            self.send_json(400, {"error": f"Unknown compression: {compression}"})
+            return
+        try:
+            options = parse_options(query)
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError) as exc:
+            # The body is not read, nor is the next request
+            self.close_connection = True
+            self.send_json(400, {"error": f"Bad request: {exc}"})
+            return
+
+        try:
+            # A busy service answers before receiving the file
+            with self.server.service.slot():
+                error, pending, streaming = self._convert(length, compression, options)
+        except ServiceBusy:
+            self.close_connection = True
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            return
+
+        if error is not None and streaming:
+            # Too late for an error status, the response is left incomplete
+            self.close_connection = True
+        elif error is not None:
+            self.send_json(422, {"error": f"{type(error).__name__}: {error}"})
+        elif streaming:
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[compression])
+            self.send_header("Content-Length", str(len(pending)))
+            self.end_headers()
+            self.wfile.write(pending)
+
+    def _convert(self, length, compression, options):
+        """Convert the uploaded file, sending the output while it is written.
+
+        Return the error of the conversion, the output not sent yet and
+        whether the response is streamed.
+        """
+        service = self.server.service
+        with tempfile.TemporaryDirectory(prefix="bor2diggs-") as tmp_dir:
+            bor_path = os.path.join(tmp_dir, "input.bor")
+            output_path = os.path.join(tmp_dir, "output.diggs.xml")
+            with open(bor_path, "wb") as f:
+                while length > 0:
+                    chunk = self.rfile.read(min(length, COPY_BUFFER_SIZE))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    length -= len(chunk)
+            # Created here to be read while the worker writes it
+            open(output_path, "wb").close()
+            start = time.perf_counter()
+            future = service.submit(bor_path, output_path, compression, options)
+            try:
+                pending, streaming = self._send_output(future, output_path, compression)
+            finally:
+                # The slot is held until the worker is done, even if the
+                # client is gone
+                wait([future])
+                service.record(future, time.perf_counter() - start)
+        return future.exception(), pending, streaming
+
+    def _send_output(self, future, output_path, compression):
+        """Send the output once it is large enough, return the rest of it."""
+        pending = b""
+        streaming = False
+        with open(output_path, "rb") as f:
+            while True:
+                # Checked before reading, so that nothing written is left
+                done = future.done()
+                data = f.read(COPY_BUFFER_SIZE)
+                if not data:
+                    if done:
+                        break
+                    wait([future], timeout=POLL_INTERVAL)
+                elif streaming:
+                    self._write_chunk(data)
+                else:
+                    pending += data
+                    if len(pending) >= COPY_BUFFER_SIZE:
+                        self.send_response(200)
+                        self.send_header("Content-Type", CONTENT_TYPES[compression])
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                        self._write_chunk(pending)
+                        pending = b""
+                        streaming = True
+        return pending, streaming
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+class ConversionHTTPServer(ThreadingHTTPServer):
+    def __init__(self, address, service, handler=ConversionRequestHandler):
+        super().__init__(address, handler)
+        self.service = service
+
+
+class UnixConversionHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, handler=ConversionRequestHandler):
+        super().__init__(path, handler)
+        self.service = service
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        # Attributes used by BaseHTTPRequestHandler
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(service, host="127.0.0.1", port=8000, socket_path=None):
+    """Return an HTTP server on a TCP port, or on a Unix socket if given."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return UnixConversionHTTPServer(socket_path, service)
+    return ConversionHTTPServer((host, port), service)
@@ -0,0 +1,131 @@
+import json
+import os
+
+import numpy as np
+
+from .convert import get_uom
+from .convert import make_id
+from .properties import get_properties
+
+SIDECAR_FORMATS = {"parquet": ".parquet", "npz": ".npz"}
+
+# Key of the metadata in the Parquet schema and name of the array in NPZ files
+METADATA_KEY = "bor2diggs"
+
+
+def get_sidecar_format(path=None):
+    """Return the format matching the suffix of ``path``.
+
+    Without a path, or an unknown suffix, Parquet is used if pyarrow is
+    installed and NPZ otherwise.
+    """
+    if path is not None:
+        _, suffix = os.path.splitext(os.fspath(path))
+        for sidecar_format, format_suffix in SIDECAR_FORMATS.items():
+            if suffix.lower() == format_suffix:
+                return sidecar_format
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "npz"
+    return "parquet"
+
+
+def get_sidecar_metadata(record, id_suffix="", properties=None):
+    """Describe the channels of ``record`` and the DIGGS elements holding them.
+
+    The ``gml:id`` are the ones written by ``write_diggs_record``, ``id_suffix``
+    being the one of a measurement within a collection, and ``properties`` the
+    one given to it.
+    """
+    properties = get_properties(properties)
+    columns = {}
+    index = 0
+    for column in record.columns:
+        if column not in properties:
+            continue
+        index += 1
+        definition = properties[column]
+        unit = record.units[column]
+        columns[column] = {
+            "property_id": f"prop{index}{id_suffix}",
+            "property_class": definition.property_class,
+            "property_code_space": definition.code_space,
+            "property_name": definition.name,
+            "type_data": definition.type_data,
+            "unit": unit,
+            "uom": get_uom(unit) if unit not in (None, "-") else None,
+        }
+    return {
+        "filename": record.filename,
+        "borehole_ref": record.borehole_ref,
+        "diggs_ids": {
+            "measurement": f"mwd_{record.filename}",
+            "result": f"mwdr_{record.filename}",
+            "time_domain": f"tpl_{record.filename}",
+            "parameters": f"params1{id_suffix}",
+            "sampling_feature": f"bh_{make_id(record.borehole_ref)}",
+        },
+        "time": {"unit": "s"},
+        "columns": columns,
+    }
+
+
+def write_sidecar(record, target, sidecar_format=None, id_suffix="", properties=None):
+    """Write the channels written to DIGGS in a columnar file.
+
+    ``target`` is a path or a binary file object. The file holds ``time`` and
+    one column per DIGGS property, and the metadata of
+    ``get_sidecar_metadata``: as JSON in the schema metadata of a Parquet
+    file, or as a ``bor2diggs`` string array in a NPZ file.
+    """
+    if sidecar_format is None:
+        sidecar_format = get_sidecar_format(
+            target if isinstance(target, (str, os.PathLike)) else None
+        )
+    metadata = get_sidecar_metadata(record, id_suffix, properties)
+    arrays = {"time": record.time}
+    for column in metadata["columns"]:
+        arrays[column] = record.channels[column]
+
+    if sidecar_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(arrays).replace_schema_metadata(
+            {METADATA_KEY: json.dumps(metadata)}
+        )
+        pq.write_table(table, target)
+    elif sidecar_format == "npz":
+        arrays[METADATA_KEY] = np.array(json.dumps(metadata))
+        if isinstance(target, (str, os.PathLike)):
+            # savez would add a .npz suffix to a path
+            with open(target, "wb") as f:
+                np.savez(f, **arrays)
+        else:
+            np.savez(target, **arrays)
+    else:
+        raise ValueError(f"Unknown sidecar format: {sidecar_format}")
+
+
+def read_sidecar(source):
+    """Return the ``DataFrame`` of a sidecar file, indexed by time.
+
+    The metadata are in the ``bor2diggs`` entry of the ``attrs`` of the frame.
+    """
+    import pandas as pd
+
+    if get_sidecar_format(source) == "npz":
+        with np.load(source, allow_pickle=False) as npz:
+            metadata = json.loads(str(npz[METADATA_KEY]))
+            data = {name: npz[name] for name in ["time", *metadata["columns"]]}
+        df = pd.DataFrame(data)
+    else:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(source)
+        metadata = json.loads(table.schema.metadata[METADATA_KEY.encode()])
+        df = table.to_pandas()
+    df = df.set_index("time")
+    df.attrs[METADATA_KEY] = metadata
+    return df
@@ -0,0 +1,123 @@
+import functools
+import math
+
+# Factors to the metre of the length units used in BOR files, converting them
+# does not require building a pint registry
+LENGTH_FACTORS = {
+    "m": 1.0,
+    "meter": 1.0,
+    "cm": 0.01,
+    "mm": 0.001,
+    "ft": 0.3048,
+    "in": 0.0254,
+    "inch": 0.0254,
+}
+
+# SI units and factors of the other units used in BOR files, converting them
+# does not require building a pint registry either
+SI_UNITS = {
+    **{unit: ("m", factor) for unit, factor in LENGTH_FACTORS.items()},
+    "m/s": ("m/s", 1.0),
+    "m/min": ("m/s", 1 / 60),
+    "m/h": ("m/s", 1 / 3600),
+    "cm/min": ("m/s", 0.01 / 60),
+    "ft/min": ("m/s", 0.3048 / 60),
+    "ft/h": ("m/s", 0.3048 / 3600),
+    "Pa": ("Pa", 1.0),
+    "kPa": ("Pa", 1e3),
+    "MPa": ("Pa", 1e6),
+    "bar": ("Pa", 1e5),
+    "psi": ("Pa", 6894.757293168361),
+    "N": ("N", 1.0),
+    "daN": ("N", 10.0),
+    "kN": ("N", 1e3),
+    "kgf": ("N", 9.80665),
+    "lbf": ("N", 4.4482216152605),
+    "N.m": ("N.m", 1.0),
+    "daN.m": ("N.m", 10.0),
+    "kN.m": ("N.m", 1e3),
+    "kgf.m": ("N.m", 9.80665),
+    "ft.lbf": ("N.m", 1.3558179483314004),
+    "rpm": ("rad/s", 2 * math.pi / 60),
+    "l/s": ("m3/s", 1e-3),
+    "l/min": ("m3/s", 1e-3 / 60),
+    "m3/h": ("m3/s", 1 / 3600),
+    "gallon/min": ("m3/s", 3.785411784e-3 / 60),
+    "s": ("s", 1.0),
+}
+
+
+# Names of the SI units by the pint spelling of their dimension, so that units
+# converted by pint are named like the ones of SI_UNITS
+CANONICAL_UNITS = {
+    "m": "m",
+    "m/s": "m/s",
+    "s": "s",
+    "Pa": "Pa",
+    "N": "N",
+    "N*m": "N.m",
+    "m**3/s": "m3/s",
+    "m**2": "m2",
+    "m**3": "m3",
+    "kg": "kg",
+    "W": "W",
+}
+
+
+@functools.cache
+def get_unit_registry():
+    """Return the pint registry, built on first use since it is slow to load."""
+    import pint
+
+    return pint.UnitRegistry()
+
+
+@functools.cache
+def get_length_factor(unit):
+    """Return the factor converting ``unit`` to metres."""
+    if unit in LENGTH_FACTORS:
+        return LENGTH_FACTORS[unit]
+    ureg = get_unit_registry()
+    return ureg.Quantity(1.0, unit).to("meter").magnitude
+
+
+def to_meter(value, unit):
+    return float(value) * get_length_factor(unit)
+
+
+@functools.cache
+def get_si_unit(unit):
+    """Return the SI unit of ``unit`` and the factor converting to it.
+
+    Units unknown to pint, dimensionless units and units with an offset
+    (temperatures) are returned unchanged, with a factor of 1. The SI units
+    of ``CANONICAL_UNITS`` are named like in ``SI_UNITS``, whichever way they
+    are found.
+    """
+    if unit in SI_UNITS:
+        return SI_UNITS[unit]
+    if unit in (None, "-"):
+        return unit, 1.0
+    ureg = get_unit_registry()
+    try:
+        quantity = ureg.Quantity(1.0, unit).to_base_units()
+        offset = ureg.Quantity(0.0, unit).to_base_units().magnitude
+    except Exception:
+        # pint fails in many ways on what is not a unit
+        return unit, 1.0
+    if quantity.dimensionless or offset:
+        return unit, 1.0
+    si_unit = _get_canonical_units().get(quantity.dimensionality)
+    if si_unit is None:
+        si_unit = f"{quantity.units:~}".replace(" ", "")
+    return si_unit, quantity.magnitude
+
+
+@functools.cache
+def _get_canonical_units():
+    # Dimensionality -> name of the SI unit
+    ureg = get_unit_registry()
+    return {
+        ureg.get_dimensionality(spelling): name
+        for spelling, name in CANONICAL_UNITS.items()
+    }
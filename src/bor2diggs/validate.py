@@ -0,0 +1,466 @@
+import re
+from collections import namedtuple
+from xml.parsers import expat
+
+from .convert import namespaces
+
+# Prefixes of the element and attribute names in CONTENT_MODELS, elements of
+# the DIGGS namespace have none
+PREFIXES = {uri: prefix for prefix, uri in namespaces.items() if prefix != "diggs"}
+
+# Size of the blocks read by validate_diggs
+BLOCK_SIZE = 1 << 20
+
+# Errors kept before giving up on a document
+MAX_ERRORS = 100
+
+# An approximation of NCName, the type of gml:id
+NCNAME = re.compile(r"[^\W\d][\w.-]*\Z")
+DATE_TIME = re.compile(r"-?\d{4,}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?(Z|[+-]\d\d:\d\d)?\Z")
+
+ElementModel = namedtuple(
+    "ElementModel", ["attributes", "children", "content"], defaults=[(), None, None]
+)
+ElementModel.__doc__ = """Content model of an element.
+
+``attributes`` are the required attributes, ``children`` the allowed child
+elements in order as ``(name, min_occurs, max_occurs)`` tuples, ``max_occurs``
+being ``None`` when unbounded. Elements without children have the simple
+``content`` type ``string``, ``double``, ``doubles``, ``dateTime``, or
+``reference`` for an empty element with an ``xlink:href``. Values of
+``timeIntervalList`` and ``dataValues`` are counted, not checked.
+"""
+
+# Properties of GML objects, before the ones of each DIGGS type
+GML_OBJECT = (
+    ("gml:description", 0, 1),
+    ("gml:identifier", 0, 1),
+    ("gml:name", 0, None),
+)
+
+
+def _object(*children, attributes=("gml:id",)):
+    return ElementModel(attributes, GML_OBJECT + children)
+
+
+def _property(child):
+    # Holds the object or references it
+    return ElementModel((), ((child, 0, 1),), "reference")
+
+
+# The subset of the DIGGS 2.6 schema written by bor2diggs
+CONTENT_MODELS = {
+    "Diggs": ElementModel(
+        ("gml:id",),
+        (
+            ("documentInformation", 1, 1),
+            ("project", 0, None),
+            ("samplingFeature", 0, None),
+            ("measurement", 0, None),
+        ),
+    ),
+    "documentInformation": ElementModel((), (("DocumentInformation", 1, 1),)),
+    "DocumentInformation": _object(("creationDate", 1, 1), ("sourceSoftware", 0, None)),
+    "creationDate": ElementModel(content="dateTime"),
+    "sourceSoftware": ElementModel((), (("SoftwareApplication", 1, 1),)),
+    "SoftwareApplication": _object(("version", 0, 1)),
+    "version": ElementModel(content="string"),
+    "project": _property("Project"),
+    "Project": _object(),
+    "samplingFeature": _property("Borehole"),
+    "Borehole": _object(
+        ("role", 0, None),
+        ("investigationTarget", 0, 1),
+        ("projectRef", 0, None),
+        ("referencePoint", 1, 1),
+        ("centerLine", 0, 1),
+        ("linearReferencing", 0, None),
+        ("totalMeasuredDepth", 0, 1),
+        ("constructionMethod", 0, None),
+    ),
+    "role": ElementModel((), (("Role", 1, 1),)),
+    "Role": ElementModel((), (("rolePerformed", 1, 1), ("businessAssociate", 0, None))),
+    "rolePerformed": ElementModel(("codeSpace",), content="string"),
+    "businessAssociate": _property("BusinessAssociate"),
+    "BusinessAssociate": _object(),
+    "investigationTarget": ElementModel(content="string"),
+    "projectRef": ElementModel(content="reference"),
+    "referencePoint": ElementModel((), (("PointLocation", 1, 1),)),
+    "PointLocation": ElementModel(("gml:id",), (("gml:pos", 1, 1),)),
+    "centerLine": ElementModel((), (("LinearExtent", 1, 1),)),
+    "LinearExtent": ElementModel(("gml:id",), (("gml:posList", 1, 1),)),
+    "linearReferencing": ElementModel((), (("LinearSpatialReferenceSystem", 1, 1),)),
+    "LinearSpatialReferenceSystem": _object(
+        ("glr:linearElement", 1, 1), ("glr:lrm", 1, 1)
+    ),
+    "glr:linearElement": ElementModel(content="reference"),
+    "glr:lrm": ElementModel((), (("glr:LinearReferencingMethod", 1, 1),)),
+    "glr:LinearReferencingMethod": ElementModel(
+        ("gml:id",), (("glr:name", 1, 1), ("glr:type", 1, 1), ("glr:units", 1, 1))
+    ),
+    "glr:name": ElementModel(content="string"),
+    "glr:type": ElementModel(content="string"),
+    "glr:units": ElementModel(content="string"),
+    "totalMeasuredDepth": ElementModel(("uom",), content="double"),
+    "constructionMethod": ElementModel((), (("BoreholeConstructionMethod", 1, 1),)),
+    "BoreholeConstructionMethod": _object(
+        ("location", 0, 1),
+        ("constructionEquipment", 0, None),
+        ("cuttingToolInfo", 0, None),
+    ),
+    "location": ElementModel((), (("LinearExtent", 1, 1),)),
+    "constructionEquipment": _property("DrillRig"),
+    "DrillRig": _object(),
+    "cuttingToolInfo": ElementModel((), (("CuttingTool", 1, 1),)),
+    "CuttingTool": ElementModel((), (("gml:name", 0, 1), ("toolOuterDiameter", 0, 1))),
+    "toolOuterDiameter": ElementModel(("uom",), content="double"),
+    "measurement": _property("MeasurementWhileDrilling"),
+    "MeasurementWhileDrilling": _object(
+        ("investigationTarget", 0, 1),
+        ("projectRef", 0, None),
+        ("samplingFeatureRef", 1, 1),
+        ("outcome", 0, None),
+        ("procedure", 0, 1),
+    ),
+    "samplingFeatureRef": ElementModel(content="reference"),
+    "outcome": ElementModel((), (("MWDResult", 1, 1),)),
+    "MWDResult": ElementModel(("gml:id",), (("timeDomain", 1, 1), ("results", 1, 1))),
+    "timeDomain": ElementModel((), (("TimeIntervalList", 1, 1),)),
+    "TimeIntervalList": ElementModel(("gml:id", "unit"), (("timeIntervalList", 1, 1),)),
+    "timeIntervalList": ElementModel(content="values"),
+    "results": ElementModel((), (("ResultSet", 1, 1),)),
+    "ResultSet": ElementModel((), (("parameters", 1, 1), ("dataValues", 1, 1))),
+    "parameters": ElementModel((), (("PropertyParameters", 1, 1),)),
+    "PropertyParameters": ElementModel(("gml:id",), (("properties", 1, 1),)),
+    "properties": ElementModel((), (("Property", 1, None),)),
+    "Property": ElementModel(
+        ("gml:id", "index"),
+        (
+            ("propertyName", 1, 1),
+            ("typeData", 1, 1),
+            ("propertyClass", 1, 1),
+            ("uom", 0, 1),
+        ),
+    ),
+    "propertyName": ElementModel(content="string"),
+    "typeData": ElementModel(content="string"),
+    "propertyClass": ElementModel(("codeSpace",), content="string"),
+    "uom": ElementModel(content="string"),
+    "dataValues": ElementModel(content="values"),
+    "procedure": _property("MWDProcedure"),
+    "MWDProcedure": _object(),
+    "gml:description": ElementModel(content="string"),
+    "gml:identifier": ElementModel(("codeSpace",), content="string"),
+    "gml:name": ElementModel(content="string"),
+    "gml:pos": ElementModel(content="doubles"),
+    "gml:posList": ElementModel(content="doubles"),
+}
+
+
+class ValidationError(ValueError):
+    """A DIGGS document is invalid, ``errors`` lists the problems found."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ""
+        super().__init__(f"{errors[0]}{more}")
+
+
+class _Frame:
+    # An open element and the position of its children in its content model
+    __slots__ = ("name", "model", "href", "position", "count", "text", "has_child")
+
+    def __init__(self, name, model, href):
+        self.name = name
+        self.model = model
+        self.href = href
+        self.position = 0
+        self.count = 0
+        self.text = [] if model is not None and model.children is None else None
+        self.has_child = False
+
+
+class _ValuesCounter:
+    # Count the tuples and the values separators of a list of values, fed by
+    # pieces without splitting them on their boundaries
+    def __init__(self, cs=None, ts=" "):
+        self.cs = cs
+        self.ts = ts if ts.strip() else None
+        self.tuples = 0
+        self.separators = 0
+        self._in_tuple = False
+
+    def feed(self, text):
+        if self.cs is not None:
+            self.separators += text.count(self.cs)
+        if self.ts is None:
+            count = len(text.split())
+            if count and self._in_tuple and not text[0].isspace():
+                count -= 1
+            self._in_tuple = not text[-1].isspace()
+        else:
+            *tuples, last = text.split(self.ts)
+            count = 0
+            if tuples:
+                count = sum(1 for item in tuples[1:] if item.strip())
+                if self._in_tuple or tuples[0].strip():
+                    count += 1
+                self._in_tuple = False
+            self._in_tuple = self._in_tuple or bool(last.strip())
+        self.tuples += count
+
+    def close(self):
+        # Split tuples are counted when seen, the others once closed
+        if self._in_tuple and self.ts is not None:
+            self.tuples += 1
+            self._in_tuple = False
+        return self.tuples
+
+
+class DiggsValidator:
+    """Check a DIGGS document fed by pieces, as it is written.
+
+    Elements are checked against ``CONTENT_MODELS``, a subset of the DIGGS 2.6
+    schema. The data are checked for consistency: ``gml:id`` are unique and
+    references resolved, each measurement has as many ``dataValues`` tuples
+    as ``timeIntervalList`` values and as many values per tuple as
+    properties. Nothing but the open elements is kept in memory.
+    """
+
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.max_errors = max_errors
+        self.errors = []
+        self._parser = expat.ParserCreate(namespace_separator=" ")
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+        self._stack = []
+        self._ids = set()
+        self._references = {}
+        self._counter = None
+        self._rows = None
+        self._properties = 0
+        self._closed = False
+
+    def feed(self, data):
+        """Parse the next piece of the document, ``str`` or ``bytes``."""
+        self._parse(data, False)
+
+    def close(self):
+        """Finish the document and return the list of errors."""
+        if not self._closed:
+            self._closed = True
+            if self._parse(b"", True):
+                for reference, line in self._references.items():
+                    if reference not in self._ids:
+                        self._error(f"unresolved reference #{reference}", line)
+        return self.errors
+
+    def check(self):
+        """Finish the document, raise ``ValidationError`` if it is invalid."""
+        errors = self.close()
+        if errors:
+            raise ValidationError(errors)
+
+    def wrap_output(self, fp):
+        """Return a text sink writing to ``fp`` and checking what is written."""
+        return _ValidatedOutput(fp, self)
+
+    def _parse(self, data, final):
+        # Stop parsing once enough errors are found or after a syntax error
+        if len(self.errors) >= self.max_errors:
+            return False
+        try:
+            self._parser.Parse(data, final)
+        except expat.ExpatError as exc:
+            self._error(expat.ErrorString(exc.code), exc.lineno)
+            self.max_errors = len(self.errors)
+            return False
+        return True
+
+    def _error(self, message, line=None):
+        if len(self.errors) < self.max_errors:
+            if line is None:
+                line = self._parser.CurrentLineNumber
+            self.errors.append(f"line {line}: {message}")
+
+    def _start(self, name, attrs):
+        name = _get_name(name)
+        attributes = {_get_name(key): value for key, value in attrs.items()}
+        if self._stack:
+            parent = self._stack[-1]
+            parent.has_child = True
+            self._check_child(parent, name)
+        elif name != "Diggs":
+            self._error(f"root element is {name}, expected Diggs")
+        model = CONTENT_MODELS.get(name)
+        href = attributes.get("xlink:href")
+        self._stack.append(_Frame(name, model, href))
+        if model is None:
+            return
+
+        for attribute in model.attributes:
+            if attribute not in attributes:
+                self._error(f"{name} has no {attribute} attribute")
+        element_id = attributes.get("gml:id")
+        if element_id is not None:
+            if not NCNAME.match(element_id):
+                self._error(f"gml:id {element_id!r} is not a valid NCName")
+            elif element_id in self._ids:
+                self._error(f"duplicate gml:id {element_id!r}")
+            self._ids.add(element_id)
+        if href is not None and href.startswith("#"):
+            self._references.setdefault(href[1:], self._parser.CurrentLineNumber)
+
+        if name == "MWDResult":
+            self._rows = None
+        elif name == "ResultSet":
+            self._properties = 0
+        elif name == "Property":
+            self._properties += 1
+            if attributes.get("index") != str(self._properties):
+                self._error(
+                    f"Property index is {attributes.get('index')!r}, "
+                    f"expected {self._properties}"
+                )
+        elif name == "timeIntervalList":
+            self._counter = _ValuesCounter()
+        elif name == "dataValues":
+            self._counter = _ValuesCounter(
+                attributes.get("cs", ","), attributes.get("ts", " ")
+            )
+
+    def _check_child(self, parent, name):
+        model = parent.model
+        if model is None:
+            # Unknown element, reported already
+            return
+        if model.children is None:
+            self._error(f"unexpected element {name} in {parent.name}")
+            return
+        children = model.children
+        while parent.position < len(children):
+            child, min_occurs, max_occurs = children[parent.position]
+            if child == name:
+                parent.count += 1
+                if max_occurs is not None and parent.count > max_occurs:
+                    self._error(f"too many {name} in {parent.name}")
+                return
+            if parent.count < min_occurs:
+                self._error(f"missing {child} before {name} in {parent.name}")
+            parent.position += 1
+            parent.count = 0
+        self._error(f"unexpected element {name} in {parent.name}")
+
+    def _data(self, text):
+        if self._counter is not None:
+            self._counter.feed(text)
+            return
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame.text is not None:
+            frame.text.append(text)
+        elif frame.model is not None and text.strip():
+            self._error(f"unexpected text in {frame.name}")
+
+    def _end(self, name):
+        frame = self._stack.pop()
+        model = frame.model
+        if model is None:
+            # Reported as unexpected in its parent
+            return
+        if model.content == "reference" and not frame.has_child and not frame.href:
+            # Either holds the object or references it
+            self._error(f"{frame.name} has no xlink:href attribute")
+        if model.children is not None:
+            children = model.children
+            if frame.position < len(children):
+                child, min_occurs, _ = children[frame.position]
+                if frame.count < min_occurs:
+                    self._error(f"missing {child} in {frame.name}")
+                for child, min_occurs, _ in children[frame.position + 1 :]:
+                    if min_occurs:
+                        self._error(f"missing {child} in {frame.name}")
+            return
+
+        if self._counter is not None:
+            self._end_values(frame.name)
+            return
+        text = "".join(frame.text).strip()
+        if model.content == "double":
+            if not _is_double(text):
+                self._error(f"{frame.name} {text!r} is not a number")
+        elif model.content == "doubles":
+            if not all(_is_double(value) for value in text.split()):
+                self._error(f"{frame.name} {text!r} is not a list of numbers")
+        elif model.content == "dateTime":
+            if not DATE_TIME.match(text):
+                self._error(f"{frame.name} {text!r} is not a date and time")
+        elif model.content == "reference" and text:
+            self._error(f"unexpected text in {frame.name}")
+
+    def _end_values(self, name):
+        counter = self._counter
+        self._counter = None
+        rows = counter.close()
+        if name == "timeIntervalList":
+            self._rows = rows
+            return
+        if self._rows is not None and rows != self._rows:
+            self._error(f"dataValues has {rows} tuples for {self._rows} time intervals")
+        expected = rows * max(self._properties - 1, 0)
+        if counter.separators != expected:
+            self._error(
+                f"dataValues has {counter.separators + rows} values "
+                f"for {rows} tuples of {self._properties} properties"
+            )
+
+
+class _ValidatedOutput:
+    def __init__(self, fp, validator):
+        self.fp = fp
+        self.validator = validator
+
+    def write(self, text):
+        self.validator.feed(text)
+        return self.fp.write(text)
+
+
+def _get_name(name):
+    # Expat names are the namespace URI and local name separated by a space
+    uri, _, local = name.rpartition(" ")
+    if not uri:
+        return local
+    prefix = PREFIXES.get(uri)
+    if prefix is None:
+        return f"{{{uri}}}{local}"
+    return f"{prefix}:{local}" if prefix else local
+
+
+def _is_double(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_diggs(source, max_errors=MAX_ERRORS):
+    """Check a DIGGS document with ``DiggsValidator``, return the errors found.
+
+    ``source`` is a path or a binary file object, read by blocks.
+    """
+    validator = DiggsValidator(max_errors)
+    if hasattr(source, "read"):
+        fp = source
+    else:
+        fp = open(source, "rb")
+    try:
+        while block := fp.read(BLOCK_SIZE):
+            validator.feed(block)
+    finally:
+        if fp is not source:
+            fp.close()
+    return validator.close()
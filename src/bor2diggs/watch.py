@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from pathlib import Path
+
+from .batch import _convert_task
+from .batch import BatchResult
+from .batch import get_output_path
+from .batch import get_sidecar_path
+from .cache import ConversionCache
+
+# Name of the state file, in the watched directory by default
+STATE_FILENAME = ".bor2diggs-watch.json"
+
+# inotify events of a file being written, moved in or removed
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class _Waker:
+    """Sleep between scans until a timeout, a file change or ``wake``.
+
+    File changes are reported by inotify on Linux, elsewhere or if it is not
+    available the watcher simply scans at every timeout.
+    """
+
+    def __init__(self, use_inotify=True):
+        self._read_fd, self._write_fd = os.pipe()
+        self._inotify_fd = None
+        self._watched = set()
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (OSError, AttributeError):
+                fd = -1
+            if fd >= 0:
+                self._inotify_fd = fd
+
+    @property
+    def uses_inotify(self):
+        return self._inotify_fd is not None
+
+    def watch(self, directory):
+        if self._inotify_fd is None or directory in self._watched:
+            return
+        wd = self._libc.inotify_add_watch(
+            self._inotify_fd, os.fsencode(directory), INOTIFY_MASK
+        )
+        if wd >= 0:
+            self._watched.add(directory)
+
+    def wait(self, timeout):
+        fds = [self._read_fd]
+        if self._inotify_fd is not None:
+            fds.append(self._inotify_fd)
+        ready, _, _ = select.select(fds, [], [], timeout)
+        for fd in ready:
+            # Drain the events, the scan finds out what changed
+            try:
+                while os.read(fd, 65536):
+                    if fd == self._read_fd:
+                        break
+            except BlockingIOError:
+                pass
+
+    def wake(self):
+        if self._write_fd is not None:
+            os.write(self._write_fd, b"\0")
+
+    def close(self):
+        for fd in (self._read_fd, self._write_fd, self._inotify_fd):
+            if fd is not None:
+                os.close(fd)
+        self._read_fd = self._write_fd = self._inotify_fd = None
+
+
+class Watcher:
+    """Convert the BOR files dropped in a directory as they are complete.
+
+    The directory is scanned recursively for BOR files, a file is converted
+    once its size and modification time did not change for ``settle``
+    seconds. Conversions run in ``jobs`` worker processes, outputs are written
+    to a temporary file renamed when complete, in the same subdirectory of
+    ``output_dir`` as the BOR file in ``directory``. Finished conversions are
+    recorded in a ``ConversionCache`` saved to ``state_path`` so that a new
+    watcher does not convert them again.
+    With ``validate``, outputs are checked as they are written and invalid
+    ones are reported as failures. With ``catalog``, a
+    ``bor2diggs.catalog.Catalog``, converted files are added to it.
+    """
+
+    def __init__(
+        self,
+        directory,
+        output_dir=None,
+        jobs=1,
+        state_path=None,
+        settle=2.0,
+        interval=5.0,
+        sa_name="bor2diggs",
+        compression=None,
+        compression_level=None,
+        sidecar_format=None,
+        options=None,
+        validate=False,
+        catalog=None,
+        use_inotify=True,
+    ):
+        self.directory = Path(directory)
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.settle = settle
+        self.interval = interval
+        self.sa_name = sa_name
+        self.compression = compression
+        self.compression_level = compression_level
+        self.sidecar_format = sidecar_format
+        self.options = options or {}
+        self.validate = validate
+        self.catalog = catalog
+        self.cache = ConversionCache(state_path or self.directory / STATE_FILENAME)
+        self._key_options = self.options
+        if sidecar_format is not None:
+            self._key_options = dict(self.options, sidecar=sidecar_format)
+        # BOR path -> [(size, mtime), time the signature was seen, handled]
+        self._files = {}
+        self._waker = _Waker(use_inotify)
+        self._stopped = False
+
+    def stop(self):
+        """Make ``run`` return after the conversions in progress."""
+        self._stopped = True
+        self._waker.wake()
+
+    def scan(self):
+        """Return the BOR files whose writing is complete and not yet handled."""
+        now = time.monotonic()
+        found = set()
+        for root, dirs, filenames in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            self._waker.watch(root)
+            for filename in filenames:
+                # Hidden files are temporary files of uploads
+                if filename.startswith(".") or not filename.lower().endswith(".bor"):
+                    continue
+                path = Path(root) / filename
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                found.add(path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                state = self._files.get(path)
+                if state is None or state[0] != signature:
+                    self._files[path] = [signature, now, False]
+        for path in set(self._files) - found:
+            del self._files[path]
+
+        ready = []
+        for path, state in sorted(self._files.items()):
+            if not state[2] and now - state[1] >= self.settle:
+                state[2] = True
+                ready.append(path)
+        return ready
+
+    def _next_timeout(self):
+        # Scan again when the next file being written may have settled
+        now = time.monotonic()
+        timeout = self.interval
+        for _, seen, handled in self._files.values():
+            if not handled:
+                timeout = min(timeout, max(seen + self.settle - now, 0.05))
+        return timeout
+
+    def _make_task(self, source):
+        root = os.path.abspath(self.directory)
+        output = get_output_path(source, self.output_dir, self.compression, root)
+        sidecar = None
+        if self.sidecar_format is not None:
+            sidecar = get_sidecar_path(
+                source, self.output_dir, self.sidecar_format, root
+            )
+        if self.output_dir is not None:
+            os.makedirs(output.parent, exist_ok=True)
+        try:
+            key = self.cache.get_key(source, self.sa_name, self._key_options)
+        except OSError as exc:
+            return None, BatchResult(source, output, f"{type(exc).__name__}: {exc}")
+        if self.cache.is_current(source, output, key) and (
+            sidecar is None or sidecar.exists()
+        ):
+            return None, BatchResult(source, output, None, cached=True)
+        task = (
+            source,
+            output,
+            self.sa_name,
+            self.compression_level,
+            self.options,
+            False,
+            sidecar,
+            self.validate,
+            self.catalog is not None,
+        )
+        return (task, key), None
+
+    def _finish(self, result, key):
+        if result.entry is not None:
+            self.catalog.upsert(result.entry)
+        if result.error is None:
+            self.cache.update(result.source, result.output, key)
+            self.cache.save()
+        return result
+
+    def run(self):
+        """Watch the directory until ``stop``, yielding a ``BatchResult`` per file.
+
+        Files already converted according to the state file are yielded as
+        cached results.
+        """
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+        executor = ProcessPoolExecutor(self.jobs) if self.jobs > 1 else None
+        queue = []
+        running = {}
+        try:
+            while not self._stopped:
+                for source in self.scan():
+                    task, result = self._make_task(source)
+                    if result is not None:
+                        yield result
+                    else:
+                        queue.append(task)
+
+                if executor is None:
+                    while queue and not self._stopped:
+                        task, key = queue.pop(0)
+                        yield self._finish(_convert_task(*task), key)
+                else:
+                    # At most two tasks per worker are submitted at once
+                    while queue and len(running) < 2 * self.jobs:
+                        task, key = queue.pop(0)
+                        running[executor.submit(_convert_task, *task)] = key
+                    if running:
+                        done, _ = wait(running, self._next_timeout(), FIRST_COMPLETED)
+                        for future in done:
+                            yield self._finish(future.result(), running.pop(future))
+                        continue
+
+                if not self._stopped:
+                    self._waker.wait(self._next_timeout())
+
+            for future in running:
+                yield self._finish(future.result(), running[future])
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self._waker.close()
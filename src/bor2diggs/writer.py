@@ -0,0 +1,132 @@
+import io
+from contextlib import contextmanager
+
+
+def escape(text):
+    # Same entities as minidom uses when pretty-printing
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+class XMLWriter:
+    """Incremental pretty-printing XML writer.
+
+    Elements are written to ``fp`` as soon as they are started, using the same
+    layout as ``minidom.toprettyxml``: one element per line, children indented
+    and text-only elements kept on a single line.
+    """
+
+    def __init__(self, fp, indent="    ", level=0):
+        self.fp = fp
+        self.indent = indent
+        # Indentation level of the top elements, to write a document fragment
+        self.level = level
+        self._stack = []
+
+    @property
+    def _padding(self):
+        return self.indent * (self.level + len(self._stack))
+
+    def _start_tag(self, tag, attrib):
+        if not attrib:
+            return f"<{tag}"
+        attrs = " ".join(f'{key}="{escape(value)}"' for key, value in attrib.items())
+        return f"<{tag} {attrs}"
+
+    def declaration(self, encoding="UTF-8"):
+        self.fp.write(f'<?xml version="1.0" encoding="{encoding}"?>\n')
+
+    def start(self, tag, attrib=None):
+        self.fp.write(f"{self._padding}{self._start_tag(tag, attrib)}>\n")
+        self._stack.append(tag)
+
+    def end(self):
+        tag = self._stack.pop()
+        self.fp.write(f"{self._padding}</{tag}>\n")
+
+    @contextmanager
+    def container(self, tag, attrib=None):
+        self.start(tag, attrib)
+        yield self
+        self.end()
+
+    def element(self, tag, attrib=None, text=None):
+        start_tag = self._start_tag(tag, attrib)
+        if text:
+            self.fp.write(f"{self._padding}{start_tag}>{escape(text)}</{tag}>\n")
+        else:
+            self.fp.write(f"{self._padding}{start_tag}/>\n")
+
+    def element_from_chunks(self, tag, attrib, chunks):
+        """Write a text-only element whose content is produced by ``chunks``.
+
+        Chunks are written as they come and must already be escaped.
+        """
+        start_tag = self._start_tag(tag, attrib)
+        chunks = iter(chunks)
+        for chunk in chunks:
+            if chunk:
+                self.fp.write(f"{self._padding}{start_tag}>{chunk}")
+                break
+        else:
+            self.fp.write(f"{self._padding}{start_tag}/>\n")
+            return
+        for chunk in chunks:
+            self.fp.write(chunk)
+        self.fp.write(f"</{tag}>\n")
+
+
+class _Slots:
+    # Placeholders of the values of a template, NUL is never escaped
+    def __getitem__(self, name):
+        return f"\0{name}\0"
+
+
+class Template:
+    """Fragment of XML compiled once and filled with new values for each use.
+
+    ``build(writer, values)`` writes the fragment with an ``XMLWriter``,
+    ``values`` being a mapping of the strings that change between uses. It is
+    run once with placeholders to split the output into fixed text and slots,
+    for each indentation level the fragment is written at. Elements left open
+    by ``build`` are left open in the writer.
+
+    Values are inserted as text or attribute values. An element whose whole
+    text is a slot is self-closing when the value is empty, such fragments are
+    written by running ``build`` directly.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self._compiled = {}
+
+    def compile(self, depth):
+        fp = io.StringIO()
+        writer = XMLWriter(fp, level=depth)
+        self.build(writer, _Slots())
+        # Fixed text at even indices and slot names at odd indices
+        parts = fp.getvalue().split("\0")
+        text_slots = {
+            parts[i]
+            for i in range(1, len(parts), 2)
+            if parts[i - 1].endswith(">") and parts[i + 1].startswith("</")
+        }
+        return parts, text_slots, writer._stack
+
+    def write(self, writer, **values):
+        depth = writer.level + len(writer._stack)
+        compiled = self._compiled.get(depth)
+        if compiled is None:
+            compiled = self._compiled[depth] = self.compile(depth)
+        parts, text_slots, opened = compiled
+        if not all(values[name] for name in text_slots):
+            self.build(writer, values)
+            return
+        parts = parts.copy()
+        parts[1::2] = [escape(values[name]) for name in parts[1::2]]
+        writer.fp.write("".join(parts))
+        writer._stack.extend(opened)
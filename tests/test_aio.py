@@ -0,0 +1,77 @@
+import asyncio
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from bor2diggs import aconvert_many
+from bor2diggs import aconvert_to_diggs
+from bor2diggs import aiter_diggs
+from bor2diggs import convert_to_diggs
+
+from . import INPUT_BOR_FILES
+
+
+def test_aconvert_to_diggs():
+    bor_filename = INPUT_BOR_FILES[0]
+    document = asyncio.run(aconvert_to_diggs(bor_filename))
+    assert document == convert_to_diggs(bor_filename)
+
+
+def test_aiter_diggs_chunks():
+    bor_filename = INPUT_BOR_FILES[0]
+
+    async def collect():
+        return [chunk async for chunk in aiter_diggs(bor_filename, chunk_size=1000)]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1
+    assert "".join(chunks) == convert_to_diggs(bor_filename)
+
+
+def test_aiter_diggs_close():
+    async def first_chunk():
+        chunks = aiter_diggs(INPUT_BOR_FILES[0], chunk_size=100)
+        chunk = await chunks.__anext__()
+        await chunks.aclose()
+        return chunk
+
+    assert asyncio.run(first_chunk()).startswith("<?xml")
+
+
+@pytest.mark.parametrize("process_pool", [False, True])
+def test_aconvert_many(tmp_path, process_pool):
+    broken_filename = tmp_path / "broken.bor"
+    broken_filename.write_bytes(b"not a bor file")
+    file_paths = [*INPUT_BOR_FILES, broken_filename]
+
+    async def convert(executor):
+        return {
+            file_path: document
+            async for file_path, document in aconvert_many(
+                file_paths, executor=executor, limit=2, return_exceptions=True
+            )
+        }
+
+    if process_pool:
+        with ProcessPoolExecutor(2) as executor:
+            results = asyncio.run(convert(executor))
+    else:
+        results = asyncio.run(convert(None))
+
+    assert list(sorted(results)) == sorted(file_paths)
+    for bor_filename in INPUT_BOR_FILES:
+        assert results[bor_filename] == convert_to_diggs(bor_filename)
+    assert isinstance(results[broken_filename], zipfile.BadZipFile)
+
+
+def test_aconvert_many_raises(tmp_path):
+    broken_filename = tmp_path / "broken.bor"
+    broken_filename.write_bytes(b"not a bor file")
+
+    async def convert():
+        async for _ in aconvert_many([broken_filename, *INPUT_BOR_FILES]):
+            pass
+
+    with pytest.raises(zipfile.BadZipFile):
+        asyncio.run(convert())
@@ -1,6 +1,20 @@
+import contextlib
+import io
+import pickle
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+import borfile
+import numpy as np
+import pytest
 from pytest_cases import pytest_fixture_plus
 
 import bor2diggs
+from bor2diggs.units import get_length_factor
+from bor2diggs.units import get_si_unit
+from bor2diggs.units import to_meter
 
 from . import INPUT_BOR_FILES
 from . import INPUT_FILES_DIR
@@ -21,3 +35,168 @@ def test_diggs_export(bor_filename, tmp_path):
     output_filename = tmp_path / "output.diggs.xml"
     output_filename.write_text(bor2diggs.convert_to_diggs(bor_filename))
     assert_same_files(output_filename, bor_filename.with_suffix(".diggs.xml"))
+
+
+def test_write_diggs(bor_filename, tmp_path):
+    output_filename = tmp_path / "output.diggs.xml"
+    with open(output_filename, "w") as f:
+        bor2diggs.write_diggs(bor_filename, f)
+    assert_same_files(output_filename, bor_filename.with_suffix(".diggs.xml"))
+
+
+def test_import_does_not_load_pint():
+    code = "import sys, bor2diggs; print('pint' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
+
+
+def test_import_is_lazy():
+    modules = ["bor2diggs.aio", "bor2diggs.cli", "bor2diggs.server", "sqlite3"]
+    code = f"import sys, bor2diggs; print([m for m in {modules} if m in sys.modules])"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
+    assert bor2diggs.main.name == "main"
+    assert bor2diggs.aconvert_many.__module__ == "bor2diggs.aio"
+    assert not hasattr(bor2diggs, "missing")
+
+
+def test_length_factors():
+    assert to_meter(np.float32(1.5), "m") == 1.5
+    assert to_meter(10, "ft") == pytest.approx(3.048)
+    # not in the fast path table, goes through pint
+    assert get_length_factor("km") == pytest.approx(1000)
+
+
+def test_si_units():
+    assert get_si_unit("psi") == ("Pa", pytest.approx(6894.757))
+    # not in the fast path table, goes through pint
+    assert get_si_unit("km/h") == ("m/s", pytest.approx(1 / 3.6))
+    # named like the units of the table whichever way they are converted
+    assert get_si_unit("daN.m") == ("N.m", 10.0)
+    assert get_si_unit("daN*m") == ("N.m", pytest.approx(10.0))
+    assert get_si_unit("kip") == ("N", pytest.approx(4448.222))
+    assert get_si_unit("l/h") == ("m3/s", pytest.approx(1e-3 / 3600))
+    assert get_si_unit("megapascal") == ("Pa", pytest.approx(1e6))
+    # no factor to convert them
+    assert get_si_unit("degC") == ("degC", 1.0)
+    assert get_si_unit("not a unit") == ("not a unit", 1.0)
+
+
+def test_diggs_collection(tmp_path):
+    # same rig and project as the first file and same operator as the second:
+    # another run in the first borehole and a new borehole
+    bf = borfile.read(INPUT_BOR_FILES[0])
+    bf.description["operator"] = "LIM"
+    bf.description["device"]["serial"] = "59650"
+    bf.description["filename"] = "second_run"
+    bf.save(tmp_path / "second_run.bor")
+    bf.description["filename"] = "other_hole"
+    bf.description["borehole_ref"] = "OTHER HOLE"
+    bf.save(tmp_path / "other_hole.bor")
+    file_paths = [
+        *INPUT_BOR_FILES,
+        tmp_path / "second_run.bor",
+        tmp_path / "other_hole.bor",
+    ]
+
+    root = ET.fromstring(bor2diggs.convert_collection_to_diggs(file_paths))
+    ns = {"": "http://diggsml.org/schemas/2.6", "gml": "http://www.opengis.net/gml/3.2"}
+    gml_id = "{http://www.opengis.net/gml/3.2}id"
+    ids = [el.get(gml_id) for el in root.iter() if el.get(gml_id)]
+    assert len(ids) == len(set(ids))
+    assert [child.tag.split("}")[1] for child in root] == [
+        "documentInformation",
+        *["project"] * 2,
+        *["samplingFeature"] * 3,
+        *["measurement"] * 4,
+    ]
+    href = "{http://www.w3.org/1999/xlink}href"
+    assert len(root.findall(".//DrillRig", ns)) == 2
+    assert [el.get(href) for el in root.findall(".//constructionEquipment", ns)] == [
+        None,
+        None,
+        "#dr_EMCI_4.50",
+    ]
+    assert len(root.findall(".//BusinessAssociate", ns)) == 1
+    assert [el.get(href) for el in root.findall(".//businessAssociate", ns)] == [
+        None,
+        "#ba_59650",
+    ]
+
+    # file objects are read twice, the first time for their description only
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(open(path, "rb")) for path in file_paths]
+        assert bor2diggs.convert_collection_to_diggs(files) == (
+            bor2diggs.convert_collection_to_diggs(file_paths)
+        )
+
+
+def test_write_diggs_record(bor_filename, tmp_path):
+    record = pickle.loads(pickle.dumps(bor2diggs.read_record(bor_filename)))
+    for output_filename in (tmp_path / "first.xml", tmp_path / "second.xml"):
+        with open(output_filename, "w") as f:
+            bor2diggs.write_diggs_record(record, f)
+        assert_same_files(output_filename, bor_filename.with_suffix(".diggs.xml"))
+
+
+def test_read_record_columns():
+    record = bor2diggs.read_record(INPUT_BOR_FILES[0], columns=["AS", "TP", "XX"])
+    assert record.columns == ["DEPTH", "AS", "TP"]
+    assert list(record.channels) == record.columns
+    assert len(record.depth) == len(record)
+
+
+def assert_same_records(record, expected):
+    assert record.columns == expected.columns
+    assert record.units == expected.units
+    np.testing.assert_array_equal(record.time, expected.time)
+    assert record.time.dtype == expected.time.dtype
+    for column in expected.columns:
+        np.testing.assert_array_equal(
+            record.channels[column], expected.channels[column]
+        )
+        assert record.channels[column].dtype == expected.channels[column].dtype
+    assert record.borehole_ref == expected.borehole_ref
+    assert record.tool_diameter_unit == expected.tool_diameter_unit
+
+
+def test_read_record_mapped(bor_filename):
+    expected = bor2diggs.BoreholeRecord.from_borfile(borfile.read(bor_filename))
+    assert_same_records(bor2diggs.read_record(bor_filename), expected)
+    with open(bor_filename, "rb") as f:
+        assert_same_records(bor2diggs.read_record(f), expected)
+    with open(bor_filename, "rb") as f:
+        assert_same_records(bor2diggs.read_record(io.BytesIO(f.read())), expected)
+
+
+@pytest.mark.parametrize("position", [0.01, 0.5])
+def test_read_record_damaged(position):
+    # Damaged compressed data at the start, or only failing the CRC-32
+    content = bytearray(INPUT_BOR_FILES[0].read_bytes())
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        info = archive.getinfo("data.nc")
+    start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    start += int(info.compress_size * position)
+    content[start : start + 20] = bytes(
+        255 - byte for byte in content[start : start + 20]
+    )
+    with pytest.raises(zipfile.BadZipFile, match="data.nc"):
+        bor2diggs.read_record(io.BytesIO(content))
+
+
+def test_read_record_encoded(tmp_path):
+    # Variables with a fill value are decoded by borfile
+    bf = borfile.read(INPUT_BOR_FILES[0])
+    bf.metadata["AS"]["_FillValue"] = np.float32(-1)
+    bf.data.loc[bf.data.index[:3], "AS"] = -1
+    bor_path = tmp_path / "filled.bor"
+    bf.save(bor_path)
+
+    record = bor2diggs.read_record(bor_path)
+    assert np.isnan(record.channels["AS"][:3]).all()
+    expected = bor2diggs.BoreholeRecord.from_borfile(borfile.read(bor_path))
+    assert_same_records(record, expected)
@@ -0,0 +1,116 @@
+import pytest
+from click.testing import CliRunner
+
+from bor2diggs.batch import convert_many
+from bor2diggs.catalog import Catalog
+from bor2diggs.catalog import get_bounding_boxes
+from bor2diggs.catalog import get_distance
+from bor2diggs.catalog import get_entry
+from bor2diggs.cli import main
+from bor2diggs.record import read_record
+
+from . import INPUT_BOR_FILES
+
+
+def test_get_distance():
+    # One degree of latitude
+    assert get_distance(45, 2, 46, 2) == pytest.approx(111_195, abs=1)
+    assert get_distance(45, 2, 45, 2) == 0
+
+
+def test_catalog_query(tmp_path):
+    record = read_record(INPUT_BOR_FILES[0])
+    positions = {"a": (45.0, 2.0), "b": (45.001, 2.0), "c": (45.1, 2.0)}
+    with Catalog(tmp_path / "catalog.db") as catalog:
+        for name, (latitude, longitude) in positions.items():
+            entry = get_entry(
+                record.copy(latitude=latitude, longitude=longitude, borehole_ref=name),
+                tmp_path / f"{name}.bor",
+            )
+            catalog.upsert(entry)
+        # No position
+        catalog.upsert(get_entry(record.copy(latitude="0", longitude="0"), "d.bor"))
+
+        assert len(catalog.query()) == 4
+        entries = catalog.query(near=(45.0, 2.0), radius=200)
+        assert [entry["borehole_ref"] for entry in entries] == ["a", "b"]
+        assert entries[1]["distance"] == pytest.approx(111, abs=1)
+        entries = catalog.query(near=(45.2, 2.0))
+        assert [entry["borehole_ref"] for entry in entries] == ["c", "b", "a"]
+        assert catalog.query(borehole_ref="c", near=(45.0, 2.0), radius=200) == []
+
+        depth = catalog.query(borehole_ref="a")[0]["last_depth"]
+        assert len(catalog.query(min_depth=depth)) == 4
+        assert catalog.query(min_depth=depth + 1) == []
+
+        # Upserting moves the borehole
+        entry = get_entry(
+            record.copy(latitude=45.1, longitude=2.0, borehole_ref="a"),
+            tmp_path / "a.bor",
+        )
+        catalog.upsert(entry)
+        entries = catalog.query(near=(45.0, 2.0), radius=200)
+        assert [entry["borehole_ref"] for entry in entries] == ["b"]
+        assert catalog.remove(tmp_path / "b.bor")
+        assert not catalog.remove(tmp_path / "b.bor")
+        assert catalog.query(near=(45.0, 2.0), radius=200) == []
+        assert len(catalog.query()) == 3
+
+
+def test_query_antimeridian(tmp_path):
+    record = read_record(INPUT_BOR_FILES[0])
+    positions = {"a": (10.0, 179.9995), "b": (10.0, -179.9995), "c": (10.0, 179.9)}
+    with Catalog(tmp_path / "catalog.db") as catalog:
+        for name, (latitude, longitude) in positions.items():
+            entry = get_entry(
+                record.copy(latitude=latitude, longitude=longitude, borehole_ref=name),
+                tmp_path / f"{name}.bor",
+            )
+            catalog.upsert(entry)
+        for near in [(10.0, 179.9999), (10.0, -179.9999)]:
+            entries = catalog.query(near=near, radius=200)
+            assert sorted(entry["borehole_ref"] for entry in entries) == ["a", "b"]
+
+    (box,) = get_bounding_boxes(10.0, 0.0, 200)
+    assert box[2] < 0 < box[3]
+    west, east = get_bounding_boxes(10.0, 179.9999, 200)
+    assert west[2] < 180 == west[3] and east[2] == -180 < east[3]
+    assert get_bounding_boxes(89.9999, 0.0, 200)[0][2:] == (-180, 180)
+
+
+def test_convert_many_catalog(tmp_path):
+    results = list(convert_many(INPUT_BOR_FILES, tmp_path, jobs=1, catalog=True))
+    for result in results:
+        entry = result.entry
+        assert entry["source"] == str(result.source.resolve())
+        assert entry["output"] == str(result.output.resolve())
+        assert len(entry["sha256"]) == 64
+        assert "DEPTH" in entry["channels"].split()
+
+
+def test_cli_query(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    sources = [str(bor_filename) for bor_filename in INPUT_BOR_FILES]
+    runner = CliRunner()
+    result = runner.invoke(
+        main, ["batch", *sources, "-d", str(tmp_path), "--catalog", catalog_path]
+    )
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(main, ["query", catalog_path, "--format", "paths"])
+    assert result.exit_code == 0, result.output
+    assert len(result.output.splitlines()) == len(INPUT_BOR_FILES)
+
+    with Catalog(catalog_path) as catalog:
+        entry = next(e for e in catalog.query() if e["latitude"] is not None)
+    near = f"{entry['latitude']},{entry['longitude'] + 0.001}"
+    result = runner.invoke(main, ["query", catalog_path, "--radius", "100"])
+    assert result.exit_code == 2
+    result = runner.invoke(
+        main, ["query", catalog_path, "--near", near, "--radius", "100"]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        f"{entry['project_ref']}\t{entry['borehole_ref']}\t{entry['filename']}"
+        f"\t{entry['last_depth']:.2f} m\t87 m away"
+    ]
@@ -0,0 +1,173 @@
+import gzip
+import json
+import lzma
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+from bor2diggs.batch import convert_many
+from bor2diggs.cli import main
+
+from . import INPUT_BOR_FILES
+from .utils import assert_same_files
+
+
+def test_convert_default_command(tmp_path):
+    bor_filename = INPUT_BOR_FILES[0]
+    output_filename = tmp_path / "output.diggs.xml"
+    result = CliRunner().invoke(main, [str(bor_filename), "-o", str(output_filename)])
+    assert result.exit_code == 0, result.output
+    assert_same_files(output_filename, bor_filename.with_suffix(".diggs.xml"))
+
+
+def test_batch(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    for bor_filename in INPUT_BOR_FILES:
+        shutil.copy(bor_filename, input_dir)
+    (input_dir / "broken.bor").write_bytes(b"not a bor file")
+    output_dir = tmp_path / "output"
+
+    result = CliRunner().invoke(
+        main, ["batch", str(input_dir), "-d", str(output_dir), "--jobs", "2"]
+    )
+    assert result.exit_code == 1
+    assert "2 converted, 1 failed" in result.output
+    assert "broken.bor" in result.output
+    for bor_filename in INPUT_BOR_FILES:
+        assert_same_files(
+            output_dir / bor_filename.with_suffix(".diggs.xml").name,
+            bor_filename.with_suffix(".diggs.xml"),
+            copy_if_missing=False,
+        )
+    assert not (output_dir / "broken.diggs.xml").exists()
+
+
+def test_batch_same_names(tmp_path):
+    input_dir = tmp_path / "input"
+    for name in ("a", "b"):
+        (input_dir / name).mkdir(parents=True)
+        shutil.copy(INPUT_BOR_FILES[0], input_dir / name)
+    output_dir = tmp_path / "output"
+
+    result = CliRunner().invoke(
+        main, ["batch", str(input_dir), "-d", str(output_dir), "--jobs", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "2 converted" in result.output
+    output_name = INPUT_BOR_FILES[0].with_suffix(".diggs.xml").name
+    for name in ("a", "b"):
+        assert_same_files(
+            output_dir / name / output_name,
+            INPUT_BOR_FILES[0].with_suffix(".diggs.xml"),
+            copy_if_missing=False,
+        )
+
+    # the same file given twice is converted once
+    source = input_dir / "a" / INPUT_BOR_FILES[0].name
+    sources = [source, input_dir / "b" / ".." / "a" / source.name]
+    results = list(convert_many(sources, output_dir=output_dir, jobs=1))
+    assert results[0].error == f"Same output as {source}, skipped"
+    assert results[1].error is None
+
+
+def test_batch_cache(tmp_path):
+    for bor_filename in INPUT_BOR_FILES:
+        shutil.copy(bor_filename, tmp_path)
+    cache_path = tmp_path / "cache.json"
+    args = ["batch", str(tmp_path), "--jobs", "1", "--cache", str(cache_path)]
+
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+    assert "cache: 0 hits, 2 misses" in result.output
+
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+    assert "cache: 2 hits, 0 misses" in result.output
+
+    # one file is modified and the other one deleted
+    with open(tmp_path / INPUT_BOR_FILES[0].name, "ab") as f:
+        f.write(b"\0")
+    (tmp_path / INPUT_BOR_FILES[1].name).unlink()
+    result = CliRunner().invoke(main, [*args, "--prune"])
+    assert result.exit_code == 0, result.output
+    assert "cache: 0 hits, 1 misses" in result.output
+    assert "1 stale cache entries removed" in result.output
+
+
+def test_batch_keeps_previous_output(tmp_path):
+    bor_path = tmp_path / INPUT_BOR_FILES[0].name
+    shutil.copy(INPUT_BOR_FILES[0], bor_path)
+    args = ["batch", str(bor_path), "--jobs", "1", "--sidecar", "npz", "--index"]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+    outputs = {path: path.read_bytes() for path in tmp_path.glob("*.*.*")}
+    assert len(outputs) == 2
+
+    # a failed conversion does not remove the outputs of the previous one
+    bor_path.write_bytes(b"not a bor file")
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 1
+    assert {path: path.read_bytes() for path in tmp_path.glob("*.*.*")} == outputs
+    assert (tmp_path / bor_path.with_suffix(".npz").name).exists()
+
+
+@pytest.mark.parametrize(
+    "suffix, decompress",
+    [
+        (".gz", gzip.decompress),
+        (".xz", lzma.decompress),
+        (
+            ".zst",
+            lambda data: (
+                pytest.importorskip("zstandard")
+                .ZstdDecompressor()
+                .decompressobj()
+                .decompress(data)
+            ),
+        ),
+    ],
+)
+def test_convert_compressed(tmp_path, suffix, decompress):
+    bor_filename = INPUT_BOR_FILES[0]
+    output_filename = tmp_path / f"output.diggs.xml{suffix}"
+    result = CliRunner().invoke(main, [str(bor_filename), "-o", str(output_filename)])
+    assert result.exit_code == 0, result.output
+    expected = bor_filename.with_suffix(".diggs.xml").read_bytes()
+    assert decompress(output_filename.read_bytes()) == expected
+
+
+def test_batch_compressed(tmp_path):
+    result = CliRunner().invoke(
+        main,
+        ["batch", *map(str, INPUT_BOR_FILES), "-d", str(tmp_path), "--compress", "xz"],
+    )
+    assert result.exit_code == 0, result.output
+    for bor_filename in INPUT_BOR_FILES:
+        expected = bor_filename.with_suffix(".diggs.xml")
+        output_filename = tmp_path / f"{expected.name}.xz"
+        assert lzma.decompress(output_filename.read_bytes()) == expected.read_bytes()
+
+
+def test_batch_profile(tmp_path):
+    for bor_filename in INPUT_BOR_FILES:
+        shutil.copy(bor_filename, tmp_path)
+    profile_path = tmp_path / "profile.json"
+    result = CliRunner().invoke(
+        main, ["batch", str(tmp_path), "--jobs", "2", "--profile", str(profile_path)]
+    )
+    assert result.exit_code == 0, result.output
+    report = json.loads(profile_path.read_text())
+    assert report["files"] == len(INPUT_BOR_FILES)
+    assert report["stages"]["read"]["calls"] == len(INPUT_BOR_FILES)
+
+
+def test_convert_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr("bor2diggs.encode.BLOCK_SIZE", 500)
+    bor_file = INPUT_BOR_FILES[0]
+    output = tmp_path / "output.diggs.xml"
+    runner = CliRunner()
+    result = runner.invoke(main, [str(bor_file), "-o", str(output), "-j", "2"])
+    assert result.exit_code == 0, result.output
+    assert_same_files(output, bor_file.with_suffix(".diggs.xml"), False)
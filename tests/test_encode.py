@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bor2diggs.encode import iter_data_values
+from bor2diggs.encode import iter_time_intervals
+
+
+def test_data_values_match_csv():
+    df = pd.DataFrame(
+        {
+            "DEPTH": np.linspace(0, 12.5, 1001, dtype=np.float32),
+            "EVR": np.arange(1001, dtype=np.int32) % 2,
+            "TP": np.full(1001, 1e-7, dtype=np.float32),
+        }
+    )
+    df.loc[3, "TP"] = np.nan
+    expected = df.to_csv(header=False, index=False).strip().replace("\n", "\n  ")
+    columns = [df[column].to_numpy() for column in df.columns]
+    for chunk_size in (1, 7, 1000, 5000):
+        assert "".join(iter_data_values(columns, "\n  ", chunk_size)) == expected
+
+
+def test_time_intervals_match_wrapped_timestamps():
+    times = np.arange(0, 100.3, 0.4, dtype=np.float32)
+    timestamps = [f"{t:g}" for t in times]
+    expected = "\n  ".join(
+        [" ".join(timestamps[i : i + 12]) for i in range(0, len(timestamps), 12)] + [""]
+    )
+    for chunk_size in (1, 12, 50, 5000):
+        assert "".join(iter_time_intervals(times, "\n  ", chunk_size)) == expected
+
+
+def test_parallel_encoding(monkeypatch):
+    monkeypatch.setattr("bor2diggs.encode.BLOCK_SIZE", 100)
+    monkeypatch.setattr("bor2diggs.encode.PENDING_BLOCKS", 3)
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.uniform(0, 1, 1001)).astype(np.float32)
+    columns = [rng.uniform(0, 500, 1001).astype(np.float32), np.arange(1001) % 2]
+    with ProcessPoolExecutor(2) as executor:
+        assert "".join(
+            iter_time_intervals(times, "\n  ", executor=executor)
+        ) == "".join(iter_time_intervals(times, "\n  "))
+        assert "".join(iter_data_values(columns, "\n  ", executor=executor)) == "".join(
+            iter_data_values(columns, "\n  ")
+        )
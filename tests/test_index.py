@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from bor2diggs import read_diggs
+from bor2diggs import read_record
+from bor2diggs import write_diggs
+from bor2diggs import write_diggs_record
+from bor2diggs.cli import main
+from bor2diggs.index import DepthIndexer
+from bor2diggs.index import get_index_path
+from bor2diggs.index import read_index
+from bor2diggs.index import read_rows
+from bor2diggs.properties import diggs_properties
+
+from . import INPUT_BOR_FILES
+from .utils import assert_same_files
+
+
+def select(data, column, low, high):
+    values = data.index if column == "time" else data[column]
+    return data[(values >= low) & (values <= high)]
+
+
+@pytest.mark.parametrize("bor_filename", INPUT_BOR_FILES)
+def test_read_rows(tmp_path, bor_filename):
+    output = tmp_path / "output.diggs.xml"
+    with open(output, "w", encoding="utf-8") as f:
+        write_diggs(bor_filename, f, index=get_index_path(output))
+    assert_same_files(output, bor_filename.with_suffix(".diggs.xml"))
+    data = read_diggs(output)[0].to_dataframe()
+
+    assert read_rows(output).equals(data)
+    depth = data["DEPTH"]
+    low, high = float(depth.quantile(0.3)), float(depth.quantile(0.6))
+    rows = read_rows(output, min_depth=low, max_depth=high)
+    assert len(rows) and rows.equals(select(data, "DEPTH", low, high))
+    low, high = data.index[5], data.index[len(data) // 2]
+    rows = read_rows(output, min_time=low, max_time=high)
+    assert rows.equals(select(data, "time", low, high))
+    assert read_rows(output, min_depth=depth.max() + 1).empty
+
+
+def test_index_blocks(tmp_path):
+    # A multi-byte character before the data shifts the offsets
+    record = read_record(INPUT_BOR_FILES[0]).copy(operator="Jérôme")
+    output = tmp_path / "output.diggs.xml"
+    indexer = DepthIndexer(every=100)
+    with open(output, "w", encoding="utf-8") as f:
+        write_diggs_record(record, f, indexer=indexer)
+    indexer.write(get_index_path(output))
+
+    blocks = read_index(get_index_path(output))["blocks"]
+    rows = np.array(blocks["row"])
+    assert set(range(0, len(record), 100)) <= set(rows)
+    # new rods start blocks too
+    assert len(rows) > len(range(0, len(record), 100))
+    assert blocks["depth"] == record.depth[rows].astype(float).tolist()
+
+    data = read_diggs(output)[0].to_dataframe()
+    rows = read_rows(output, min_depth=10, max_depth=12.5)
+    assert rows.equals(select(data, "DEPTH", 10, 12.5))
+
+    with open(output, "a") as f:
+        f.write("\n")
+    with pytest.raises(ValueError, match="out of date"):
+        read_rows(output)
+
+
+def test_index_properties(tmp_path):
+    # The types of the channels are kept in the index, not taken from the
+    # global registry
+    registry = diggs_properties.copy()
+    registry.register("NROD", "rod_count", "Rod count", "integer")
+    record = read_record(INPUT_BOR_FILES[0])
+    rods = np.arange(len(record), dtype=np.int32)
+    record = record.copy(
+        columns=[*record.columns, "NROD"],
+        units={**record.units, "NROD": "-"},
+        channels={**record.channels, "NROD": rods},
+    )
+    output = tmp_path / "output.diggs.xml"
+    indexer = DepthIndexer()
+    with open(output, "w", encoding="utf-8") as f:
+        write_diggs_record(record, f, indexer=indexer, properties=registry)
+    indexer.write(get_index_path(output))
+
+    rows = read_rows(output)
+    assert rows["NROD"].dtype == np.int32
+    np.testing.assert_array_equal(rows["NROD"], rods)
+
+
+def test_cli_index(tmp_path):
+    bor_filename = INPUT_BOR_FILES[0]
+    runner = CliRunner()
+    output = tmp_path / "output.diggs.xml"
+    result = runner.invoke(main, [str(bor_filename), "-o", str(output), "--index"])
+    assert result.exit_code == 0, result.output
+    assert len(read_rows(output)) == len(read_record(bor_filename))
+
+    result = runner.invoke(main, [str(bor_filename), "-o", f"{output}.gz", "--index"])
+    assert result.exit_code == 2
+
+    result = runner.invoke(
+        main, ["batch", str(bor_filename), "-d", str(tmp_path / "batch"), "--index"]
+    )
+    assert result.exit_code == 0, result.output
+    batch_output = tmp_path / "batch" / output.name.replace("output", bor_filename.stem)
+    assert read_rows(batch_output).equals(read_rows(output))
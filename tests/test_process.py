@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+
+import bor2diggs
+from bor2diggs.process import process_record
+from bor2diggs.process import rod_summary
+
+from . import INPUT_BOR_FILES
+
+
+@pytest.fixture(scope="module")
+def record():
+    return bor2diggs.read_record(INPUT_BOR_FILES[0])
+
+
+def test_crop(record):
+    cropped = process_record(record, depth_range=(10, 20), time_range=(None, 1500))
+    assert cropped.depth.min() >= 10
+    assert cropped.depth.max() <= 20
+    assert cropped.time.max() <= 1500
+    assert all(len(values) == len(cropped) for values in cropped.channels.values())
+    with pytest.raises(ValueError):
+        process_record(record, depth_range=(1000, None))
+
+
+def test_take_every(record):
+    decimated = process_record(record, every=10)
+    # the last row is added
+    assert len(decimated) == len(range(0, len(record), 10)) + 1
+    assert decimated.depth[-1] == record.depth[-1]
+
+
+def test_bin_depth(record):
+    binned = process_record(record, depth_step=1)
+    assert len(binned) == len(np.unique(np.floor(record.depth)))
+    assert binned.channels["AS"].dtype == record.channels["AS"].dtype
+    assert set(binned.channels["EVR"]) == {0, 1}
+
+
+def test_bin_rods(record):
+    binned = process_record(record, per_rod=True)
+    events = (record.channels["EVR"] > 0).astype(int)
+    assert len(binned) == (np.diff(events) > 0).sum() + 1
+    with pytest.raises(ValueError):
+        process_record(record, every=2, per_rod=True)
+
+
+def test_convert_decimated(record):
+    rows = len(process_record(record, depth_step=0.5))
+    diggs = bor2diggs.convert_to_diggs(INPUT_BOR_FILES[0], depth_step=0.5)
+    data_values = diggs.split('decimal=".">')[1].split("</dataValues>")[0]
+    time_intervals = diggs.split("<timeIntervalList>")[1].split("</")[0]
+    assert len(data_values.split()) == len(time_intervals.split()) == rows
+
+
+def test_to_si():
+    record = bor2diggs.read_record(INPUT_BOR_FILES[1])
+    converted = process_record(record, units="si")
+    assert converted.units == {
+        "DEPTH": "m",
+        "AS": "m/s",
+        "EVP": None,
+        "EVR": None,
+        "TP": "Pa",
+        "IP": "Pa",
+        "TQ": "Pa",
+        "HP": "Pa",
+        "RSP": "rad/s",
+        "IF": "m3/s",
+    }
+    assert converted.channels["DEPTH"].dtype == record.channels["DEPTH"].dtype
+    np.testing.assert_allclose(
+        converted.channels["DEPTH"], record.channels["DEPTH"] * 0.3048, rtol=1e-6
+    )
+    np.testing.assert_array_equal(converted.channels["EVR"], record.channels["EVR"])
+    assert converted.tool_diameter == "0.091948"
+    assert converted.tool_diameter_unit == "m"
+    # a diameter that is not a number is kept as it is
+    converted = process_record(record.copy(tool_diameter="4 1/2"), units="si")
+    assert converted.tool_diameter == "4 1/2"
+    assert converted.tool_diameter_unit == record.tool_diameter_unit
+
+    diggs = bor2diggs.convert_to_diggs(INPUT_BOR_FILES[1], units="si")
+    assert '<totalMeasuredDepth uom="m">' in diggs
+    assert "<uom>psi</uom>" not in diggs
+    assert "<uom>Pa</uom>" in diggs
+    with pytest.raises(ValueError):
+        process_record(record, units="imperial")
+
+
+def test_add_derived(record):
+    rate = np.array([3600, 0, 1800], dtype=np.float32)  # m/h
+    derived = process_record(
+        record.copy(
+            time=np.arange(3.0),
+            columns=["DEPTH", "AS", "RSP", "TPAF", "TQAT", "EVR"],
+            units={
+                "DEPTH": "m",
+                "AS": "m/h",
+                "RSP": "rpm",
+                "TPAF": "kN",
+                "TQAT": "N.m",
+                "EVR": None,
+            },
+            channels={
+                "DEPTH": np.array([0, 1, 2], dtype=np.float32),
+                "AS": rate,
+                "RSP": np.full(3, 60, dtype=np.float32),
+                "TPAF": np.full(3, 10, dtype=np.float32),
+                "TQAT": np.full(3, 1000, dtype=np.float32),
+                "EVR": np.array([1, 0, 1], dtype=np.int8),
+            },
+            tool_diameter="100",
+            tool_diameter_unit="mm",
+        ),
+        derived=True,
+    )
+    assert derived.columns[-3:] == ["PPR", "SE", "ROD"]
+    assert derived.units["SE"] == "Pa"
+    # 1 m/s at 1 revolution per second
+    np.testing.assert_allclose(derived.channels["PPR"], [1, np.nan, 0.5])
+    area = np.pi * 0.1**2 / 4
+    np.testing.assert_allclose(
+        derived.channels["SE"],
+        [
+            1e4 / area + 2 * np.pi * 1000 / area,
+            np.nan,
+            1e4 / area + 4 * np.pi * 1000 / area,
+        ],
+        rtol=1e-6,
+    )
+    np.testing.assert_array_equal(derived.channels["ROD"], [1, 1, 2])
+
+    # Only the channels whose inputs are there
+    derived = process_record(record, derived=True)
+    assert derived.columns == [*record.columns, "ROD"]
+
+    # and can be converted to SI units
+    derived = process_record(
+        record.copy(
+            columns=[*record.columns, "RSP"],
+            units={**record.units, "AS": "%", "RSP": "rpm"},
+            channels={**record.channels, "RSP": record.channels["AS"]},
+        ),
+        derived=True,
+    )
+    assert derived.columns == [*record.columns, "RSP", "ROD"]
+
+
+def test_rod_summary(record):
+    summary = rod_summary(record)
+    binned = process_record(record, per_rod=True)
+    assert len(summary) == len(binned)
+    assert summary["rows"].sum() == len(record)
+    np.testing.assert_allclose(summary["mean_AS"], binned.channels["AS"], rtol=1e-6)
+    assert (summary["length"] >= 0).all()
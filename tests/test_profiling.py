@@ -0,0 +1,59 @@
+import io
+import json
+import time
+
+from bor2diggs import convert_to_diggs
+from bor2diggs import write_diggs
+from bor2diggs.profiling import Profiler
+
+from . import INPUT_BOR_FILES
+
+
+def test_profiler_stages():
+    stages = []
+    profiler = Profiler(callback=lambda name, stats: stages.append(name))
+    start = time.perf_counter()
+    with profiler.stage("outer", rows=10):
+        time.sleep(0.02)
+        with profiler.stage("inner"):
+            data = bytearray(1 << 20)
+            time.sleep(0.02)
+        del data
+    wall = time.perf_counter() - start
+    profiler.close()
+
+    assert stages == ["inner", "outer"]
+    outer = profiler.stages["outer"]
+    inner = profiler.stages["inner"]
+    # nested stages are excluded from the time of their parent
+    assert inner.seconds >= 0.02
+    assert 0.02 <= outer.seconds <= wall - inner.seconds
+    assert outer.rows == 10
+    assert inner.peak_bytes >= 1 << 20
+    assert outer.peak_bytes >= inner.peak_bytes
+
+
+def test_write_diggs_profile():
+    bor_filename = INPUT_BOR_FILES[0]
+    output = io.StringIO()
+    profiler = Profiler()
+    write_diggs(bor_filename, output, profiler=profiler)
+    profiler.close()
+    assert output.getvalue() == convert_to_diggs(bor_filename)
+
+    report = json.loads(json.dumps(profiler.report()))
+    assert report["files"] == 1
+    assert set(report["stages"]) == {
+        "read",
+        "process",
+        "structure",
+        "encode_time",
+        "encode_data",
+        "write",
+    }
+    rows = report["stages"]["read"]["rows"]
+    assert rows > 0
+    assert report["stages"]["encode_data"]["rows"] == rows
+
+    profiler.merge(report)
+    assert profiler.report()["stages"]["read"]["rows"] == 2 * rows
@@ -0,0 +1,152 @@
+import io
+import json
+import os
+
+import numpy as np
+from click.testing import CliRunner
+
+from bor2diggs import read_diggs
+from bor2diggs import read_record
+from bor2diggs import write_diggs_record
+from bor2diggs.cli import main
+from bor2diggs.convert import get_column_plan
+from bor2diggs.process import process_record
+from bor2diggs.properties import BOR2DIGGS_CODESPACE
+from bor2diggs.properties import diggs_properties
+from bor2diggs.properties import get_properties
+from bor2diggs.properties import MWD_CODESPACE
+from bor2diggs.properties import PropertyDefinition
+from bor2diggs.properties import PropertyRegistry
+
+from . import INPUT_BOR_FILES
+from .utils import assert_same_files
+
+VENDOR_PROPERTIES = {
+    "CH4": {"property_class": "methane", "name": "Methane", "type_data": "double"}
+}
+
+
+def get_vendor_registry():
+    registry = diggs_properties.copy()
+    registry.update(VENDOR_PROPERTIES)
+    return registry
+
+
+def add_vendor_channel(record):
+    methane = np.linspace(0, 2, len(record), dtype=np.float32)
+    return record.copy(
+        columns=[*record.columns, "CH4"],
+        units={**record.units, "CH4": "%"},
+        channels={**record.channels, "CH4": methane},
+    )
+
+
+def test_registry(tmp_path):
+    registry = PropertyRegistry({"DEPTH": ("depth", "Depth", "double")})
+    registry.register("D2", "depth", "Depth", "double")
+    config = tmp_path / "properties.json"
+    config.write_text(json.dumps(VENDOR_PROPERTIES))
+    registry.load_config(config)
+
+    assert list(registry) == ["DEPTH", "D2", "CH4"]
+    assert registry["CH4"] == PropertyDefinition("methane", "Methane", "double")
+    assert registry.get_column("depth") == "DEPTH"
+    registry.plans["key"] = "plan"
+    registry.unregister("DEPTH")
+    assert registry.get_column("depth") == "D2"
+    assert registry.get_column("methane") == "CH4"
+    assert not registry.plans
+
+
+def test_entry_points(monkeypatch):
+    class EntryPoint:
+        def load(self):
+            return lambda: VENDOR_PROPERTIES
+
+    monkeypatch.setattr(
+        "bor2diggs.properties._get_entry_points", lambda group: [EntryPoint()]
+    )
+    registry = PropertyRegistry()
+    registry.load_plugins()
+    assert registry.get_column("methane") == "CH4"
+
+
+def test_get_properties(tmp_path):
+    config = tmp_path / "properties.json"
+    config.write_text(json.dumps(VENDOR_PROPERTIES))
+    registry = get_properties(config)
+    assert registry.get_column("methane") == "CH4"
+    assert get_properties(str(config)) is registry
+    assert get_properties(registry) is registry
+    assert "CH4" not in get_properties()
+
+    # the file is loaded again when it changes
+    config.write_text(json.dumps({"CH5": ["ethane", "Ethane", "double"]}))
+    stat = config.stat()
+    os.utime(config, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    reloaded = get_properties(config)
+    assert reloaded is not registry
+    assert "CH5" in reloaded and "CH4" not in reloaded
+
+
+def test_column_plan():
+    registry = get_vendor_registry()
+    record = read_record(INPUT_BOR_FILES[0])
+    plan = get_column_plan(record, registry)
+    assert plan is get_column_plan(record.copy(filename="other.bor"), registry)
+    assert "CH4" not in plan.columns
+
+    vendor_plan = get_column_plan(add_vendor_channel(record), registry)
+    assert vendor_plan.columns == [*plan.columns, "CH4"]
+    assert "CH4" not in get_column_plan(add_vendor_channel(record)).columns
+    registry.register("CH5", "ethane", "Ethane")
+    assert get_column_plan(record, registry) is not plan
+
+
+def test_vendor_channel():
+    registry = get_vendor_registry()
+    record = add_vendor_channel(read_record(INPUT_BOR_FILES[0]))
+    output = io.StringIO()
+    write_diggs_record(record, output, properties=registry)
+    text = output.getvalue()
+    assert "<propertyClass codeSpace" in text and ">methane</propertyClass>" in text
+
+    (result,) = read_diggs(io.StringIO(text), properties=registry)
+    assert result.columns[-1] == "CH4"
+    assert result.units["CH4"] == "%"
+    np.testing.assert_array_equal(result.channels["CH4"], record.channels["CH4"])
+    # without the registry, the channel is named after its property class
+    assert read_diggs(io.StringIO(text))[0].columns[-1] == "methane"
+
+
+def test_code_space():
+    record = process_record(read_record(INPUT_BOR_FILES[1]), derived=True)
+    output = io.StringIO()
+    write_diggs_record(record, output)
+    text = output.getvalue()
+    assert f'codeSpace="{MWD_CODESPACE}">measured_depth<' in text
+    # computed channels are not in the DIGGS code list
+    for property_class in ("penetration_per_revolution", "rod_number"):
+        assert f'codeSpace="{BOR2DIGGS_CODESPACE}">{property_class}<' in text
+
+
+def test_properties_option(tmp_path):
+    config = tmp_path / "properties.json"
+    config.write_text(json.dumps({"EVP": ["event_pause", "Pause event", "boolean"]}))
+    output_dir = tmp_path / "output"
+    args = ["batch", *map(str, INPUT_BOR_FILES), "-d", str(output_dir)]
+    result = CliRunner().invoke(
+        main, [*args, "--jobs", "2", "--properties", str(config)]
+    )
+    assert result.exit_code == 0, result.output
+    for bor_filename in INPUT_BOR_FILES:
+        output = output_dir / bor_filename.with_suffix(".diggs.xml").name
+        assert ">event_pause</propertyClass>" in output.read_text()
+
+    # the channels of the file are not kept for the next conversions
+    output = tmp_path / "output.diggs.xml"
+    result = CliRunner().invoke(main, [str(INPUT_BOR_FILES[0]), "-o", str(output)])
+    assert result.exit_code == 0, result.output
+    assert_same_files(
+        output, INPUT_BOR_FILES[0].with_suffix(".diggs.xml"), copy_if_missing=False
+    )
@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from bor2diggs import convert_collection_to_diggs
+from bor2diggs import read_diggs
+from bor2diggs import read_record
+from bor2diggs import reader
+from bor2diggs import write_diggs_record
+from bor2diggs.cli import main
+from bor2diggs.reader import ValuesDecoder
+
+from . import INPUT_BOR_FILES
+
+
+@pytest.mark.parametrize("bor_filename", INPUT_BOR_FILES, ids=lambda path: path.stem)
+def test_read_diggs_round_trip(bor_filename, monkeypatch):
+    # decode by small chunks to go through the split tuples
+    monkeypatch.setattr(reader, "DECODE_SIZE", 1000)
+    diggs_filename = bor_filename.with_suffix(".diggs.xml")
+    with open(diggs_filename, "rb") as f:
+        (record,) = reader.iter_diggs_records(f, block_size=4096)
+
+    output = io.StringIO()
+    write_diggs_record(record, output)
+    assert output.getvalue() == diggs_filename.read_text(encoding="utf-8")
+
+    original = read_record(bor_filename)
+    for column in record.columns:
+        assert record.units[column] == original.units[column]
+        assert record.channels[column].dtype == original.channels[column].dtype
+        np.testing.assert_array_equal(
+            record.channels[column], original.channels[column]
+        )
+    # timestamps are written with 6 significant digits
+    np.testing.assert_allclose(record.time, original.time, rtol=1e-5)
+
+    bor = io.BytesIO()
+    record.to_borfile().save(bor)
+    bor.seek(0)
+    output = io.StringIO()
+    write_diggs_record(read_record(bor), output)
+    assert output.getvalue() == diggs_filename.read_text(encoding="utf-8")
+
+
+def test_read_diggs_collection():
+    document = convert_collection_to_diggs(INPUT_BOR_FILES)
+    records = read_diggs(io.BytesIO(document.encode()))
+    assert [record.filename for record in records] == [
+        path.stem for path in INPUT_BOR_FILES
+    ]
+    for record, bor_filename in zip(records, INPUT_BOR_FILES):
+        original = read_record(bor_filename)
+        assert record.borehole_ref == original.borehole_ref
+        assert record.operator == original.operator
+        assert len(record) == len(original)
+
+
+@pytest.mark.parametrize(
+    "tags", [["timeIntervalList"], ["dataValues"], ["timeIntervalList", "dataValues"]]
+)
+def test_read_diggs_missing_values(tags):
+    text = INPUT_BOR_FILES[0].with_suffix(".diggs.xml").read_text(encoding="utf-8")
+    for tag in tags:
+        start = text.index(f"<{tag}")
+        end = text.index(f"</{tag}>") + len(f"</{tag}>")
+        text = text[:start] + text[end:]
+    with pytest.raises(ValueError, match=f"mwd_{INPUT_BOR_FILES[0].stem} .* {tags[0]}"):
+        read_diggs(io.StringIO(text))
+
+
+def test_values_decoder():
+    decoder = ValuesDecoder(2, cs=";", ts="|", decimal=",")
+    decoder.feed("1,5;2|3;")
+    decoder.feed("|true;4 | 5;2,25")
+    values = decoder.close()
+    np.testing.assert_array_equal(values, [[1.5, 2], [3, np.nan], [1, 4], [5, 2.25]])
+
+
+def test_extract(tmp_path):
+    diggs_filename = INPUT_BOR_FILES[0].with_suffix(".diggs.xml")
+    result = CliRunner().invoke(
+        main, ["extract", str(diggs_filename), "-d", str(tmp_path)]
+    )
+    assert result.exit_code == 0, result.output
+    record = read_record(tmp_path / INPUT_BOR_FILES[0].name)
+    assert len(record) == len(read_record(INPUT_BOR_FILES[0]))
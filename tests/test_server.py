@@ -0,0 +1,93 @@
+import gzip
+import json
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+from bor2diggs.server import ConversionService
+from bor2diggs.server import make_server
+
+from . import INPUT_BOR_FILES
+
+
+@pytest.fixture(scope="module")
+def server():
+    service = ConversionService(jobs=1, max_queue=2)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_convert(server, compression):
+    bor_filename = INPUT_BOR_FILES[0]
+    path = "/convert" if compression is None else f"/convert?compression={compression}"
+    status, content_type, body = request(
+        server, "POST", path, bor_filename.read_bytes()
+    )
+    assert status == 200
+    if compression == "gzip":
+        assert content_type == "application/gzip"
+        body = gzip.decompress(body)
+    assert body == bor_filename.with_suffix(".diggs.xml").read_bytes()
+
+
+def test_convert_errors(server):
+    status, _, body = request(server, "POST", "/convert", b"not a bor file")
+    assert status == 422
+    assert "error" in json.loads(body)
+
+    status, _, _ = request(server, "POST", "/convert?compression=zip", b"")
+    assert status == 400
+
+
+def test_convert_streamed(server):
+    bor_filename = INPUT_BOR_FILES[0]
+    connection = HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+    try:
+        connection.request("POST", "/convert", body=bor_filename.read_bytes())
+        response = connection.getresponse()
+        assert response.getheader("Transfer-Encoding") == "chunked"
+        assert response.read() == bor_filename.with_suffix(".diggs.xml").read_bytes()
+        # the slot is released before the last chunk
+        assert server.service.get_stats()["in_flight"] == 0
+    finally:
+        connection.close()
+
+
+def test_busy(server):
+    service = server.service
+    with service.slot(), service.slot(), service.slot():
+        # answered without sending the body announced
+        status, _, _ = request(
+            server, "POST", "/convert", headers={"Content-Length": "1000000"}
+        )
+    assert status == 503
+    assert service.get_stats()["rejected"] >= 1
+
+
+def test_stats(server):
+    request(server, "POST", "/convert?every=10", INPUT_BOR_FILES[1].read_bytes())
+    # the conversion is counted before the end of its response is sent
+    status, _, body = request(server, "GET", "/stats")
+    assert status == 200
+    stats = json.loads(body)
+    assert stats["completed"] >= 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["latency"]["max"] > 0
@@ -0,0 +1,72 @@
+import io
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from bor2diggs import convert_collection_to_diggs
+from bor2diggs import read_record
+from bor2diggs import write_diggs
+from bor2diggs.cli import main
+from bor2diggs.sidecar import read_sidecar
+
+from . import INPUT_BOR_FILES
+
+GML_ID = "{http://www.opengis.net/gml/3.2}id"
+DIGGS_NS = "{http://diggsml.org/schemas/2.6}"
+
+
+def get_property_ids(document):
+    return [
+        element.get(GML_ID)
+        for element in ET.fromstring(document).iter(f"{DIGGS_NS}Property")
+    ]
+
+
+@pytest.mark.parametrize("sidecar_format", ["npz", "parquet"])
+def test_write_diggs_sidecar(tmp_path, sidecar_format):
+    if sidecar_format == "parquet":
+        pytest.importorskip("pyarrow")
+    bor_filename = INPUT_BOR_FILES[1]
+    sidecar = tmp_path / f"sidecar.{sidecar_format}"
+    output = io.StringIO()
+    write_diggs(bor_filename, output, sidecar=sidecar)
+
+    df = read_sidecar(sidecar)
+    metadata = df.attrs["bor2diggs"]
+    record = read_record(bor_filename)
+    np.testing.assert_array_equal(df.index, record.time)
+    for column in df.columns:
+        np.testing.assert_array_equal(df[column], record.channels[column])
+        assert metadata["columns"][column]["unit"] == record.units[column]
+    assert "EVP" not in df.columns
+    assert metadata["columns"]["IF"]["uom"] == "gal[US]/min"
+
+    property_ids = get_property_ids(output.getvalue().encode())
+    assert [info["property_id"] for info in metadata["columns"].values()] == (
+        property_ids
+    )
+    assert f'gml:id="{metadata["diggs_ids"]["result"]}"' in output.getvalue()
+
+
+def test_collection_sidecar(tmp_path):
+    document = convert_collection_to_diggs(
+        INPUT_BOR_FILES, sidecar_dir=tmp_path, sidecar_format="npz"
+    )
+    property_ids = []
+    for bor_filename in INPUT_BOR_FILES:
+        df = read_sidecar(tmp_path / f"{bor_filename.stem}.npz")
+        for info in df.attrs["bor2diggs"]["columns"].values():
+            property_ids.append(info["property_id"])
+    assert property_ids == get_property_ids(document.encode())
+
+
+def test_batch_sidecar(tmp_path):
+    output_dir = tmp_path / "output"
+    args = ["batch", *map(str, INPUT_BOR_FILES), "-d", str(output_dir)]
+    result = CliRunner().invoke(main, [*args, "--sidecar", "npz", "--jobs", "1"])
+    assert result.exit_code == 0, result.output
+    for bor_filename in INPUT_BOR_FILES:
+        df = read_sidecar(output_dir / f"{bor_filename.stem}.npz")
+        assert len(df) == len(read_record(bor_filename))
@@ -0,0 +1,117 @@
+import io
+
+import pytest
+from click.testing import CliRunner
+
+import bor2diggs
+from bor2diggs.cli import main
+from bor2diggs.validate import _ValuesCounter
+from bor2diggs.validate import DiggsValidator
+from bor2diggs.validate import validate_diggs
+from bor2diggs.validate import ValidationError
+
+from . import INPUT_BOR_FILES
+
+
+@pytest.fixture(scope="module")
+def document():
+    return INPUT_BOR_FILES[0].with_suffix(".diggs.xml").read_text()
+
+
+def validate_text(text, piece_size=1000):
+    validator = DiggsValidator()
+    for start in range(0, len(text), piece_size):
+        validator.feed(text[start : start + piece_size])
+    return validator.close()
+
+
+@pytest.mark.parametrize("bor_file", INPUT_BOR_FILES, ids=lambda p: p.name)
+def test_valid_documents(bor_file):
+    assert validate_diggs(bor_file.with_suffix(".diggs.xml")) == []
+
+
+def test_valid_collection():
+    output = io.StringIO()
+    validator = DiggsValidator()
+    bor2diggs.write_diggs_collection(INPUT_BOR_FILES, validator.wrap_output(output))
+    assert validator.close() == []
+    assert validate_text(output.getvalue()) == []
+
+
+@pytest.mark.parametrize(
+    "old, new, error",
+    [
+        ("0.03,19.547325,0,41.6,0.31,0.0,0.0\n", "", "3952 tuples for 3953"),
+        ("0.03,19.547325,0,41.6,0.31,", "0.03,19.547325,0,41.6,", "27670 values"),
+        ('gml:id="prop2"', 'gml:id="prop1"', "duplicate gml:id 'prop1'"),
+        ('gml:id="prop2"', 'gml:id="2prop"', "not a valid NCName"),
+        ('xlink:href="#bh_SP1_BIS"', 'xlink:href="#bh_SP2"', "unresolved reference"),
+        ('index="3"', 'index="4"', "Property index is '4', expected 3"),
+        ("<gml:pos>0 0 0</gml:pos>", "<gml:pos>0 0 x</gml:pos>", "not a list"),
+        ("<creationDate>2017", "<creationDate>17", "not a date"),
+        ("<investigationTarget>", "<comment/><investigationTarget>", "comment"),
+        ("</dataValues>", "</dataValues><dataValues/>", "too many dataValues"),
+        ("<typeData>double</typeData>", "", "missing typeData before"),
+        ("</Diggs>", "", "no element found"),
+    ],
+)
+def test_invalid_documents(document, old, new, error):
+    assert old in document
+    errors = validate_text(document.replace(old, new, 1))
+    assert errors
+    assert error in errors[0]
+
+
+def test_values_counter():
+    text = "1,2 3,4\n 5,6  7,8 "
+    for piece_size in range(1, len(text)):
+        counter = _ValuesCounter(",", " ")
+        for start in range(0, len(text), piece_size):
+            counter.feed(text[start : start + piece_size])
+        assert (counter.close(), counter.separators) == (4, 4)
+
+        counter = _ValuesCounter(",", ";")
+        text_ts = text.replace(" ", ";").replace("\n", "")
+        for start in range(0, len(text_ts), piece_size):
+            counter.feed(text_ts[start : start + piece_size])
+        assert counter.close() == 4
+
+
+def test_check():
+    validator = DiggsValidator()
+    validator.feed("<Diggs/>")
+    with pytest.raises(ValidationError, match="and 1 more"):
+        validator.check()
+
+
+def test_cli_validate(tmp_path, document):
+    runner = CliRunner()
+    output = tmp_path / "output.diggs.xml"
+    result = runner.invoke(
+        main, ["convert", str(INPUT_BOR_FILES[0]), "-o", str(output), "--validate"]
+    )
+    assert result.exit_code == 0, result.output
+
+    invalid = tmp_path / "invalid.diggs.xml"
+    invalid.write_text(document.replace('gml:id="prop2"', 'gml:id="prop1"'))
+    result = runner.invoke(main, ["validate", str(output), str(invalid)])
+    assert result.exit_code == 1
+    assert f"OK {output}" in result.output
+    assert f"INVALID {invalid}: line" in result.output
+
+
+def test_batch_validate(tmp_path, monkeypatch):
+    args = ["batch", str(INPUT_BOR_FILES[0]), "-d", str(tmp_path), "-j", "1"]
+    runner = CliRunner()
+    result = runner.invoke(main, [*args, "--validate"])
+    assert result.exit_code == 0, result.output
+    output = tmp_path / INPUT_BOR_FILES[0].with_suffix(".diggs.xml").name
+    assert list(tmp_path.iterdir()) == [output]
+
+    # Invalid outputs are not kept
+    output.unlink()
+    monkeypatch.setattr("bor2diggs.convert.make_id", lambda text: "0")
+    result = runner.invoke(main, [*args, "--validate"])
+    assert result.exit_code == 1
+    assert "is not a valid NCName" in result.output
+    assert list(tmp_path.iterdir()) == []
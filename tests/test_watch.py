@@ -0,0 +1,83 @@
+import shutil
+import threading
+import time
+
+import pytest
+
+from bor2diggs.output import atomic_path
+from bor2diggs.watch import Watcher
+
+from . import INPUT_BOR_FILES
+from .utils import assert_same_files
+
+
+def run_watcher(watcher, expected):
+    results = []
+
+    def target():
+        for result in watcher.run():
+            results.append(result)
+            if len(results) == expected:
+                watcher.stop()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, results
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch(tmp_path, use_inotify):
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    input_dir.mkdir()
+    bor_file = INPUT_BOR_FILES[0]
+
+    watcher = Watcher(
+        input_dir, output_dir, settle=0.1, interval=0.2, use_inotify=use_inotify
+    )
+    thread, results = run_watcher(watcher, 1)
+    time.sleep(0.1)
+    shutil.copy(bor_file, input_dir)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert [(r.source.name, r.error, r.cached) for r in results] == [
+        (bor_file.name, None, False)
+    ]
+    output = output_dir / bor_file.with_suffix(".diggs.xml").name
+    assert_same_files(output, bor_file.with_suffix(".diggs.xml"), False)
+    assert sorted(p.name for p in output_dir.iterdir()) == [output.name]
+
+    # A new watcher finds the file converted in the state file
+    watcher = Watcher(input_dir, output_dir, settle=0, interval=0.2)
+    thread, results = run_watcher(watcher, 1)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert [(r.error, r.cached) for r in results] == [(None, True)]
+
+
+def test_watch_waits_for_complete_files(tmp_path):
+    watcher = Watcher(tmp_path, settle=60, use_inotify=False)
+    shutil.copy(INPUT_BOR_FILES[0], tmp_path / ".upload.bor")
+    shutil.copy(INPUT_BOR_FILES[0], tmp_path)
+    assert watcher.scan() == []
+
+    watcher.settle = 0
+    assert watcher.scan() == [tmp_path / INPUT_BOR_FILES[0].name]
+    assert watcher.scan() == []
+
+
+def test_atomic_path(tmp_path):
+    path = tmp_path / "out.xml"
+    with atomic_path(path) as tmp:
+        with open(tmp, "w") as f:
+            f.write("done")
+        assert not path.exists()
+    assert path.read_text() == "done"
+
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp:
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError
+    assert path.read_text() == "done"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.xml"]
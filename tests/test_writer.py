@@ -0,0 +1,34 @@
+import io
+
+import pytest
+
+from bor2diggs.writer import Template
+from bor2diggs.writer import XMLWriter
+
+
+@Template
+def template(writer, values):
+    writer.start("a", {"id": f"a{values['suffix']}"})
+    writer.element("b", {"href": values["href"]}, values["text"])
+
+
+@pytest.mark.parametrize("level", [0, 2])
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"suffix": "_1", "href": "#x&y", "text": "<text>"},
+        {"suffix": "", "href": "#x", "text": "text"},
+        {"suffix": "_1", "href": "#x", "text": ""},
+    ],
+)
+def test_template(level, values):
+    expected = io.StringIO()
+    writer = XMLWriter(expected, level=level)
+    template.build(writer, values)
+    writer.end()
+
+    output = io.StringIO()
+    writer = XMLWriter(output, level=level)
+    template.write(writer, **values)
+    writer.end()
+    assert output.getvalue() == expected.getvalue()